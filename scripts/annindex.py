@@ -0,0 +1,410 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from chunkio import NpyWriter, read_chunks
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # AnnIndex() raises ImportError; main() turns it into an exit message
+
+# ─────────────────────────── Local ANN index over chunk embeddings ───────────────────────────
+# For batch Q&A / report jobs that would otherwise make one pgvector round-trip
+# per question. An index is a folder:
+#
+#   vectors.npy   float32 (rows, dims), unit-normalised, appended in place and memory-mapped
+#   meta.jsonl    one line per row: file, index, heading_path, page, token_count, company, text
+#   ivf.npz       IVF coarse quantiser: centroids, row → list assignment, deleted rows
+#   index.json    dims, rows, nlist, rows seen at the last training
+#
+# Search is IVF-Flat with cosine similarity: each query scans the rows of its
+# nprobe nearest lists exactly. Below TRAIN_MIN_ROWS (or with exact=True) every
+# row is scanned. Adds are assigned to the existing lists; train() re-clusters,
+# which build() does automatically once the index has doubled since the last
+# training. Chunk records for an already indexed (file, index) replace it, and
+# chunker.py --incremental delta records delete removed chunks and re-key moved ones.
+#
+#   python chunker.py --output-format ndjson | python annindex.py build --index ./idx --company "BC Hydro"
+#   python annindex.py query --index ./idx --text "transmission capacity 2030" --company "BC Hydro"
+
+TRAIN_MIN_ROWS = 2048
+KMEANS_ITERS = 10
+BLOCK_ROWS = 65_536  # rows scored per matrix product when scanning
+
+META_FIELDS = ("file", "index", "heading_path", "page", "token_count", "company", "text")
+
+
+def require_numpy() -> None:
+    if np is None:
+        raise ImportError("annindex.py needs numpy (pip install numpy).")
+
+
+def _normalise(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def default_nlist(rows: int) -> int:
+    return max(1, min(rows // 39, int(4 * rows ** 0.5)))
+
+
+def spherical_kmeans(x: np.ndarray, k: int, iters: int = KMEANS_ITERS, seed: int = 0) -> np.ndarray:
+    """Centroids (k, dims) of unit vectors x, by cosine k-means."""
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = nearest_centroid(x, centroids)
+        counts = np.bincount(assign, minlength=k)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.zeros_like(centroids)
+        sums[counts > 0] = np.add.reduceat(x[np.argsort(assign, kind="stable")], starts[counts > 0], axis=0)
+        empty = counts == 0
+        if empty.any():  # restart empty clusters on random points
+            sums[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+        centroids = _normalise(sums)
+    return centroids
+
+
+def nearest_centroid(x: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    out = np.empty(len(x), dtype=np.int32)
+    for start in range(0, len(x), BLOCK_ROWS):
+        block = np.asarray(x[start:start + BLOCK_ROWS], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Best k (score, row) pairs, best first."""
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        scores, rows = scores[part], rows[part]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], rows[order]
+
+
+def filter_mask(meta: Sequence[Dict[str, Any]], filters: Optional[Dict[str, Any]]) -> np.ndarray:
+    """Rows matching every filter (value or list of accepted values; "file" also matches the name)."""
+    mask = np.ones(len(meta), dtype=bool)
+    for key, want in (filters or {}).items():
+        accept = set(want) if isinstance(want, (list, tuple, set)) else {want}
+        if key == "file":
+            ok = [m["file"] in accept or Path(m["file"]).name in accept for m in meta]
+        else:
+            ok = [m.get(key) in accept for m in meta]
+        mask &= np.fromiter(ok, dtype=bool, count=len(meta))
+    return mask
+
+
+class AnnIndex:
+    def __init__(self, path: Path) -> None:
+        require_numpy()
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        info_path = self.path / "index.json"
+        self.info: Dict[str, Any] = (json.loads(info_path.read_text(encoding="utf-8")) if info_path.exists()
+                                     else {"version": 1, "metric": "cosine", "dims": 0, "nlist": 0, "trained_rows": 0})
+        self.meta: List[Dict[str, Any]] = []
+        meta_path = self.path / "meta.jsonl"
+        if meta_path.exists():
+            with open(meta_path, encoding="utf-8") as fh:
+                self.meta = [json.loads(line) for line in fh if line.strip()]
+        self._writer: Optional[NpyWriter] = None
+        self._vectors: Optional[np.ndarray] = None
+        self.centroids = np.zeros((0, self.info["dims"]), dtype=np.float32)
+        self.assign = np.zeros(0, dtype=np.int32)
+        self.deleted = np.zeros(0, dtype=bool)
+        ivf_path = self.path / "ivf.npz"
+        if ivf_path.exists():
+            with np.load(ivf_path) as z:
+                self.centroids, self.assign, self.deleted = z["centroids"], z["assign"], z["deleted"]
+        rows = min(len(self.meta), len(self.vectors))
+        if len(self.meta) > rows:  # a crash between vector and metadata writes
+            self.meta = self.meta[:rows]
+            self._rewrite_meta()
+        self._sync(rows)
+        self._by_key: Dict[Tuple[Any, Any], int] = {}
+        for i, m in enumerate(self.meta):
+            if self.deleted[i]:
+                continue
+            old = self._by_key.get((m["file"], m["index"]))
+            if old is not None:  # replaced after the last save()
+                self.deleted[old] = True
+            self._by_key[(m["file"], m["index"])] = i
+        self._lists: Optional[List[np.ndarray]] = None
+        self._moved = False  # rows were re-keyed: save() rewrites meta.jsonl
+
+    # ---- storage ----
+
+    @property
+    def vectors(self) -> np.ndarray:
+        if self._vectors is None:
+            p = self.path / "vectors.npy"
+            self._vectors = (np.load(p, mmap_mode="r") if p.exists() and p.stat().st_size > 128
+                             else np.zeros((0, self.info["dims"]), dtype=np.float32))
+        return self._vectors
+
+    def __len__(self) -> int:
+        return len(self.meta) - int(self.deleted.sum())
+
+    def _sync(self, rows: int) -> None:
+        """Extend assign/deleted to rows (new rows go to their nearest list)."""
+        have = len(self.assign)
+        if have > rows:
+            self.assign, self.deleted = self.assign[:rows], self.deleted[:rows]
+        elif have < rows:
+            tail = np.zeros(rows - have, dtype=np.int32)
+            if len(self.centroids):
+                tail = nearest_centroid(self.vectors[have:rows], self.centroids)
+            self.assign = np.concatenate([self.assign, tail])
+            self.deleted = np.concatenate([self.deleted, np.zeros(rows - have, dtype=bool)])
+        self._lists = None
+
+    def add(self, vectors: Sequence[Sequence[float]], metas: Sequence[Dict[str, Any]]) -> List[int]:
+        """Append rows (vectors are normalised); an existing (file, index) is replaced. returns: row numbers"""
+        if not len(vectors):
+            return []
+        x = _normalise(np.asarray(vectors, dtype=np.float32))
+        if not self.info["dims"]:
+            self.info["dims"] = x.shape[1]
+            self.centroids = np.zeros((0, x.shape[1]), dtype=np.float32)
+        if x.shape[1] != self.info["dims"]:
+            raise ValueError(f"vectors have {x.shape[1]} dims, index has {self.info['dims']}")
+        if self._writer is None:
+            self._writer = NpyWriter(self.path / "vectors.npy", append=True)
+            self._writer.truncate(len(self.meta))
+        first = self._writer.append_raw(x.astype("<f4").tobytes(), x.shape[1])
+        self._writer.flush()
+        self._vectors = None
+        with open(self.path / "meta.jsonl", "a", encoding="utf-8") as fh:
+            for m in metas:
+                fh.write(json.dumps({k: m.get(k) for k in META_FIELDS}, ensure_ascii=False) + "\n")
+        rows = list(range(first, first + len(x)))
+        self.meta.extend({k: m.get(k) for k in META_FIELDS} for m in metas)
+        self._sync(len(self.meta))
+        for row, m in zip(rows, metas):
+            old = self._by_key.get((m.get("file"), m.get("index")))
+            if old is not None:
+                self.deleted[old] = True
+            self._by_key[(m.get("file"), m.get("index"))] = row
+        return rows
+
+    def delete(self, file: str, indices: Iterable[int]) -> int:
+        n = 0
+        for i in indices:
+            row = self._by_key.pop((file, i), None)
+            if row is not None:
+                self.deleted[row] = True
+                n += 1
+        return n
+
+    def move(self, file: str, pairs: Iterable[Sequence[int]]) -> int:
+        """Re-key (file, old) as (file, new) for each [old, new] pair (an --incremental delta's "moved")."""
+        rows = [(self._by_key.pop((file, old), None), new) for old, new in pairs]
+        n = 0
+        for row, new in rows:
+            if row is None:
+                continue
+            replaced = self._by_key.get((file, new))
+            if replaced is not None:
+                self.deleted[replaced] = True
+            self.meta[row]["index"] = new
+            self._by_key[(file, new)] = row
+            n += 1
+        self._moved = self._moved or n > 0
+        return n
+
+    def train(self, nlist: Optional[int] = None, sample: int = 256, seed: int = 0) -> None:
+        """(Re)cluster the live rows into nlist lists (default: ~4·sqrt(rows)), on sample rows per list."""
+        live = np.flatnonzero(~self.deleted)
+        if len(live) < TRAIN_MIN_ROWS:
+            self.centroids = np.zeros((0, self.info["dims"]), dtype=np.float32)
+            self.info["nlist"] = 0
+        else:
+            k = min(nlist or default_nlist(len(live)), len(live))
+            rng = np.random.default_rng(seed)
+            pick = np.sort(rng.choice(live, size=min(sample * k, len(live)), replace=False))
+            self.centroids = spherical_kmeans(np.asarray(self.vectors[pick]), k, seed=seed)
+            self.info["nlist"] = k
+        self.assign = (nearest_centroid(self.vectors, self.centroids) if len(self.centroids)
+                       else np.zeros(len(self.meta), dtype=np.int32))
+        self.info["trained_rows"] = len(live)
+        self._lists = None
+
+    def needs_training(self) -> bool:
+        live = len(self)
+        return live >= TRAIN_MIN_ROWS and live >= 2 * max(self.info["trained_rows"], TRAIN_MIN_ROWS // 2)
+
+    def save(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        tmp = self.path / "ivf.tmp.npz"
+        np.savez(tmp, centroids=self.centroids, assign=self.assign, deleted=self.deleted)
+        os.replace(tmp, self.path / "ivf.npz")
+        if self._moved:
+            self._rewrite_meta()
+            self._moved = False
+        self.info["rows"] = len(self.meta)
+        tmp_info = self.path / "index.json.tmp"
+        tmp_info.write_text(json.dumps(self.info, indent=1) + "\n", encoding="utf-8")
+        os.replace(tmp_info, self.path / "index.json")
+
+    def _rewrite_meta(self) -> None:
+        meta_path = self.path / "meta.jsonl"
+        tmp = meta_path.with_suffix(".tmp")
+        tmp.write_text("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in self.meta), encoding="utf-8")
+        os.replace(tmp, meta_path)
+
+    # ---- ingest chunker output ----
+
+    def add_records(self, records: Iterable[Dict[str, Any]], company: str = "", batch: int = 1024) -> Dict[str, int]:
+        """
+        Index chunker.py NDJSON records (see chunkio.read_chunks); delta records
+        delete removed chunks and re-key moved ones.
+        """
+        added = removed = 0
+        vecs: List[List[float]] = []
+        metas: List[Dict[str, Any]] = []
+        for rec in records:
+            if rec.get("type") == "delta":
+                removed += self.delete(rec["file"], rec.get("removed", []))
+                self.move(rec["file"], rec.get("moved", []))
+                continue
+            if rec.get("duplicate_of"):
+                # chunker.py --dedup: searchable through the copy that was embedded
+                removed += self.delete(rec["file"], [rec["index"]])
+                continue
+            if not rec.get("embedding"):
+                continue
+            vecs.append(rec["embedding"])
+            metas.append({**rec, "company": rec.get("company") or company})
+            if len(vecs) >= batch:
+                added += len(self.add(vecs, metas))
+                vecs, metas = [], []
+        added += len(self.add(vecs, metas))
+        return {"added": added, "removed": removed, "rows": len(self)}
+
+    # ---- search ----
+
+    def _row_mask(self, filters: Optional[Dict[str, Any]]) -> np.ndarray:
+        return ~self.deleted & filter_mask(self.meta, filters)
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self.assign, kind="stable")
+            bounds = np.searchsorted(self.assign[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._lists
+
+    def _scan(self, q: np.ndarray, rows: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Exact top-k of every query over the given rows, in blocks."""
+        best = [(np.zeros(0, np.float32), np.zeros(0, np.int64)) for _ in range(len(q))]
+        for start in range(0, len(rows), BLOCK_ROWS):
+            block_rows = rows[start:start + BLOCK_ROWS]
+            scores = np.asarray(self.vectors[block_rows]) @ q.T  # (block, queries)
+            for j in range(len(q)):
+                s = np.concatenate([best[j][0], scores[:, j]])
+                r = np.concatenate([best[j][1], block_rows])
+                best[j] = top_k(s, r, k)
+        return best
+
+    def search(self, queries: Sequence[Sequence[float]], k: int = 10, nprobe: int = 8,
+               filters: Optional[Dict[str, Any]] = None, exact: bool = False) -> List[List[Dict[str, Any]]]:
+        """
+        Batched cosine search. returns: per query, up to k hits best first, each
+        the row's metadata plus "score" and "row".
+        """
+        q = _normalise(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        mask = self._row_mask(filters)
+        if exact or not len(self.centroids):
+            best = self._scan(q, np.flatnonzero(mask), k)
+        else:
+            lists = self._inverted_lists()
+            probe = np.argsort(-(q @ self.centroids.T), axis=1)[:, :max(1, nprobe)]
+            # score each probed list once for all the queries that probe it
+            by_list: Dict[int, List[int]] = {}
+            for j, lids in enumerate(probe):
+                for lid in lids:
+                    by_list.setdefault(int(lid), []).append(j)
+            parts: List[List[Tuple[np.ndarray, np.ndarray]]] = [[] for _ in range(len(q))]
+            for lid, js in by_list.items():
+                rows = lists[lid][mask[lists[lid]]]
+                if not len(rows):
+                    continue
+                scores = np.asarray(self.vectors[rows]) @ q[js].T
+                for col, j in enumerate(js):
+                    parts[j].append(top_k(scores[:, col], rows, k))
+            best = []
+            for p in parts:
+                if p:
+                    best.append(top_k(np.concatenate([s for s, _r in p]), np.concatenate([r for _s, r in p]), k))
+                else:
+                    best.append((np.zeros(0, np.float32), np.zeros(0, np.int64)))
+        return [[{**self.meta[int(r)], "score": float(s), "row": int(r)} for s, r in zip(scores, rows)]
+                for scores, rows in best]
+
+
+# ─────────────────────────── CLI ───────────────────────────
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Local IVF index over chunker.py embeddings.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Add chunker.py --output-format ndjson records to an index.")
+    b.add_argument("--index", required=True, help="Index folder (created if missing).")
+    b.add_argument("--input", default="-", help="NDJSON file ('-' = stdin).")
+    b.add_argument("--vectors-npy", default=None, help="Sidecar .npy if the chunks were written with --vectors-npy.")
+    b.add_argument("--company", default="", help="Company stored on every added chunk (for filtering).")
+    b.add_argument("--nlist", type=int, default=0, help="IVF lists when (re)training (0 = ~4·sqrt(rows)).")
+    b.add_argument("--retrain", action="store_true", help="Re-cluster even if the index has not doubled.")
+    q = sub.add_parser("query", help="Search the index (query text is embedded with chunker.py's deployment).")
+    q.add_argument("--index", required=True)
+    q.add_argument("--text", action="append", required=True, help="Query text; repeat for a batch.")
+    q.add_argument("--top-k", type=int, default=5)
+    q.add_argument("--nprobe", type=int, default=8, help="IVF lists scanned per query (more = better recall).")
+    q.add_argument("--exact", action="store_true", help="Scan every row.")
+    q.add_argument("--company", default=None)
+    q.add_argument("--file", action="append", default=None, help="Only chunks of this file (path or name).")
+    return p.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    try:
+        index = AnnIndex(Path(args.index))
+    except ImportError as e:
+        sys.exit(str(e))
+    if args.cmd == "build":
+        fh = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+        stats = index.add_records(read_chunks(fh, Path(args.vectors_npy) if args.vectors_npy else None),
+                                  args.company)
+        if args.retrain or index.needs_training():
+            index.train(args.nlist or None)
+        index.save()
+        sys.stderr.write(f"[annindex] {json.dumps({**stats, 'nlist': index.info['nlist']})}\n")
+        return
+
+    import asyncio
+    import chunker  # Azure client for the query embeddings
+
+    # ask for the index's vector size (chunker.py --dimensions)
+    vectors = asyncio.run(chunker.embed_all(args.text, dimensions=index.info["dims"] or chunker.EMBED_DIMENSIONS))
+    filters: Dict[str, Any] = {}
+    if args.company is not None:
+        filters["company"] = args.company
+    if args.file:
+        filters["file"] = args.file
+    for text, hits in zip(args.text, index.search(vectors, args.top_k, args.nprobe, filters, args.exact)):
+        for hit in hits:
+            print(json.dumps({"query": text, **hit}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
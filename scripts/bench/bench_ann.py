@@ -0,0 +1,101 @@
+from __future__ import annotations
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+from annindex import AnnIndex, np  # noqa: E402
+
+# ─────────────────────────── ANN recall vs latency ───────────────────────────
+# Builds an annindex.AnnIndex over synthetic clustered unit vectors (topics +
+# noise, roughly how chunk embeddings of a document collection look), then
+# compares IVF search at several nprobe values against exact search:
+# recall@k (share of the exact top-k found) and per-query latency in batches.
+#
+#   python scripts/bench/bench_ann.py --rows 100000 --dims 1536
+
+
+def synthetic(rows: int, dims: int, topics: int, noise: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(topics, dims)).astype(np.float32)
+    x = centres[rng.integers(0, topics, rows)] + noise * rng.normal(size=(rows, dims)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def timed_search(index: AnnIndex, q: np.ndarray, k: int, batch: int, **kw: Any) -> tuple:
+    """(hits, ms per query)"""
+    hits: List[List[Dict[str, Any]]] = []
+    t0 = time.perf_counter()
+    for start in range(0, len(q), batch):
+        hits.extend(index.search(q[start:start + batch], k, **kw))
+    return hits, (time.perf_counter() - t0) * 1000 / len(q)
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Recall/latency of annindex.py IVF search against exact search.")
+    p.add_argument("--rows", type=int, default=50_000)
+    p.add_argument("--dims", type=int, default=768)
+    p.add_argument("--topics", type=int, default=500, help="Clusters in the synthetic data.")
+    p.add_argument("--noise", type=float, default=2.0, help="Noise relative to the cluster centres.")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--batch", type=int, default=32, help="Queries per search() call.")
+    p.add_argument("--top-k", type=int, default=10)
+    p.add_argument("--nlist", type=int, default=0, help="IVF lists (0 = the index default).")
+    p.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--json", action="store_true")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    x = synthetic(args.rows + args.queries, args.dims, args.topics, args.noise, args.seed)
+    data, q = x[:args.rows], x[args.rows:]
+    tmp = Path(tempfile.mkdtemp(prefix="c3-ann-"))
+    try:
+        index = AnnIndex(tmp / "idx")
+        t0 = time.perf_counter()
+        for start in range(0, args.rows, 10_000):
+            block = data[start:start + 10_000]
+            index.add(block, [{"file": f"doc{(start + i) // 50}.md", "index": (start + i) % 50 + 1}
+                              for i in range(len(block))])
+        t_add = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        index.train(args.nlist or None)
+        index.save()
+        t_train = time.perf_counter() - t0
+
+        truth, exact_ms = timed_search(index, q, args.top_k, args.batch, exact=True)
+        want = [{h["row"] for h in hits} for hits in truth]
+        results: Dict[str, Any] = {
+            "rows": args.rows, "dims": args.dims, "nlist": index.info["nlist"], "k": args.top_k,
+            "add_s": round(t_add, 2), "train_s": round(t_train, 2), "exact_ms_per_query": round(exact_ms, 3),
+            "ivf": []}
+        for nprobe in args.nprobe:
+            hits, ms = timed_search(index, q, args.top_k, args.batch, nprobe=nprobe)
+            recall = float(np.mean([len({h["row"] for h in got} & w) / max(1, len(w))
+                                    for got, w in zip(hits, want)]))
+            results["ivf"].append({"nprobe": nprobe, "recall": round(recall, 4), "ms_per_query": round(ms, 3),
+                                   "speedup": round(exact_ms / ms, 1) if ms else 0.0})
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=1))
+        return
+    print(f"{results['rows']} rows × {results['dims']} dims, nlist {results['nlist']}, k={results['k']}: "
+          f"add {results['add_s']}s, train {results['train_s']}s, exact {results['exact_ms_per_query']} ms/query")
+    print(f"{'nprobe':>6} {'recall':>7} {'ms/query':>9} {'speedup':>8}")
+    for r in results["ivf"]:
+        print(f"{r['nprobe']:6d} {r['recall']:7.3f} {r['ms_per_query']:9.3f} {r['speedup']:7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
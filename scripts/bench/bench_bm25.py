@@ -0,0 +1,143 @@
+from __future__ import annotations
+import argparse
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+from annindex import AnnIndex, np  # noqa: E402
+from bench_ann import synthetic  # noqa: E402
+from bm25index import Bm25Index, hybrid_search  # noqa: E402
+from corpus import _paragraph  # noqa: E402
+
+# ─────────────────────────── BM25 build throughput and query latency ───────────────────────────
+# Synthetic chunks (corpus.py prose, ~1 500 chars) each carrying a few unique
+# identifiers (CVE-YYYY-NNNNN, AC-N(N), SKU-XXXXXX). Measures:
+#
+#   build       chunks/s and MB/s through Bm25Index.add + save, postings and bytes on disk
+#   increment   adding --increment more chunks as a new segment, then merging all segments
+#   query       ms per query for identifier and word queries, and how often the
+#               chunk holding an identifier ranks first for it
+#   hybrid      ms per query of hybrid_search with an AnnIndex over synthetic vectors
+#               (BM25 + vector search and fusion; query embedding not included)
+#
+#   python scripts/bench/bench_bm25.py --chunks 100000
+
+
+def make_chunks(n: int, seed: int, offset: int = 0) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """(chunk records, one identifier per chunk that appears only in that chunk)"""
+    rng = random.Random(seed)
+    chunks: List[Dict[str, Any]] = []
+    ids: List[str] = []
+    for i in range(offset, offset + n):
+        own = [f"CVE-{2015 + i % 10}-{i:05d}", f"AC-{i % 25}({i})", f"SKU-{i:06X}"]
+        paras = [_paragraph(rng) for _ in range(3)]
+        text = " ".join(paras[:2]) + f" Affected: {own[0]}, control {own[1]}, product {own[2]}. " + paras[2]
+        chunks.append({"file": f"doc{i // 20}.md", "index": i % 20 + 1, "heading_path": ["Report"],
+                       "company": "bench", "text": text})
+        ids.append(own[rng.randrange(3)])
+    return chunks, ids
+
+
+def latency(fn: Any, queries: List[Any], batch: int) -> Tuple[List[Any], float]:
+    """(results, ms per query)"""
+    out: List[Any] = []
+    t0 = time.perf_counter()
+    for start in range(0, len(queries), batch):
+        out.extend(fn(queries[start:start + batch]))
+    return out, (time.perf_counter() - t0) * 1000 / max(1, len(queries))
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Build throughput and query latency of bm25index.py.")
+    p.add_argument("--chunks", type=int, default=50_000)
+    p.add_argument("--increment", type=int, default=5_000, help="Chunks added by the incremental step.")
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--batch", type=int, default=32, help="Queries per search() call.")
+    p.add_argument("--top-k", type=int, default=10)
+    p.add_argument("--dims", type=int, default=256, help="Synthetic vector size for the hybrid step (0 = skip).")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--json", action="store_true")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    chunks, ids = make_chunks(args.chunks, args.seed)
+    more, _ = make_chunks(args.increment, args.seed + 1, args.chunks)
+    rng = random.Random(args.seed)
+    tmp = Path(tempfile.mkdtemp(prefix="c3-bm25-"))
+    try:
+        index = Bm25Index(tmp / "kw")
+        size_mb = sum(len(c["text"].encode("utf-8")) for c in chunks) / 1e6
+        t0 = time.perf_counter()
+        for start in range(0, len(chunks), 1024):
+            index.add(chunks[start:start + 1024])
+        index.save()
+        t_build = time.perf_counter() - t0
+        postings = index.stats()["postings"]
+        disk = sum(p.stat().st_size for p in (tmp / "kw").glob("seg-*"))
+
+        t0 = time.perf_counter()
+        index.add(more)
+        index.save()
+        t_inc = time.perf_counter() - t0
+        segments = len(index.segments)
+        t0 = time.perf_counter()
+        index.merge()
+        index.save()
+        t_merge = time.perf_counter() - t0
+
+        picks = rng.sample(range(len(chunks)), min(args.queries, len(chunks)))
+        id_queries = [ids[i] for i in picks]
+        word_queries = [" ".join(rng.sample(chunks[i]["text"].split(), 3)) for i in picks]
+        hits, id_ms = latency(lambda q: index.search(q, args.top_k), id_queries, args.batch)
+        top1 = float(np.mean([bool(h) and (h[0]["file"], h[0]["index"]) == (chunks[i]["file"], chunks[i]["index"])
+                              for h, i in zip(hits, picks)]))
+        _, word_ms = latency(lambda q: index.search(q, args.top_k), word_queries, args.batch)
+        results: Dict[str, Any] = {
+            "chunks": len(chunks), "mb": round(size_mb, 1),
+            "build_s": round(t_build, 2), "chunks_per_s": round(len(chunks) / t_build),
+            "mb_per_s": round(size_mb / t_build, 2), "postings": postings,
+            "bytes_per_posting": round(disk / max(1, postings), 2),
+            "increment": len(more), "increment_s": round(t_inc, 2), "segments_before_merge": segments,
+            "merge_s": round(t_merge, 2),
+            "id_ms_per_query": round(id_ms, 3), "id_top1": round(top1, 4), "word_ms_per_query": round(word_ms, 3),
+        }
+
+        if args.dims:
+            ann = AnnIndex(tmp / "ann")
+            all_chunks = chunks + more
+            x = synthetic(len(all_chunks), args.dims, max(10, len(all_chunks) // 100), 2.0, args.seed)
+            ann.add(x, all_chunks)
+            ann.train()
+            qv = x[picks]
+            _, hyb_ms = latency(lambda q: hybrid_search(index, ann, [id_queries[i] for i in q], qv[q], args.top_k),
+                                list(range(len(picks))), args.batch)
+            results["hybrid_ms_per_query"] = round(hyb_ms, 3)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=1))
+        return
+    r = results
+    print(f"build      {r['chunks']} chunks ({r['mb']} MB) in {r['build_s']}s: {r['chunks_per_s']} chunks/s, "
+          f"{r['mb_per_s']} MB/s; {r['postings']} postings, {r['bytes_per_posting']} bytes/posting on disk")
+    print(f"increment  {r['increment']} chunks in {r['increment_s']}s ({r['segments_before_merge']} segments), "
+          f"merge {r['merge_s']}s")
+    print(f"query      identifier {r['id_ms_per_query']} ms/query (top-1 {r['id_top1']:.3f}), "
+          f"3 words {r['word_ms_per_query']} ms/query")
+    if "hybrid_ms_per_query" in r:
+        print(f"hybrid     {r['hybrid_ms_per_query']} ms/query (BM25 + IVF + fusion, without embedding)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+from __future__ import annotations
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+HERE = Path(__file__).resolve().parent
+SCRIPTS = HERE.parent
+
+# ─────────────────────────── Start-up time ───────────────────────────
+# Runs `python -X importtime -c "import <script>"` and `python <script>.py --help`
+# in fresh processes, with no Azure config in the environment, and reports the
+# import time, --help wall time and the slowest imported packages.
+#
+# Fails if a module that must stay lazy (docling, Pillow, the OpenAI SDK, numpy) is
+# imported, or if a time grows past baselines/import.json × (1 + --tolerance).
+#
+#   python scripts/bench/bench_import.py                   # compare with the baseline
+#   python scripts/bench/bench_import.py --update-baseline # after an intended change
+
+BASELINE = HERE / "baselines" / "import.json"
+# script → top-level packages it must not import until a code path needs them
+LAZY: Dict[str, Tuple[str, ...]] = {
+    "extract": ("docling", "docling_core", "PIL", "openai"),
+    "chunker": ("openai", "numpy"),
+    "pipeline": ("docling", "docling_core", "PIL", "openai", "numpy"),
+    "worker": ("docling", "docling_core", "PIL", "openai", "numpy"),
+    "pgload": ("psycopg",),
+}
+AZURE_VARS = ("AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_KEY", "AZURE_OPENAI_VERSION")
+
+
+def _env() -> Dict[str, str]:
+    env = {k: v for k, v in os.environ.items() if k not in AZURE_VARS}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SCRIPTS), env.get("PYTHONPATH")]))
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, self µs, cumulative µs) per "import time:" line; nesting is kept as 2 spaces per level."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.rstrip()[1:], int(self_us), int(cum_us)))
+    return rows
+
+
+def import_profile(script: str, repeats: int) -> Dict[str, Any]:
+    best: Dict[str, Any] = {}
+    for _ in range(repeats):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import sys, {script}; "
+                               "print(','.join(sorted({m.split('.')[0] for m in sys.modules})))"],
+                              env=_env(), cwd=SCRIPTS, capture_output=True, text=True)
+        if proc.returncode:
+            sys.exit(f"[bench] import {script} failed: {proc.stderr.strip().splitlines()[-1]}")
+        rows = parse_importtime(proc.stderr)
+        total = next(cum for name, _s, cum in rows if name == script)
+        if not best or total < best["import_us"]:
+            # direct imports of the script (indented once under it), by cumulative time
+            direct = [(name.strip(), cum) for name, _s, cum in rows if len(name) - len(name.lstrip()) == 2]
+            best = {"import_us": total, "modules": proc.stdout.strip().split(","),
+                    "slowest": sorted(direct, key=lambda nc: -nc[1])[:5]}
+    return best
+
+
+def help_seconds(script: str, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        proc = subprocess.run([sys.executable, f"{script}.py", "--help"], env=_env(), cwd=SCRIPTS,
+                              capture_output=True, text=True)
+        best = min(best, time.perf_counter() - t0)
+        if proc.returncode:
+            sys.exit(f"[bench] {script}.py --help failed: {proc.stderr.strip().splitlines()[-1]}")
+    return best
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Import and --help time of the scripts, and lazy-import checks.")
+    p.add_argument("--scripts", nargs="+", default=list(LAZY))
+    p.add_argument("--repeats", type=int, default=5, help="Runs per measurement; the fastest is kept.")
+    p.add_argument("--tolerance", type=float, default=1.0,
+                   help="Allowed relative time increase over the baseline before failing.")
+    p.add_argument("--baseline", default=str(BASELINE))
+    p.add_argument("--update-baseline", action="store_true")
+    p.add_argument("--json", action="store_true", help="Print results as JSON.")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    results: Dict[str, Dict[str, Any]] = {}
+    for script in args.scripts:
+        prof = import_profile(script, args.repeats)
+        results[script] = {
+            "import_ms": round(prof["import_us"] / 1000, 1),
+            "help_ms": round(help_seconds(script, args.repeats) * 1000, 1),
+            "eager": sorted(set(LAZY.get(script, ())) & set(prof["modules"])),
+            "slowest": [[name, round(us / 1000, 1)] for name, us in prof["slowest"]],
+        }
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, indent=1) + "\n", encoding="utf-8")
+        sys.stderr.write(f"[bench] baseline written to {baseline_path}\n")
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+
+    failures: List[str] = []
+    for script, r in results.items():
+        if r["eager"]:
+            failures.append(f"{script}: imports {', '.join(r['eager'])} at start-up")
+        base = baseline.get(script, {})
+        for key in ("import_ms", "help_ms"):
+            if key in base and r[key] > base[key] * (1 + args.tolerance):
+                failures.append(f"{script}: {key} {r[key]} > baseline {base[key]} × {1 + args.tolerance}")
+
+    if args.json:
+        print(json.dumps(results, indent=1))
+    else:
+        print(f"{'script':10} {'import ms':>9} {'base':>7} {'--help ms':>9} {'base':>7}  slowest imports (ms)")
+        for script, r in results.items():
+            base = baseline.get(script, {})
+            slowest = ", ".join(f"{n} {ms}" for n, ms in r["slowest"][:3])
+            print(f"{script:10} {r['import_ms']:9.1f} {base.get('import_ms', float('nan')):7.1f} "
+                  f"{r['help_ms']:9.1f} {base.get('help_ms', float('nan')):7.1f}  {slowest}")
+    if failures:
+        sys.exit("\n".join(["[bench] start-up regression:"] + failures))
+
+
+if __name__ == "__main__":
+    main()
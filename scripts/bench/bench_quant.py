@@ -0,0 +1,134 @@
+from __future__ import annotations
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+from annindex import np  # noqa: E402
+from bench_ann import synthetic  # noqa: E402
+from chunkio import dequantize, quantize, read_chunks  # noqa: E402
+
+# ─────────────────────────── Recall cost of reduced / quantized embeddings ───────────────────────────
+# For each output size (chunker.py --dimensions) and encoding (--quantize),
+# recall@k of brute-force cosine search against full-size float32 search:
+#
+#   none / float16 / int8   vectors round-tripped through chunkio.quantize/dequantize
+#   binary                  sign bits for data and query (Hamming ranking, as pgvector bit)
+#   binary+rerank           binary shortlist of k × --rerank, re-scored with float32 (kept on disk)
+#
+# Smaller sizes are simulated by truncating and re-normalising the full vectors,
+# which is what text-embedding-3 returns for "dimensions". Run it on real chunks
+# for numbers that mean something for the corpus:
+#
+#   python chunker.py --output-format ndjson > chunks.ndjson
+#   python scripts/bench/bench_quant.py --input chunks.ndjson
+#
+# Without --input, clustered synthetic vectors are used.
+
+MODES = ("none", "float16", "int8", "binary", "binary+rerank")
+
+
+def bytes_per_vector(dims: int, mode: str) -> int:
+    return {"none": 4 * dims, "float16": 2 * dims, "int8": dims + 4}.get(mode, (dims + 7) // 8)
+
+
+def normalise(x: np.ndarray) -> np.ndarray:
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def round_trip(x: np.ndarray, mode: str) -> np.ndarray:
+    dims = x.shape[1]
+    return np.array([dequantize({"dims": dims, **quantize(row.tolist(), mode)}) for row in x], dtype=np.float32)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(idx, np.argsort(-np.take_along_axis(scores, idx, axis=1), axis=1), axis=1)
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found.tolist(), truth.tolist())]))
+
+
+def load_vectors(path: str, vectors_npy: str, limit: int) -> np.ndarray:
+    vecs: List[List[float]] = []
+    with open(path, encoding="utf-8") as fh:
+        for rec in read_chunks(fh, Path(vectors_npy) if vectors_npy else None):
+            if rec.get("embedding"):
+                if rec.get("quant", "none") != "none":
+                    sys.exit(f"{path}: needs full-precision vectors (chunker.py without --quantize)")
+                vecs.append(rec["embedding"])
+                if len(vecs) >= limit:
+                    break
+    if not vecs:
+        sys.exit(f"{path}: no chunk embeddings found")
+    return np.asarray(vecs, dtype=np.float32)
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Recall@k of chunker.py --dimensions/--quantize modes.")
+    p.add_argument("--input", default=None, help="chunker.py NDJSON with float32 vectors (default: synthetic).")
+    p.add_argument("--vectors-npy", default=None, help="Sidecar .npy of --input, if any.")
+    p.add_argument("--rows", type=int, default=10_000, help="Vectors searched (synthetic size / --input limit).")
+    p.add_argument("--full-dims", type=int, default=1536, help="Synthetic vector size.")
+    p.add_argument("--dims", type=int, nargs="+", default=[1536, 1024, 768, 512, 256])
+    p.add_argument("--queries", type=int, default=200, help="Rows used as queries (excluded from their own hits).")
+    p.add_argument("--top-k", type=int, default=10)
+    p.add_argument("--rerank", type=int, default=10, help="Shortlist multiple for binary+rerank.")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--json", action="store_true")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    if args.input:
+        x = load_vectors(args.input, args.vectors_npy, args.rows)
+    else:
+        x = synthetic(args.rows, args.full_dims, max(10, args.rows // 100), 2.0, args.seed)
+    x = normalise(x.astype(np.float32))
+    rng = np.random.default_rng(args.seed)
+    qi = rng.choice(len(x), size=min(args.queries, len(x) - 1), replace=False)
+    k = min(args.top_k, len(x) - 1)
+
+    def search(data: np.ndarray, queries: np.ndarray, n: int) -> np.ndarray:
+        scores = queries @ data.T
+        scores[np.arange(len(qi)), qi] = -np.inf  # a query is not its own neighbour
+        return top_k(scores, n)
+
+    truth = search(x, x[qi], k)
+    results: List[Dict[str, Any]] = []
+    for dims in [d for d in args.dims if d <= x.shape[1]]:
+        xd = normalise(x[:, :dims])
+        for mode in MODES:
+            t0 = time.perf_counter()
+            if mode == "binary+rerank":
+                shortlist = search(np.sign(xd), np.sign(xd[qi]), min(len(x) - 1, k * args.rerank))
+                rescored = np.einsum("qd,qcd->qc", xd[qi], xd[shortlist])
+                found = np.take_along_axis(shortlist, top_k(rescored, k), axis=1)
+            elif mode == "binary":
+                found = search(np.sign(xd), np.sign(xd[qi]), k)
+            else:
+                data = round_trip(xd, mode)
+                found = search(data, xd[qi], k)
+            results.append({"dims": dims, "mode": mode, "bytes": bytes_per_vector(dims, mode),
+                            "recall": round(recall(found, truth), 4),
+                            "seconds": round(time.perf_counter() - t0, 2)})
+
+    if args.json:
+        print(json.dumps({"rows": len(x), "full_dims": x.shape[1], "k": k, "results": results}, indent=1))
+        return
+    print(f"{len(x)} vectors × {x.shape[1]} dims ({args.input or 'synthetic'}), "
+          f"{len(qi)} queries, recall@{k} vs full float32")
+    print(f"{'dims':>5} {'mode':<14} {'bytes/vec':>9} {'recall':>7}")
+    for r in results:
+        print(f"{r['dims']:5d} {r['mode']:<14} {r['bytes']:9d} {r['recall']:7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+from __future__ import annotations
+import argparse
+import gc
+import json
+import math
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+import chunker  # noqa: E402
+import extract  # noqa: E402
+from corpus import make_markdown  # noqa: E402
+
+# ─────────────────────────── Text hot-path microbenchmarks ───────────────────────────
+# Times each pure text function on synthetic markdown at growing sizes and fits
+# the scaling exponent k in time ≈ c·size^k (1 = linear, 2 = quadratic).
+# Compared with baselines/text.json: a function fails if its time or peak-memory
+# exponent grows past the baseline + tolerance. Absolute times are shown for
+# information only (they depend on the machine).
+#
+#   python scripts/bench/bench_text.py                   # compare with the baseline
+#   python scripts/bench/bench_text.py --update-baseline # after an intended change
+
+BASELINE = HERE / "baselines" / "text.json"
+DEFAULT_SCALES = [50_000, 200_000, 800_000, 3_200_000]
+
+
+def _sections(md: str) -> List[Dict[str, Any]]:
+    return chunker.build_sections(md, chunker.find_headings(md))
+
+
+# name → (setup(md) → state, fn(md, state)); setup runs before every timed call
+# and is not timed (merge_short_sections mutates its input, so it needs fresh sections)
+CASES: Dict[str, Tuple[Callable[[str], Any], Callable[[str, Any], Any]]] = {
+    "scan_markdown": (lambda md: None, lambda md, _s: extract.scan_markdown(md)),
+    "convert_pipe_tables_to_csv": (lambda md: None, lambda md, _s: extract.convert_pipe_tables_to_csv(md)),
+    "find_headings": (lambda md: None, lambda md, _s: chunker.find_headings(md)),
+    "build_sections": (chunker.find_headings, lambda md, hs: chunker.build_sections(md, hs)),
+    "merge_short_sections": (_sections, lambda md, secs: chunker.merge_short_sections(md, secs, chunker.MIN_CHARS)),
+    "chunk_markdown": (lambda md: None, lambda md, _s: chunker.chunk_markdown(md)),
+}
+
+
+def measure(setup: Callable[[], Any], fn: Callable[[Any], Any], repeats: int) -> Tuple[float, int]:
+    """(best wall time in seconds, peak traced allocation in bytes) of fn(setup())"""
+    best = math.inf
+    for _ in range(repeats):
+        state = setup()
+        gc.collect()
+        t0 = time.perf_counter()
+        fn(state)
+        best = min(best, time.perf_counter() - t0)
+    state = setup()
+    gc.collect()
+    tracemalloc.start()
+    fn(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def exponent(sizes: List[int], values: List[float]) -> float:
+    """Least-squares slope of log(value) over log(size)."""
+    xs = [math.log(s) for s in sizes]
+    ys = [math.log(max(v, 1e-9)) for v in values]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    den = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / den if den else 0.0
+
+
+def run_case(name: str, corpora: List[str], repeats: int) -> Dict[str, Any]:
+    setup, fn = CASES[name]
+    sizes, times, peaks = [], [], []
+    for md in corpora:
+        t, peak = measure(lambda: setup(md), lambda state: fn(md, state), repeats)
+        sizes.append(len(md))
+        times.append(t)
+        peaks.append(peak)
+    return {
+        "sizes": sizes,
+        "seconds": [round(t, 6) for t in times],
+        "peak_kb": [p // 1024 for p in peaks],
+        "time_exponent": round(exponent(sizes, times), 3),
+        "memory_exponent": round(exponent(sizes, [float(p) for p in peaks]), 3),
+    }
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Scaling benchmarks for extract.py / chunker.py text functions.")
+    p.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES,
+                   help="Corpus sizes in characters.")
+    p.add_argument("--repeats", type=int, default=3, help="Timed runs per size (best is kept).")
+    p.add_argument("--only", nargs="+", choices=sorted(CASES), default=None)
+    p.add_argument("--headings", type=float, default=60, help="Headings per 100k chars.")
+    p.add_argument("--tables", type=float, default=8, help="Tables per 100k chars.")
+    p.add_argument("--table-rows", type=int, default=20)
+    p.add_argument("--images", type=float, default=10, help="Images per 100k chars.")
+    p.add_argument("--tolerance", type=float, default=0.25,
+                   help="Allowed exponent increase over the baseline before failing.")
+    p.add_argument("--baseline", default=str(BASELINE))
+    p.add_argument("--update-baseline", action="store_true")
+    p.add_argument("--json", action="store_true", help="Print results as JSON.")
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    corpora = [make_markdown(n, args.headings, args.tables, args.table_rows, images_per_100k=args.images)
+               for n in sorted(args.scales)]
+    results = {name: run_case(name, corpora, args.repeats) for name in (args.only or CASES)}
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(results, indent=1) + "\n", encoding="utf-8")
+        sys.stderr.write(f"[bench] baseline written to {baseline_path}\n")
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")) if baseline_path.exists() else {}
+
+    if args.json:
+        print(json.dumps(results, indent=1))
+    failures: List[str] = []
+    print(f"{'function':28} {'k_time':>7} {'base':>6} {'k_mem':>7} {'base':>6}  largest: ms / peak MB")
+    for name, r in results.items():
+        base = baseline.get(name, {})
+        status = ""
+        for key in ("time_exponent", "memory_exponent"):
+            if key in base and r[key] > base[key] + args.tolerance:
+                status = "  REGRESSION"
+                failures.append(f"{name}: {key} {r[key]} > baseline {base[key]} + {args.tolerance}")
+        print(f"{name:28} {r['time_exponent']:7.2f} {base.get('time_exponent', float('nan')):6.2f} "
+              f"{r['memory_exponent']:7.2f} {base.get('memory_exponent', float('nan')):6.2f}  "
+              f"{r['seconds'][-1] * 1000:.2f}ms / {r['peak_kb'][-1] / 1024:.1f}{status}")
+
+    if failures:
+        sys.exit("scaling regression:\n  " + "\n  ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+import argparse
+import random
+from pathlib import Path
+from typing import List, Optional
+
+# ─────────────────────────── Synthetic docling-style markdown ───────────────────────────
+# Shaped like extract.py input: nested headings, paragraphs, pipe tables (with
+# the |---| align row), markdown images into <stem>_artifacts/ and
+# <!-- image --> placeholders, plus the occasional fenced code block.
+# Densities are per 100 000 characters so a larger target keeps the same mix.
+
+WORDS = ("grid load transmission substation capacity forecast demand outage "
+         "reliability voltage feeder customer tariff hydro reservoir turbine "
+         "maintenance asset budget quarter regional report summary").split()
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(2, 6)))
+
+
+def _table(rng: random.Random, rows: int, cols: int) -> List[str]:
+    header = "| " + " | ".join(f"Col {c + 1}" for c in range(cols)) + " |"
+    align = "|" + "|".join("---" for _ in range(cols)) + "|"
+    body = ["| " + " | ".join(
+        rng.choice((f"{rng.uniform(0, 1e4):.1f}", rng.choice(WORDS), f'"{rng.choice(WORDS)}, {rng.choice(WORDS)}"'))
+        for _ in range(cols)) + " |" for _ in range(rows)]
+    return [header, align] + body
+
+
+def make_markdown(target_chars: int = 100_000, headings_per_100k: float = 60, tables_per_100k: float = 8,
+                  table_rows: int = 20, table_cols: int = 6, images_per_100k: float = 10,
+                  placeholder_share: float = 0.5, code_per_100k: float = 2, stem: str = "doc",
+                  seed: Optional[int] = 0) -> str:
+    """Generate about target_chars of markdown with the given densities (deterministic per seed)."""
+    rng = random.Random(seed)
+    # per-block probabilities, a paragraph (~500 chars) being the unit
+    per_block = 500 / 100_000
+    out: List[str] = []
+    size = 0
+    img_no = 0
+    while size < target_chars:
+        r = rng.random()
+        block: List[str]
+        if r < headings_per_100k * per_block:
+            block = ["#" * rng.choice((1, 2, 2, 3, 3, 3, 4)) + " " + _sentence(rng)[:-1]]
+        elif r < (headings_per_100k + tables_per_100k) * per_block:
+            block = _table(rng, table_rows, table_cols)
+        elif r < (headings_per_100k + tables_per_100k + images_per_100k) * per_block:
+            if rng.random() < placeholder_share:
+                block = ["<!-- image -->"]
+            else:
+                block = [f"![Image]({stem}_artifacts/image_{img_no:06d}_{rng.getrandbits(64):016x}.png)"]
+            img_no += 1
+        elif r < (headings_per_100k + tables_per_100k + images_per_100k + code_per_100k) * per_block:
+            block = ["```", *(_sentence(rng) for _ in range(rng.randint(2, 8))), "```"]
+        else:
+            block = [_paragraph(rng)]
+        text = "\n".join(block)
+        out.append(text)
+        size += len(text) + 2
+    return "\n\n".join(out) + "\n"
+
+
+def main() -> None:
+    p = argparse.ArgumentParser(description="Write a synthetic docling-style markdown file.")
+    p.add_argument("--out", required=True, help="Output .md path")
+    p.add_argument("--chars", type=int, default=100_000)
+    p.add_argument("--headings", type=float, default=60, help="Headings per 100k chars.")
+    p.add_argument("--tables", type=float, default=8, help="Tables per 100k chars.")
+    p.add_argument("--table-rows", type=int, default=20)
+    p.add_argument("--table-cols", type=int, default=6)
+    p.add_argument("--images", type=float, default=10, help="Images/placeholders per 100k chars.")
+    p.add_argument("--seed", type=int, default=0)
+    args = p.parse_args()
+    out = Path(args.out)
+    out.write_text(make_markdown(args.chars, args.headings, args.tables, args.table_rows, args.table_cols,
+                                 args.images, stem=out.stem, seed=args.seed), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE.parent))
+
+from corpus import make_markdown  # noqa: E402
+from mock_azure import MockAzure, _percentile  # noqa: E402
+
+# ─────────────────────────── End-to-end load harness ───────────────────────────
+# Runs the extract.py + chunker.py stages over a corpus against mock_azure.py
+# (in-process by default, or any --endpoint) and reports throughput and
+# per-stage latency, so concurrency/retry changes can be compared offline:
+#
+#   convert   docling (only with --in; synthetic documents start as markdown)
+#   caption   tables → CSV + image descriptions (extract.postprocess_markdown_async)
+#   chunk     sectioning (chunker.chunk_markdown)
+#   embed     chunker.embed_all
+#   emit      chunker.emit_file to /dev/null
+#
+#   python scripts/bench/load.py --synthetic 40 --docs 4 --throttle-rate 0.05
+#   python scripts/bench/load.py --in ./data --json > run.json
+#
+# Caches are off unless --cache is given, so every run makes the same calls.
+
+STAGES = ("convert", "caption", "chunk", "embed", "emit")
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Throughput/latency harness for extract.py + chunker.py on a mock Azure.")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--in", dest="in_dir", help="Folder of real PDF/DOCX/PPTX inputs (needs docling).")
+    src.add_argument("--synthetic", type=int, metavar="N", help="Generate N synthetic markdown documents.")
+    p.add_argument("--chars", type=int, default=60_000, help="Synthetic document size.")
+    p.add_argument("--images", type=float, default=10, help="Synthetic images per 100k chars.")
+    p.add_argument("--work", default=None, help="Working folder (default: a temporary one, removed afterwards).")
+    p.add_argument("--docs", type=int, default=2, help="Documents in flight at once.")
+    p.add_argument("--caption-concurrency", type=int, default=10)
+    p.add_argument("--embed-concurrency", type=int, default=4)
+    p.add_argument("--batch-size", type=int, default=64, help="chunker.py --batch-size")
+    p.add_argument("--rpm", type=int, default=0, help="Client-side requests/min budget (both deployments).")
+    p.add_argument("--tpm", type=int, default=0, help="Client-side tokens/min budget (both deployments).")
+    p.add_argument("--no-describe", action="store_true", help="Skip image descriptions.")
+    p.add_argument("--cache", action="store_true", help="Use the image/embedding caches (in the work folder).")
+    p.add_argument("--endpoint", default=None, help="Use an already running mock instead of an in-process one.")
+    mock = p.add_argument_group("in-process mock (see mock_azure.py)")
+    mock.add_argument("--chat-latency", default="lognormal:900:0.35")
+    mock.add_argument("--embed-latency", default="lognormal:150:0.3")
+    mock.add_argument("--throttle-rate", type=float, default=0.0)
+    mock.add_argument("--error-rate", type=float, default=0.0)
+    mock.add_argument("--server-rpm", type=float, default=0, help="Quota enforced by the mock per deployment.")
+    mock.add_argument("--server-tpm", type=float, default=0)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--verbose", action="store_true", help="Keep the stages' stderr logs.")
+    p.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    return p.parse_args()
+
+
+def write_synthetic(root: Path, n: int, chars: int, images: float, seed: int) -> List[Path]:
+    """Markdown as docling exports it, with a random-noise PNG for every image reference."""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    paths = []
+    for i in range(n):
+        stem = f"doc{i:04d}"
+        md = make_markdown(chars, images_per_100k=images, placeholder_share=0.0, stem=stem, seed=seed + i)
+        art = root / f"{stem}_artifacts"
+        art.mkdir(parents=True, exist_ok=True)
+        for line in md.splitlines():
+            if line.startswith("![Image]("):
+                w, h = rng.randint(200, 640), rng.randint(150, 480)
+                Image.frombytes("L", (w, h), rng.randbytes(w * h)).save(root / line[len("![Image]("):-1])
+        path = root / f"{stem}.md"
+        path.write_text(md, encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+class Timings:
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = {s: [] for s in STAGES}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - t0)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: {"n": len(v), "p50_ms": round(_percentile(v, 50) * 1000, 1),
+                       "p95_ms": round(_percentile(v, 95) * 1000, 1), "total_s": round(sum(v), 2)}
+                for name, v in self.samples.items() if v}
+
+
+async def run_load(args: argparse.Namespace, work: Path, extract: Any, chunker: Any,
+                   timings: Timings) -> Tuple[int, int, List[str]]:
+    """returns: (documents done, chunks emitted, failed document names)"""
+    out_dir = work / "out"
+    out_dir.mkdir(parents=True, exist_ok=True)
+    cache_flags = ["--image-cache", str(work / "images.sqlite")] if args.cache else ["--no-image-cache"]
+    ex_argv = ["--in", args.in_dir or str(out_dir), "--out", str(out_dir), "--concurrency",
+               str(args.caption_concurrency), "--rpm", str(args.rpm), "--tpm", str(args.tpm), *cache_flags]
+    if not args.no_describe:
+        ex_argv.append("--describe-images")
+    ex_args = extract.parse_args(ex_argv)
+    ch_args = chunker.parse_args(["--root", str(out_dir), "--concurrency", str(args.embed_concurrency),
+                                  "--batch-size", str(args.batch_size), "--rpm", str(args.rpm),
+                                  "--tpm", str(args.tpm)]
+                                 + (["--cache", str(work / "embeddings.sqlite")] if args.cache else ["--no-cache"]))
+    image_cache = extract.open_image_cache(ex_args)
+    embed_cache = chunker.open_cache(ch_args)
+    embed_scheduler = chunker.embedding_scheduler(ch_args.concurrency, ch_args.rpm, ch_args.tpm)
+    count_tokens = chunker.get_token_counter(ch_args.tokenizer)
+
+    if args.in_dir:
+        sources = extract.list_input_files(ex_args)
+        converter = extract.build_converter(ex_args.profile)
+    else:
+        sources = write_synthetic(out_dir, args.synthetic, args.chars, args.images, args.seed)
+        converter = None
+    convert_lock = threading.Lock()  # one converter, one document at a time
+    image_mode = extract.image_ref_mode(ex_args)
+
+    def _convert(f: Path) -> Path:
+        with convert_lock, timings.stage("convert"):
+            return extract.convert_sharded(converter, f, out_dir, image_mode, 0, None)
+
+    slots = asyncio.Semaphore(max(1, args.docs))
+    failed: List[str] = []
+    totals = {"docs": 0, "chunks": 0}
+    with open(os.devnull, "w", encoding="utf-8") as sink:
+
+        async def _one(f: Path) -> None:
+            async with slots:
+                try:
+                    md_path = await asyncio.to_thread(_convert, f) if converter else f
+                    with timings.stage("caption"):
+                        md_text = await extract.postprocess_markdown_async(md_path, ex_args, image_cache)
+                    with timings.stage("chunk"):
+                        chunks = chunker.chunk_markdown(md_text, ch_args.max_tokens, ch_args.overlap_tokens,
+                                                        count_tokens)
+                    with timings.stage("embed"):
+                        embeddings = await chunker.embed_all(
+                            [c[2] for c in chunks], ch_args.batch_size, ch_args.batch_tokens,
+                            ch_args.concurrency, ch_args.retries, embed_cache, embed_scheduler)
+                    with timings.stage("emit"):
+                        chunker.emit_file(md_path, chunks, embeddings, sink)
+                except Exception as e:
+                    sys.stderr.write(f"[load error] {f.name}: {type(e).__name__}: {e}\n")
+                    failed.append(f.name)
+                    return
+                totals["docs"] += 1
+                totals["chunks"] += sum(1 for e in embeddings if e)
+
+        try:
+            await asyncio.gather(*(_one(f) for f in sources))
+        finally:
+            for cache in (image_cache, embed_cache):
+                if cache:
+                    cache.close()
+    return totals["docs"], totals["chunks"], failed
+
+
+def mock_request(endpoint: str, path: str) -> Dict[str, Any]:
+    """GET /stats or POST /reset on a running mock_azure.py"""
+    from urllib.request import Request, urlopen
+
+    req = Request(f"{endpoint}{path}", data=b"{}" if path == "/reset" else None)
+    with urlopen(req, timeout=10) as r:
+        return json.loads(r.read())
+
+
+def report(docs: int, chunks: int, failed: List[str], wall: float, timings: Timings,
+           api: Dict[str, Any], schedulers: List[Dict[str, Any]]) -> Dict[str, Any]:
+    calls = sum(v.get("requests", 0) for v in api.values())
+    return {
+        "docs": docs,
+        "failed": len(failed),
+        "chunks": chunks,
+        "wall_s": round(wall, 2),
+        "docs_per_min": round(docs / wall * 60, 2) if wall else 0.0,
+        "chunks_per_s": round(chunks / wall, 2) if wall else 0.0,
+        "api_calls_per_doc": round(calls / docs, 2) if docs else 0.0,
+        "stages": timings.summary(),
+        "api": api,
+        "schedulers": schedulers,
+    }
+
+
+def print_report(r: Dict[str, Any]) -> None:
+    print(f"documents {r['docs']} ({r['failed']} failed), chunks {r['chunks']}, wall {r['wall_s']}s")
+    print(f"throughput {r['docs_per_min']} docs/min, {r['chunks_per_s']} chunks/s, "
+          f"{r['api_calls_per_doc']} API calls/doc")
+    print(f"{'stage':10} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'total s':>9}")
+    for name, s in r["stages"].items():
+        print(f"{name:10} {s['n']:5d} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} {s['total_s']:9.2f}")
+    for kind, s in r["api"].items():
+        if s.get("requests"):
+            print(f"api {kind:10} requests {s['requests']} ok {s.get('ok', 0)} 429 {s.get('throttled', 0)}"
+                  f"+{s.get('quota_429', 0)} 5xx {s.get('errors', 0)} p50 {s['p50_ms']}ms p95 {s['p95_ms']}ms")
+    for s in r["schedulers"]:
+        print(f"scheduler {s['name']} concurrency {s['concurrency']}/{s['max_concurrency']} "
+              f"retries {s['retries']} throttled {s['throttled']} failed {s['failed']}")
+
+
+def main() -> None:
+    args = parse_args()
+    mock: Optional[MockAzure] = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        mock = MockAzure(args.chat_latency, args.embed_latency, throttle_rate=args.throttle_rate,
+                         error_rate=args.error_rate, rpm=args.server_rpm, tpm=args.server_tpm, seed=args.seed)
+        endpoint = mock.start()
+    else:
+        mock_request(endpoint, "/reset")
+    # extract.py / chunker.py read the Azure config at import, so point them at the mock first
+    os.environ["AZURE_OPENAI_ENDPOINT"] = endpoint
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "mock")
+    os.environ.setdefault("AZURE_OPENAI_VERSION", "2024-10-21")
+    import chunker
+    import extract
+    from scheduler import all_stats
+
+    work = Path(args.work) if args.work else Path(tempfile.mkdtemp(prefix="c3-load-"))
+    timings = Timings()
+    try:
+        with contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stderr(stack.enter_context(open(os.devnull, "w"))))
+            t0 = time.perf_counter()
+            docs, chunks, failed = asyncio.run(run_load(args, work, extract, chunker, timings))
+            wall = time.perf_counter() - t0
+        api = mock.stats() if mock else mock_request(endpoint, "/stats")
+        r = report(docs, chunks, failed, wall, timings, api, all_stats())
+    finally:
+        if mock:
+            mock.stop()
+        if not args.work:
+            shutil.rmtree(work, ignore_errors=True)
+    if args.json:
+        print(json.dumps(r, indent=1))
+    else:
+        print_report(r)
+
+
+if __name__ == "__main__":
+    main()
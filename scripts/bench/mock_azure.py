@@ -0,0 +1,356 @@
+from __future__ import annotations
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# ─────────────────────────── Local stand-in for Azure OpenAI ───────────────────────────
+# Serves the two endpoints extract.py / chunker.py call, at the same URLs the
+# openai SDK builds from AZURE_OPENAI_ENDPOINT:
+#
+#   POST /openai/deployments/<name>/chat/completions   → deterministic image description
+#   POST /openai/deployments/<name>/embeddings         → deterministic unit vectors (float or base64)
+#   GET  /stats                                        → request counts and server-side latency
+#   POST /reset                                        → clear the counters
+#
+# Latency is drawn per request (fixed / uniform / lognormal, plus a per-input
+# cost for embeddings). Failures come from two sources: random 429/5xx
+# injection, and optional per-deployment rpm/tpm quotas enforced over 10-second
+# windows like Azure's. Every response carries x-ratelimit-remaining-* headers
+# and 429s carry retry-after(-ms), so scheduler.Scheduler sees what it would in
+# production.
+#
+#   python scripts/bench/mock_azure.py --port 8799 --embed-latency lognormal:120:0.4 --throttle-rate 0.05
+#   AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8799 python scripts/chunker.py ...
+
+WINDOW_S = 10.0
+
+
+class Latency:
+    """
+    "fixed:MS", "uniform:LO_MS:HI_MS" or "lognormal:MEDIAN_MS:SIGMA".
+    """
+
+    def __init__(self, spec: str) -> None:
+        kind, *params = spec.split(":")
+        try:
+            values = [float(v) for v in params]
+        except ValueError:
+            raise ValueError(f"bad latency spec {spec!r}")
+        expected = {"fixed": 1, "uniform": 2, "lognormal": 2}
+        if kind not in expected or len(values) != expected[kind]:
+            raise ValueError(f"bad latency spec {spec!r} (fixed:MS, uniform:LO:HI, lognormal:MEDIAN:SIGMA)")
+        self.spec = spec
+        self.kind = kind
+        self.values = values
+
+    def sample(self, rng: random.Random) -> float:
+        """seconds"""
+        if self.kind == "fixed":
+            ms = self.values[0]
+        elif self.kind == "uniform":
+            ms = rng.uniform(*self.values)
+        else:
+            median, sigma = self.values
+            ms = rng.lognormvariate(0.0, sigma) * median
+        return max(0.0, ms) / 1000.0
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Unit vector seeded by the text: identical inputs always get identical vectors."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vec = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = sum(v * v for v in vec) ** 0.5 or 1.0
+    return [v / norm for v in vec]
+
+
+def fake_description(content: Any) -> str:
+    digest = hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+    return (f"Mock description {digest[:12]}. The figure shows a labelled chart with two axes, "
+            f"a legend and several data series; values rise towards the right. "
+            f"All visible text is reproduced here for indexing: REGION, Q1, Q2, Q3, Q4, TOTAL.")
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def chat_tokens(messages: List[Dict[str, Any]]) -> int:
+    n = 0
+    for m in messages:
+        content = m.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            # a detail:high image is ~1000 tokens after downscaling
+            n += 1000 if part.get("type") == "image_url" else estimate_tokens(str(part.get("text", "")))
+    return n
+
+
+class _Quota:
+    """requests/tokens used in the current 10-second window for one deployment"""
+
+    def __init__(self, rpm: float, tpm: float) -> None:
+        self.requests_limit = rpm * WINDOW_S / 60.0
+        self.tokens_limit = tpm * WINDOW_S / 60.0
+        self.window_start = time.monotonic()
+        self.requests = 0.0
+        self.tokens = 0.0
+
+    def _roll(self, now: float) -> None:
+        if now - self.window_start >= WINDOW_S:
+            self.window_start = now
+            self.requests = self.tokens = 0.0
+
+    def admit(self, tokens: int) -> Tuple[bool, float]:
+        """(allowed, seconds until the window resets)"""
+        now = time.monotonic()
+        self._roll(now)
+        reset = self.window_start + WINDOW_S - now
+        if ((self.requests_limit and self.requests + 1 > self.requests_limit)
+                or (self.tokens_limit and self.tokens + tokens > self.tokens_limit)):
+            return False, reset
+        self.requests += 1
+        self.tokens += tokens
+        return True, reset
+
+    def headers(self) -> Dict[str, str]:
+        out = {}
+        if self.requests_limit:
+            out["x-ratelimit-remaining-requests"] = str(int(max(0.0, self.requests_limit - self.requests)))
+        if self.tokens_limit:
+            out["x-ratelimit-remaining-tokens"] = str(int(max(0.0, self.tokens_limit - self.tokens)))
+        return out
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, int(round(q / 100.0 * len(s) + 0.5)) - 1))]
+
+
+class MockAzure:
+    def __init__(self, chat_latency: str = "lognormal:900:0.35", embed_latency: str = "lognormal:150:0.3",
+                 embed_item_ms: float = 0.5, throttle_rate: float = 0.0, error_rate: float = 0.0,
+                 retry_after_ms: int = 1000, rpm: float = 0, tpm: float = 0, dimensions: int = 1536,
+                 seed: Optional[int] = 0) -> None:
+        self.latency = {"chat": Latency(chat_latency), "embeddings": Latency(embed_latency)}
+        self.embed_item_ms = embed_item_ms
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.retry_after_ms = retry_after_ms
+        self.rpm, self.tpm = rpm, tpm
+        self.dimensions = dimensions
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._quotas: Dict[str, _Quota] = {}
+        self._server: Optional[ThreadingHTTPServer] = None
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counters: Dict[str, Dict[str, int]] = {}
+            self.latencies: Dict[str, List[float]] = {"chat": [], "embeddings": []}
+
+    # ---- request handling ----
+
+    def _count(self, kind: str, key: str, n: int = 1) -> None:
+        c = self.counters.setdefault(kind, {"requests": 0, "ok": 0, "throttled": 0, "quota_429": 0,
+                                            "errors": 0, "inputs": 0, "tokens": 0})
+        c[key] += n
+
+    def _decide(self, kind: str, deployment: str, tokens: int) -> Tuple[int, Dict[str, str], float]:
+        """(status, headers, delay seconds)"""
+        with self._lock:
+            self._count(kind, "requests")
+            quota = self._quotas.setdefault(deployment, _Quota(self.rpm, self.tpm))
+            allowed, reset = quota.admit(tokens)
+            headers = quota.headers()
+            r = self._rng.random()
+            delay = self.latency[kind].sample(self._rng)
+            if not allowed:
+                self._count(kind, "quota_429")
+                retry_ms = int(reset * 1000) + 1
+                return 429, {**headers, "retry-after-ms": str(retry_ms),
+                             "retry-after": str(max(1, round(retry_ms / 1000)))}, 0.0
+            if r < self.throttle_rate:
+                self._count(kind, "throttled")
+                return 429, {**headers, "retry-after-ms": str(self.retry_after_ms),
+                             "retry-after": str(max(1, round(self.retry_after_ms / 1000)))}, 0.0
+            if r < self.throttle_rate + self.error_rate:
+                self._count(kind, "errors")
+                return self._rng.choice((500, 503)), headers, delay
+            self._count(kind, "ok")
+            self._count(kind, "tokens", tokens)
+            return 200, headers, delay
+
+    def chat(self, deployment: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        messages = body.get("messages") or []
+        tokens = chat_tokens(messages)
+        status, headers, delay = self._decide("chat", deployment, tokens)
+        time.sleep(delay)
+        if status != 200:
+            return status, headers, _error(status)
+        text = fake_description(messages[-1].get("content") if messages else "")
+        completion = estimate_tokens(text)
+        return status, headers, {
+            "id": f"chatcmpl-mock-{self._rng.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": deployment,
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": tokens, "completion_tokens": completion,
+                      "total_tokens": tokens + completion},
+        }
+
+    def embeddings(self, deployment: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs or [])
+        tokens = sum(estimate_tokens(str(t)) for t in inputs)
+        status, headers, delay = self._decide("embeddings", deployment, tokens)
+        time.sleep(delay + len(inputs) * self.embed_item_ms / 1000.0 if status == 200 else delay)
+        if status != 200:
+            return status, headers, _error(status)
+        with self._lock:
+            self._count("embeddings", "inputs", len(inputs))
+        dimensions = int(body.get("dimensions") or self.dimensions)
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for i, text in enumerate(inputs):
+            vec = fake_embedding(str(text), dimensions)
+            emb: Any = base64.b64encode(struct.pack(f"<{dimensions}f", *vec)).decode("ascii") if as_base64 else vec
+            data.append({"object": "embedding", "index": i, "embedding": emb})
+        return status, headers, {"object": "list", "model": deployment, "data": data,
+                                 "usage": {"prompt_tokens": tokens, "total_tokens": tokens}}
+
+    def record_latency(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self.latencies[kind].append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {}
+            for kind, lat in self.latencies.items():
+                out[kind] = {**self.counters.get(kind, {}),
+                             "p50_ms": round(_percentile(lat, 50) * 1000, 1),
+                             "p95_ms": round(_percentile(lat, 95) * 1000, 1)}
+            return out
+
+    # ---- server ----
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve on a background thread; returns the endpoint URL (port 0 = any free port)."""
+        self._server = ThreadingHTTPServer((host, port), make_handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="mock-azure", daemon=True).start()
+        return f"http://{host}:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _error(status: int) -> Dict[str, Any]:
+    if status == 429:
+        return {"error": {"code": "429", "message": "Requests to the deployment have exceeded the rate limit (mock)."}}
+    return {"error": {"code": "InternalServerError", "message": f"Injected {status} (mock)."}}
+
+
+def make_handler(mock: MockAzure) -> type:
+    routes = {"chat/completions": ("chat", mock.chat), "embeddings": ("embeddings", mock.embeddings)}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *_a: Any) -> None:
+            pass
+
+        def _json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if self.path == "/stats":
+                self._json(200, mock.stats())
+            else:
+                self._json(404, {"error": {"code": "NotFound", "message": self.path}})
+
+        def do_POST(self) -> None:
+            t0 = time.perf_counter()
+            path = self.path.split("?", 1)[0]
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            if path == "/reset":
+                mock.reset()
+                self._json(200, {"status": "ok"})
+                return
+            # /openai/deployments/<deployment>/<operation>
+            parts = path.strip("/").split("/", 3)
+            route = routes.get(parts[3]) if len(parts) == 4 and parts[:2] == ["openai", "deployments"] else None
+            if route is None:
+                self._json(404, {"error": {"code": "NotFound", "message": path}})
+                return
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError as e:
+                self._json(400, {"error": {"code": "BadRequest", "message": str(e)}})
+                return
+            kind, fn = route
+            status, headers, payload = fn(parts[2], body)
+            self._json(status, payload, headers)
+            mock.record_latency(kind, time.perf_counter() - t0)
+
+    return Handler
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Local mock of the Azure OpenAI chat + embeddings endpoints.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8799)
+    p.add_argument("--chat-latency", default="lognormal:900:0.35",
+                   help="Per request: fixed:MS, uniform:LO:HI or lognormal:MEDIAN:SIGMA.")
+    p.add_argument("--embed-latency", default="lognormal:150:0.3", help="Per request (same syntax).")
+    p.add_argument("--embed-item-ms", type=float, default=0.5, help="Extra latency per embeddings input.")
+    p.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with a 429.")
+    p.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with a 500/503.")
+    p.add_argument("--retry-after-ms", type=int, default=1000, help="retry-after-ms on injected 429s.")
+    p.add_argument("--rpm", type=float, default=0, help="Requests/min quota per deployment (0 = none).")
+    p.add_argument("--tpm", type=float, default=0, help="Tokens/min quota per deployment (0 = none).")
+    p.add_argument("--dimensions", type=int, default=1536, help="Vector size when the request does not set one.")
+    p.add_argument("--seed", type=int, default=0)
+    return p.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    mock = MockAzure(args.chat_latency, args.embed_latency, args.embed_item_ms, args.throttle_rate,
+                     args.error_rate, args.retry_after_ms, args.rpm, args.tpm, args.dimensions, args.seed)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock))
+    server.daemon_threads = True
+    print(f"[mock azure] listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[mock azure] {json.dumps(mock.stats())}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,440 @@
+from __future__ import annotations
+import argparse
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from chunkio import read_chunks
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # Bm25Index() raises ImportError; main() turns it into an exit message
+
+from annindex import META_FIELDS, AnnIndex, filter_mask, top_k
+
+# ─────────────────────────── Local BM25 keyword index over chunks ───────────────────────────
+# Vector search misses exact identifiers (control IDs, CVE numbers, product
+# codes) and ILIKE over documents_context does not scale. An index is a folder:
+#
+#   docs.jsonl              one line per row: file, index, heading_path, page, token_count, company, text, length
+#   deleted.bin             one byte per row, 1 = deleted or replaced
+#   seg-NNNNNN.terms.json   a segment's sorted vocabulary
+#   seg-NNNNNN.offsets.npy  int64 (terms + 1): postings of term i are [offsets[i], offsets[i + 1])
+#   seg-NNNNNN.rows.npy     uint32 row numbers, ascending within a term (memory-mapped)
+#   seg-NNNNNN.tfs.npy      uint16 term frequencies, parallel to rows
+#   index.json              k1, b, rows, live segments
+#
+# Added chunks are buffered and written as a new segment (every FLUSH_POSTINGS
+# postings and on save()), so an incremental run never rewrites what is on disk;
+# once there are more than MAX_SEGMENTS, save() merges them into one and drops
+# the postings of deleted rows. Rows past the last save() (a crash) are dropped
+# on open. As in annindex.py, a chunk for an already indexed (file, index)
+# replaces it and chunker.py --incremental delta records delete removed chunks
+# and re-key moved ones.
+#
+# hybrid_search() fuses BM25 with annindex.AnnIndex cosine scores; hits are
+# joined on (file, index), so both indexes must be built from the same chunks.
+#
+#   python chunker.py --bm25-index ./kw ...                  (or: ... | python bm25index.py build --index ./kw)
+#   python bm25index.py query --index ./kw --text "CVE-2024-3094" --ann ./idx
+
+K1 = 1.2
+B = 0.75
+FLUSH_POSTINGS = 2_000_000
+MAX_SEGMENTS = 8
+RRF_K = 60
+TF_MAX = 65_535  # term frequencies are stored as uint16
+
+# words, and identifiers joined by - _ . / : (CVE-2024-3094, AC-2, SKU_77A, 10.4.1)
+TOKEN_RE = re.compile(r"[^\W_]+(?:[-_./:][^\W_]+)*")
+PART_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms; an identifier is kept whole and also split, so an exact match outscores its parts."""
+    out: List[str] = []
+    for tok in TOKEN_RE.findall(text.lower()):
+        out.append(tok)
+        if not tok.isalnum():
+            out.extend(PART_RE.findall(tok))
+    return out
+
+
+class _Segment:
+    def __init__(self, path: Path, name: str) -> None:
+        self.name = name
+        terms = json.loads((path / f"{name}.terms.json").read_text(encoding="utf-8"))
+        self.terms: Dict[str, int] = {t: i for i, t in enumerate(terms)}
+        self.offsets = np.load(path / f"{name}.offsets.npy")
+        self.rows = np.load(path / f"{name}.rows.npy", mmap_mode="r")
+        self.tfs = np.load(path / f"{name}.tfs.npy", mmap_mode="r")
+
+    def postings(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        i = self.terms.get(term)
+        if i is None:
+            return None
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return self.rows[a:b], self.tfs[a:b]
+
+
+class Bm25Index:
+    def __init__(self, path: Path) -> None:
+        if np is None:
+            raise ImportError("bm25index.py needs numpy (pip install numpy).")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        info_path = self.path / "index.json"
+        self.info: Dict[str, Any] = (json.loads(info_path.read_text(encoding="utf-8")) if info_path.exists()
+                                     else {"version": 1, "k1": K1, "b": B, "rows": 0, "segments": [],
+                                           "next_segment": 1})
+        rows = self.info["rows"]
+        self.meta: List[Dict[str, Any]] = []
+        docs_path = self.path / "docs.jsonl"
+        if docs_path.exists():
+            with open(docs_path, encoding="utf-8") as fh:
+                self.meta = [json.loads(line) for line in fh if line.strip()]
+        if len(self.meta) > rows:  # added after the last save(): their postings were never written
+            self.meta = self.meta[:rows]
+            self._rewrite_docs()
+        deleted_path = self.path / "deleted.bin"
+        self.deleted = bytearray(deleted_path.read_bytes()[:rows] if deleted_path.exists() else b"")
+        self.deleted.extend(bytes(rows - len(self.deleted)))
+        listed = set(self.info["segments"])
+        for p in self.path.glob("seg-*"):
+            if p.name.split(".")[0] not in listed:  # left over from an interrupted save() or merge()
+                p.unlink()
+        self.segments = [_Segment(self.path, name) for name in self.info["segments"]]
+        self._pending: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._pending_postings = 0
+        self._obsolete: List[str] = []
+        self._lengths: Optional[np.ndarray] = None
+        self._moved = False  # rows were re-keyed: save() rewrites docs.jsonl
+        self._by_key: Dict[Tuple[Any, Any], int] = {}
+        for i, m in enumerate(self.meta):
+            if self.deleted[i]:
+                continue
+            old = self._by_key.get((m["file"], m["index"]))
+            if old is not None:  # replaced after the last save()
+                self.deleted[old] = 1
+            self._by_key[(m["file"], m["index"])] = i
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    # ---- storage ----
+
+    def add(self, metas: Sequence[Dict[str, Any]]) -> List[int]:
+        """Append chunks (META_FIELDS, "text" is indexed); an existing (file, index) is replaced. returns: row numbers"""
+        rows: List[int] = []
+        with open(self.path / "docs.jsonl", "a", encoding="utf-8") as fh:
+            for m in metas:
+                row = len(self.meta)
+                tokens = tokenize(m.get("text") or "")
+                rec = {k: m.get(k) for k in META_FIELDS}
+                rec["length"] = len(tokens)
+                fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                self.meta.append(rec)
+                self.deleted.append(0)
+                tfs = Counter(tokens)
+                for term, tf in tfs.items():
+                    post = self._pending.get(term)
+                    if post is None:
+                        post = self._pending[term] = ([], [])
+                    post[0].append(row)
+                    post[1].append(min(tf, TF_MAX))
+                self._pending_postings += len(tfs)
+                old = self._by_key.get((rec["file"], rec["index"]))
+                if old is not None:
+                    self.deleted[old] = 1
+                self._by_key[(rec["file"], rec["index"])] = row
+                rows.append(row)
+        self._lengths = None
+        if self._pending_postings >= FLUSH_POSTINGS:
+            self.flush()
+        return rows
+
+    def delete(self, file: str, indices: Iterable[int]) -> int:
+        n = 0
+        for i in indices:
+            row = self._by_key.pop((file, i), None)
+            if row is not None:
+                self.deleted[row] = 1
+                n += 1
+        return n
+
+    def move(self, file: str, pairs: Iterable[Sequence[int]]) -> int:
+        """Re-key (file, old) as (file, new) for each [old, new] pair (an --incremental delta's "moved")."""
+        rows = [(self._by_key.pop((file, old), None), new) for old, new in pairs]
+        n = 0
+        for row, new in rows:
+            if row is None:
+                continue
+            replaced = self._by_key.get((file, new))
+            if replaced is not None:
+                self.deleted[replaced] = 1
+            self.meta[row]["index"] = new
+            self._by_key[(file, new)] = row
+            n += 1
+        self._moved = self._moved or n > 0
+        return n
+
+    def _write_segment(self, terms: List[str], offsets: np.ndarray, rows: np.ndarray, tfs: np.ndarray) -> _Segment:
+        name = f"seg-{self.info['next_segment']:06d}"
+        self.info["next_segment"] += 1
+        np.save(self.path / f"{name}.offsets.npy", offsets.astype(np.int64))
+        np.save(self.path / f"{name}.rows.npy", rows.astype(np.uint32))
+        np.save(self.path / f"{name}.tfs.npy", tfs.astype(np.uint16))
+        (self.path / f"{name}.terms.json").write_text(json.dumps(terms, ensure_ascii=False), encoding="utf-8")
+        return _Segment(self.path, name)
+
+    def flush(self) -> None:
+        """Write the buffered postings as a new segment (listed in index.json by the next save())."""
+        if not self._pending:
+            return
+        terms = sorted(self._pending)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(self._pending[t][0]) for t in terms], out=offsets[1:])
+        n = int(offsets[-1])
+        rows = np.fromiter(chain.from_iterable(self._pending[t][0] for t in terms), dtype=np.uint32, count=n)
+        tfs = np.fromiter(chain.from_iterable(self._pending[t][1] for t in terms), dtype=np.uint16, count=n)
+        self.segments.append(self._write_segment(terms, offsets, rows, tfs))
+        self._pending, self._pending_postings = {}, 0
+
+    def merge(self) -> None:
+        """Rewrite all segments as one, without the postings of deleted rows."""
+        self.flush()
+        if not self.segments:
+            return
+        vocab = sorted(set().union(*(seg.terms for seg in self.segments)))
+        pos = {t: i for i, t in enumerate(vocab)}
+        term_ids = np.concatenate([np.repeat(np.fromiter((pos[t] for t in seg.terms), dtype=np.int64,
+                                                         count=len(seg.terms)), np.diff(seg.offsets))
+                                   for seg in self.segments])
+        rows = np.concatenate([np.asarray(seg.rows) for seg in self.segments])
+        tfs = np.concatenate([np.asarray(seg.tfs) for seg in self.segments])
+        keep = ~np.frombuffer(bytes(self.deleted), dtype=bool)[rows]
+        term_ids, rows, tfs = term_ids[keep], rows[keep], tfs[keep]
+        # segments hold ascending, disjoint row ranges, so a stable sort by term keeps rows ascending
+        order = np.argsort(term_ids, kind="stable")
+        term_ids, rows, tfs = term_ids[order], rows[order], tfs[order]
+        counts = np.bincount(term_ids, minlength=len(vocab))
+        used = np.flatnonzero(counts)
+        offsets = np.zeros(len(used) + 1, dtype=np.int64)
+        np.cumsum(counts[used], out=offsets[1:])
+        self._obsolete.extend(seg.name for seg in self.segments)
+        self.segments = [self._write_segment([vocab[i] for i in used], offsets, rows, tfs)] if len(rows) else []
+
+    def save(self) -> None:
+        self.flush()
+        if len(self.segments) > MAX_SEGMENTS:
+            self.merge()
+        tmp = self.path / "deleted.bin.tmp"
+        tmp.write_bytes(bytes(self.deleted))
+        os.replace(tmp, self.path / "deleted.bin")
+        if self._moved:
+            self._rewrite_docs()
+            self._moved = False
+        self.info["rows"] = len(self.meta)
+        self.info["segments"] = [seg.name for seg in self.segments]
+        tmp_info = self.path / "index.json.tmp"
+        tmp_info.write_text(json.dumps(self.info, indent=1) + "\n", encoding="utf-8")
+        os.replace(tmp_info, self.path / "index.json")
+        for name in self._obsolete:
+            for p in self.path.glob(f"{name}.*"):
+                p.unlink()
+        self._obsolete = []
+
+    def _rewrite_docs(self) -> None:
+        docs_path = self.path / "docs.jsonl"
+        tmp = docs_path.with_suffix(".tmp")
+        tmp.write_text("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in self.meta), encoding="utf-8")
+        os.replace(tmp, docs_path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rows": len(self.meta),
+            "live": len(self),
+            "segments": len(self.segments),
+            "postings": sum(len(seg.rows) for seg in self.segments) + self._pending_postings,
+        }
+
+    # ---- ingest chunker output ----
+
+    def add_records(self, records: Iterable[Dict[str, Any]], company: str = "", batch: int = 1024) -> Dict[str, int]:
+        """
+        Index chunker.py NDJSON records (see chunkio.read_chunks); delta records
+        delete removed chunks and re-key moved ones.
+        """
+        added = removed = 0
+        metas: List[Dict[str, Any]] = []
+        for rec in records:
+            if rec.get("type") == "delta":
+                added += len(self.add(metas))
+                metas = []
+                removed += self.delete(rec["file"], rec.get("removed", []))
+                self.move(rec["file"], rec.get("moved", []))
+                continue
+            # near-duplicates (chunker.py --dedup) are indexed too: their identifiers may differ
+            metas.append({**rec, "company": rec.get("company") or company})
+            if len(metas) >= batch:
+                added += len(self.add(metas))
+                metas = []
+        added += len(self.add(metas))
+        return {"added": added, "removed": removed, "rows": len(self)}
+
+    # ---- search ----
+
+    def search(self, queries: Sequence[str], k: int = 10,
+               filters: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+        """
+        BM25 ranking (Okapi, k1/b from index.json; df and average length over live
+        rows). returns: per query, up to k hits best first, each the row's metadata
+        plus "score" and "row".
+        """
+        self.flush()
+        live = ~np.frombuffer(bytes(self.deleted), dtype=bool)
+        mask = live & filter_mask(self.meta, filters) if filters else live
+        if self._lengths is None:
+            self._lengths = np.fromiter((m["length"] for m in self.meta), dtype=np.float32, count=len(self.meta))
+        n_live = int(live.sum())
+        avgdl = max(float(self._lengths[live].mean()) if n_live else 1.0, 1.0)
+        k1, b = self.info["k1"], self.info["b"]
+        norm = k1 * (1 - b + b * self._lengths / avgdl)
+        out: List[List[Dict[str, Any]]] = []
+        for text in queries:
+            scores = np.zeros(len(self.meta), dtype=np.float32)
+            for term in dict.fromkeys(tokenize(text)):
+                parts = [seg.postings(term) for seg in self.segments]
+                parts = [p for p in parts if p is not None]
+                if not parts:
+                    continue
+                rows = np.concatenate([r for r, _tf in parts])
+                tfs = np.concatenate([tf for _r, tf in parts]).astype(np.float32)
+                keep = live[rows]
+                rows, tfs = rows[keep], tfs[keep]
+                if not len(rows):
+                    continue
+                idf = math.log(1 + (n_live - len(rows) + 0.5) / (len(rows) + 0.5))
+                scores[rows] += idf * tfs * (k1 + 1) / (tfs + norm[rows])
+            hits = np.flatnonzero((scores > 0) & mask)
+            best, rows = top_k(scores[hits], hits, k)
+            out.append([{**self.meta[int(r)], "score": float(s), "row": int(r)} for s, r in zip(best, rows)])
+        return out
+
+
+def hybrid_search(keywords: Bm25Index, vectors: AnnIndex, texts: Sequence[str],
+                  query_vectors: Sequence[Sequence[float]], k: int = 10, alpha: float = 0.5,
+                  fusion: str = "linear", candidates: int = 50, nprobe: int = 8,
+                  filters: Optional[Dict[str, Any]] = None, exact: bool = False) -> List[List[Dict[str, Any]]]:
+    """
+    BM25 and cosine hits fused per query. Each side returns its best `candidates`
+    chunks, joined on (file, index):
+      linear  alpha × cosine (min-max scaled over the candidates) + (1 - alpha) × BM25 / best BM25
+      rrf     sum of 1 / (RRF_K + rank) over the two lists (alpha is not used)
+    returns: per query, up to k hits best first, each the chunk's metadata plus
+    "score", "bm25" and "cosine" (None where the chunk was not a candidate).
+    """
+    if fusion not in ("linear", "rrf"):
+        raise ValueError(f"unknown fusion {fusion!r}")
+    out: List[List[Dict[str, Any]]] = []
+    for kw, vec in zip(keywords.search(texts, candidates, filters),
+                       vectors.search(query_vectors, candidates, nprobe, filters, exact)):
+        fused: Dict[Tuple[Any, Any], Dict[str, Any]] = {}
+        for side, hits in (("cosine", vec), ("bm25", kw)):
+            for h in hits:
+                hit = fused.setdefault((h["file"], h["index"]),
+                                       {**{f: h.get(f) for f in META_FIELDS}, "bm25": None, "cosine": None})
+                hit[side] = h["score"]
+        if fusion == "rrf":
+            for hits in (vec, kw):
+                for rank, h in enumerate(hits, 1):
+                    hit = fused[(h["file"], h["index"])]
+                    hit["score"] = hit.get("score", 0.0) + 1 / (RRF_K + rank)
+        else:
+            best_kw = kw[0]["score"] if kw else 1.0
+            lo = min((h["score"] for h in vec), default=0.0)
+            hi = max((h["score"] for h in vec), default=0.0)
+            for hit in fused.values():
+                cos = 0.0 if hit["cosine"] is None else (hit["cosine"] - lo) / (hi - lo) if hi > lo else 1.0
+                hit["score"] = alpha * cos + (1 - alpha) * (hit["bm25"] or 0.0) / best_kw
+        out.append(sorted(fused.values(), key=lambda h: -h["score"])[:k])
+    return out
+
+
+# ─────────────────────────── CLI ───────────────────────────
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(description="Local BM25 keyword index over chunker.py chunks, with hybrid search.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="Add chunker.py --output-format ndjson records to an index.")
+    b.add_argument("--index", required=True, help="Index folder (created if missing).")
+    b.add_argument("--input", default="-", help="NDJSON file ('-' = stdin).")
+    b.add_argument("--company", default="", help="Company stored on every added chunk (for filtering).")
+    b.add_argument("--merge", action="store_true", help="Merge all segments into one after adding.")
+    q = sub.add_parser("query", help="Search the index; with --ann, fuse with an annindex.py index.")
+    q.add_argument("--index", required=True)
+    q.add_argument("--text", action="append", required=True, help="Query text; repeat for a batch.")
+    q.add_argument("--top-k", type=int, default=5)
+    q.add_argument("--company", default=None)
+    q.add_argument("--file", action="append", default=None, help="Only chunks of this file (path or name).")
+    q.add_argument("--ann", default=None,
+                   help="annindex.py folder built from the same chunks; query text is then embedded with "
+                        "chunker.py's deployment and the scores are fused.")
+    q.add_argument("--fusion", choices=["linear", "rrf"], default="linear",
+                   help="linear: weighted sum of scaled scores; rrf: reciprocal rank fusion.")
+    q.add_argument("--alpha", type=float, default=0.5, help="Weight of the vector score with --fusion linear.")
+    q.add_argument("--candidates", type=int, default=50, help="Hits taken from each side before fusing.")
+    q.add_argument("--nprobe", type=int, default=8, help="IVF lists scanned per query (see annindex.py).")
+    q.add_argument("--exact", action="store_true", help="Scan every vector.")
+    args = p.parse_args(argv)
+    if args.cmd == "query" and not 0 <= args.alpha <= 1:
+        p.error("--alpha must be between 0 and 1")
+    return args
+
+
+def main() -> None:
+    args = parse_args()
+    try:
+        index = Bm25Index(Path(args.index))
+    except ImportError as e:
+        sys.exit(str(e))
+    if args.cmd == "build":
+        fh = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+        # BM25 needs only the texts: vectors (inline or in a --vectors-npy sidecar) are not decoded
+        stats = index.add_records(read_chunks(fh, vectors=False), args.company)
+        if args.merge:
+            index.merge()
+        index.save()
+        sys.stderr.write(f"[bm25index] {json.dumps({**stats, **index.stats()})}\n")
+        return
+
+    filters: Dict[str, Any] = {}
+    if args.company is not None:
+        filters["company"] = args.company
+    if args.file:
+        filters["file"] = args.file
+    if not args.ann:
+        results = index.search(args.text, args.top_k, filters)
+    else:
+        import asyncio
+        import chunker  # Azure client for the query embeddings
+
+        ann = AnnIndex(Path(args.ann))
+        vectors = asyncio.run(chunker.embed_all(args.text, dimensions=ann.info["dims"] or chunker.EMBED_DIMENSIONS))
+        results = hybrid_search(index, ann, args.text, vectors, args.top_k, args.alpha, args.fusion,
+                                args.candidates, args.nprobe, filters, args.exact)
+    for text, hits in zip(args.text, results):
+        for hit in hits:
+            print(json.dumps({"query": text, **hit}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
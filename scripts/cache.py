@@ -0,0 +1,133 @@
+from __future__ import annotations
+import hashlib
+import os
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# ─────────────────────────── Content-addressed on-disk LRU cache ───────────────────────────
+# One SQLite file per cache. Keys are content hashes (see content_key), values
+# are opaque bytes. Total value size is capped; least recently used entries are
+# evicted first. Safe to share between processes (WAL mode; the size total is
+# re-read from disk before each eviction pass).
+
+DEFAULT_CACHE_DIR = Path(os.getenv("N8N_C3_CACHE_DIR")
+                         or Path.home() / ".cache" / "c3")
+
+
+def content_key(*parts: str | bytes) -> str:
+    """sha256 over the given parts, NUL-separated so ("ab", "c") != ("a", "bc")"""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8") if isinstance(part, str) else part)
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class LRUCache:
+    def __init__(self, path: Path, max_bytes: int) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max(0, int(max_bytes))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # one cache object is only used by one job at a time, but that job may hop
+        # between a worker thread and an event-loop thread (see worker.py)
+        self._db = sqlite3.connect(
+            str(self.path), timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self._db.commit()
+
+    # ---- reads ----
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        wanted = list(dict.fromkeys(keys))
+        found: Dict[str, bytes] = {}
+        # stay well below SQLite's host-parameter limit
+        for i in range(0, len(wanted), 500):
+            part = wanted[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT key, value FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            found.update({k: bytes(v) for k, v in rows})
+        if found:
+            now = time.time()
+            self._db.executemany("UPDATE entries SET accessed = ? WHERE key = ?",
+                                 [(now, k) for k in found])
+            self._db.commit()
+        self.hits += len(found)
+        self.misses += len(wanted) - len(found)
+        return found
+
+    # ---- writes ----
+
+    def put(self, key: str, value: bytes) -> None:
+        self.put_many([(key, value)])
+
+    def put_many(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        now = time.time()
+        rows = [(k, sqlite3.Binary(v), len(v), now) for k, v in items]
+        if not rows:
+            return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO entries(key, value, size, accessed) VALUES (?, ?, ?, ?)", rows)
+        self._db.commit()
+        self._evict()
+
+    def delete(self, keys: Iterable[str]) -> int:
+        cur = self._db.executemany(
+            "DELETE FROM entries WHERE key = ?", [(k,) for k in keys])
+        self._db.commit()
+        return cur.rowcount
+
+    def clear(self) -> None:
+        self._db.execute("DELETE FROM entries")
+        self._db.commit()
+        self._db.execute("VACUUM")
+
+    def _evict(self) -> None:
+        total = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims: List[str] = []
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed ASC"):
+            if total <= self.max_bytes:
+                break
+            victims.append(key)
+            total -= size
+        self._db.executemany("DELETE FROM entries WHERE key = ?",
+                             [(k,) for k in victims])
+        self._db.commit()
+        self.evictions += len(victims)
+
+    # ---- bookkeeping ----
+
+    def stats(self) -> Dict[str, int]:
+        entries, total = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total,
+        }
+
+    def close(self) -> None:
+        self._db.close()
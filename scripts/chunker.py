@@ -1,21 +1,45 @@
 from __future__ import annotations
 from pathlib import Path
-from typing import List, Tuple, Dict, Any
+from typing import TYPE_CHECKING, List, Tuple, Dict, Any, Callable, Coroutine, Iterable, Optional, Sequence, Set, TextIO
+import argparse
+import asyncio
 import re
 import sys
 import os
 import json
-from openai import AzureOpenAI
+from array import array
+from bisect import bisect_left, bisect_right
 from dotenv import load_dotenv
 
+from cache import DEFAULT_CACHE_DIR, LRUCache, content_key
+from chunkio import QUANT_MODES, NdjsonChunkWriter
+from embedder import embed_texts, batch_stats
+from manifest import CHUNK_MANIFEST, Manifest, diff_chunks
+from metrics import add_arguments as add_metrics_arguments, begin_run, count, log, span
+from metrics import report as report_metrics
+from neardup import NearDupIndex
+from scheduler import INTERACTIVE, PRIORITIES, Scheduler, get_scheduler
+
+if TYPE_CHECKING:
+    from openai import AsyncAzureOpenAI  # imported on first use: it dominates start-up time
+    from bm25index import Bm25Index  # needs numpy; only with --bm25-index
+
 # Load environment variables
 load_dotenv()
 
 # Config
 # minimum characters per chunk (except for the initial root/preface)
 MIN_CHARS = 800
+# maximum tokens per chunk (text-embedding-3-small accepts 8191); larger sections are split
+MAX_TOKENS = 6000
+# tokens repeated from the end of one split piece at the start of the next
+OVERLAP_TOKENS = 200
 
 HDR_RE = re.compile(r"^(#{1,6})\s+(.*\S)\s*$")
+# page markers written by extract.py for PDFs
+PAGE_RE = re.compile(r"^<!-- page: (\d+) -->[ \t]*\n?", re.MULTILINE)
+# table markers written by extract.py before each CSV block (header line + N row lines)
+TABLE_RE = re.compile(r"^<!-- table: (\d+) rows -->[ \t]*\n(?=```csv\n)", re.MULTILINE)
 
 # Initialize Azure OpenAI client
 AZURE_OPENAI_ENDPOINT = (os.getenv("AZURE_OPENAI_ENDPOINT") or "").rstrip("/")
@@ -23,15 +47,106 @@ AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_OPENAI_VERSION = os.getenv("AZURE_OPENAI_VERSION")
 # This is the deployment name in Azure
 AZURE_EMBEDDING_DEPLOYMENT = "text-embedding-3-small"
-
-if not (AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY and AZURE_OPENAI_VERSION):
-    sys.exit("Missing Azure config. Set AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_OPENAI_VERSION.")
-
-client = AzureOpenAI(
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_OPENAI_VERSION,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-)
+AZURE_EMBEDDING_DIMENSIONS = 1536
+# vector size requested from the model (text-embedding-3 shortens natively; ≤ AZURE_EMBEDDING_DIMENSIONS)
+EMBED_DIMENSIONS = int(os.getenv("N8N_C3_EMBED_DIMENSIONS") or AZURE_EMBEDDING_DIMENSIONS)
+# client-side budgets for the deployment (0 = none; AIMD + rate-limit headers still apply)
+EMBED_RPM = int(os.getenv("N8N_C3_EMBED_RPM") or 0)
+EMBED_TPM = int(os.getenv("N8N_C3_EMBED_TPM") or 0)
+
+_aclient: Optional[AsyncAzureOpenAI] = None
+
+
+def azure_client() -> AsyncAzureOpenAI:
+    """The shared Azure OpenAI client, created on first use (fully cached runs never need it)."""
+    global _aclient
+    if _aclient is None:
+        if not (AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY and AZURE_OPENAI_VERSION):
+            sys.exit("Missing Azure config. Set AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_OPENAI_VERSION.")
+        from openai import AsyncAzureOpenAI
+
+        _aclient = AsyncAzureOpenAI(
+            api_key=AZURE_OPENAI_API_KEY,
+            api_version=AZURE_OPENAI_VERSION,
+            azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            max_retries=0,  # scheduler.Scheduler retries, so it sees every 429
+        )
+    return _aclient
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Markdown → heading-based chunks with Azure embeddings (batched, concurrent).")
+    p.add_argument("--root", default="out",
+                   help="Folder scanned recursively for *.md (default: ./out)")
+    p.add_argument("--batch-size", type=int, default=64,
+                   help="Max inputs per embeddings request.")
+    p.add_argument("--batch-tokens", type=int, default=60_000,
+                   help="Max estimated tokens per embeddings request.")
+    p.add_argument("--concurrency", type=int, default=4,
+                   help="Max concurrent embeddings requests (lowered automatically on 429s).")
+    p.add_argument("--rpm", type=int, default=EMBED_RPM,
+                   help="Requests/min budget for the deployment (default: $N8N_C3_EMBED_RPM, 0 = none).")
+    p.add_argument("--tpm", type=int, default=EMBED_TPM,
+                   help="Tokens/min budget for the deployment (default: $N8N_C3_EMBED_TPM, 0 = none).")
+    p.add_argument("--priority", choices=sorted(PRIORITIES), default="interactive",
+                   help="Queue position against other jobs sharing the deployment (backfill waits).")
+    p.add_argument("--retries", type=int, default=3,
+                   help="Attempts per batch on 429/5xx and connection errors (a batch Azure rejects "
+                        "as invalid is split in half instead).")
+    p.add_argument("--cache", default=str(DEFAULT_CACHE_DIR / "embeddings.sqlite"),
+                   help="Embedding cache file (SQLite, content-addressed).")
+    p.add_argument("--cache-max-mb", type=int, default=1024,
+                   help="Cache size cap; least recently used entries are evicted.")
+    p.add_argument("--no-cache", action="store_true",
+                   help="Always call the embeddings API.")
+    p.add_argument("--max-tokens", type=int, default=MAX_TOKENS,
+                   help="Split sections larger than this at paragraph/sentence boundaries.")
+    p.add_argument("--overlap-tokens", type=int, default=OVERLAP_TOKENS,
+                   help="Overlap between consecutive pieces of a split section.")
+    p.add_argument("--max-chunks", type=int, default=0,
+                   help="Keep only the first N chunks of each file (0 = all); truncation is logged.")
+    p.add_argument("--tokenizer", choices=["chars", "tiktoken"], default="chars",
+                   help="Token counter: chars (≈4 chars/token) or tiktoken cl100k_base (optional package).")
+    p.add_argument("--output-format", choices=["text", "ndjson"], default="text",
+                   help="text: human-readable blocks; ndjson: one JSON record per chunk with packed float32 vectors.")
+    p.add_argument("--vectors-npy", default=None,
+                   help="With --output-format ndjson: write vectors to this .npy instead of inline base64.")
+    p.add_argument("--dimensions", type=int, default=EMBED_DIMENSIONS,
+                   help=f"Embedding size requested from the model (default: $N8N_C3_EMBED_DIMENSIONS or "
+                        f"{AZURE_EMBEDDING_DIMENSIONS}).")
+    p.add_argument("--quantize", choices=QUANT_MODES, default="none",
+                   help="With --output-format ndjson: store vectors as float16, int8 (+ per-vector scale) "
+                        "or sign bits instead of float32.")
+    p.add_argument("--dedup", action="store_true",
+                   help="Embed near-duplicate chunks (MinHash/LSH over word 5-grams) once; later copies are "
+                        "emitted with a reference to the first and no embedding.")
+    p.add_argument("--dedup-threshold", type=float, default=0.8,
+                   help="Estimated Jaccard similarity at which two chunks count as duplicates.")
+    p.add_argument("--dedup-scope", choices=["global", "company"], default="global",
+                   help="global: across the whole run; company: only within the same first-level "
+                        "folder under --root (e.g. extract.py --out out/<company>).")
+    p.add_argument("--bm25-index", default=None,
+                   help="Also add the emitted chunks to this local BM25 keyword index folder (see bm25index.py; "
+                        "needs numpy).")
+    p.add_argument("--bm25-company", default="",
+                   help="Company stored on chunks added to --bm25-index (for filtering).")
+    p.add_argument("--incremental", action="store_true",
+                   help="Only embed and emit chunks that changed since the last run, each file preceded by "
+                        "a delta (added/changed/removed chunk indices); state kept in --manifest.")
+    p.add_argument("--manifest", default=None,
+                   help=f"Per-chunk hash manifest for --incremental (default: <root>/{CHUNK_MANIFEST}).")
+    add_metrics_arguments(p)
+    args = p.parse_args(argv)
+    if not 1 <= args.dimensions <= AZURE_EMBEDDING_DIMENSIONS:
+        p.error(f"--dimensions must be between 1 and {AZURE_EMBEDDING_DIMENSIONS}")
+    if args.max_chunks < 0:
+        p.error("--max-chunks must be >= 0")
+    if not 0 < args.dedup_threshold <= 1:
+        p.error("--dedup-threshold must be in (0, 1]")
+    if args.quantize != "none" and (args.output_format != "ndjson" or args.vectors_npy):
+        p.error("--quantize needs --output-format ndjson with inline vectors (no --vectors-npy)")
+    return args
 
 
 def read_markdown(p: Path) -> str:
@@ -91,6 +206,7 @@ def build_sections(md_text: str, headings: List[Tuple[int, int, int, str]]) -> L
     # Maintain a stack for heading path
     # Each heading defines a new section starting at its char_start
     stack: List[Tuple[int, str]] = []  # (level, title)
+    lines = md_text.splitlines(keepends=True)
     for idx, (line_idx, ch_start, level, title) in enumerate(headings):
         # Update stack to reflect current heading level
         while stack and stack[-1][0] >= level:
@@ -105,7 +221,7 @@ def build_sections(md_text: str, headings: List[Tuple[int, int, int, str]]) -> L
             end_char = total_len
 
         # Heading line text (exact)
-        heading_line = md_text.splitlines(keepends=True)[line_idx].rstrip("\n")
+        heading_line = lines[line_idx].rstrip("\n")
 
         sections.append(dict(
             start_char=ch_start,
@@ -153,36 +269,195 @@ def merge_short_sections(md_text: str, sections: List[Dict[str, Any]], min_chars
     return merged
 
 
-def slice_text(md_text: str, start_char: int, end_char: int) -> str:
-    return md_text[start_char:end_char]
+PARA_END_RE = re.compile(r"\n[ \t]*\n+")
+SENT_END_RE = re.compile(r"[.!?][\"')\]]*\s+")
+NONSPACE_RE = re.compile(r"\S")
 
 
-def generate_embedding(text: str) -> List[float]:
-    """Generate embedding using Azure OpenAI API with 1536 dimensions"""
-    sys.stderr.write(
-        f"[EMBEDDING] Starting embedding generation for text length: {len(text)}\n")
-    sys.stderr.write(f"[EMBEDDING] First 100 chars: {text[:100]}\n")
-    sys.stderr.write(
-        f"[EMBEDDING] Using deployment: {AZURE_EMBEDDING_DEPLOYMENT}\n")
-    sys.stderr.write(f"[EMBEDDING] Endpoint: {AZURE_OPENAI_ENDPOINT}\n")
+def _last_fitting(md_text: str, start: int, points: Sequence[int], max_tokens: int,
+                  count_tokens: Callable[[str], int]) -> Optional[int]:
+    """Largest p in points (ascending, all > start) with count(md_text[start:p]) <= max_tokens."""
+    lo, hi, best = 0, len(points) - 1, None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if count_tokens(md_text[start:points[mid]]) <= max_tokens:
+            best = points[mid]
+            lo = mid + 1
+        else:
+            hi = mid - 1
+    return best
+
+
+def _first_fitting_tail(md_text: str, points: List[int], end: int, max_tokens: int,
+                        count_tokens: Callable[[str], int]) -> Optional[int]:
+    """Smallest p in points (ascending, all < end) with count(md_text[p:end]) <= max_tokens."""
+    lo, hi, best = 0, len(points) - 1, None
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        if count_tokens(md_text[points[mid]:end]) <= max_tokens:
+            best = points[mid]
+            hi = mid - 1
+        else:
+            lo = mid + 1
+    return best
 
-    try:
-        sys.stderr.write(f"[EMBEDDING] Calling Azure OpenAI API...\n")
-        response = client.embeddings.create(
-            model=AZURE_EMBEDDING_DEPLOYMENT,  # This is the deployment name
-            input=text
-        )
-        sys.stderr.write(f"[EMBEDDING] API call successful\n")
-        embedding = response.data[0].embedding
-        sys.stderr.write(
-            f"[EMBEDDING] Received embedding with {len(embedding)} dimensions\n")
-        sys.stderr.write(f"[EMBEDDING] First 5 values: {embedding[:5]}\n")
-        return embedding if embedding else []
-    except Exception as e:
-        sys.stderr.write(f"[EMBEDDING] ERROR: {type(e).__name__}: {str(e)}\n")
-        import traceback
-        sys.stderr.write(f"[EMBEDDING] Traceback:\n{traceback.format_exc()}\n")
-        return []
+
+def _between(points: List[int], lo: int, hi: int) -> List[int]:
+    return points[bisect_right(points, lo):bisect_left(points, hi)]
+
+
+def split_oversized_sections(md_text: str, sections: List[Dict[str, Any]], max_tokens: int,
+                             overlap_tokens: int, count_tokens: Callable[[str], int]) -> List[Dict[str, Any]]:
+    """
+    Split any section above max_tokens into pieces that fit, cutting at the last
+    paragraph boundary that fits (if that fills half the budget), else sentence,
+    else line, else mid-text.
+    Consecutive pieces overlap by up to overlap_tokens (starting on a sentence or
+    line boundary). Pieces keep the section's heading_path / heading_line.
+    """
+    max_tokens = max(1, max_tokens)
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens // 2))
+    out: List[Dict[str, Any]] = []
+    for sec in sections:
+        start, end = sec["start_char"], sec["end_char"]
+        if count_tokens(md_text[start:end]) <= max_tokens:
+            out.append(sec)
+            continue
+
+        body = md_text[start:end]
+        paras = [start + m.end() for m in PARA_END_RE.finditer(body)]
+        sents = sorted(set(paras).union(start + m.end() for m in SENT_END_RE.finditer(body)))
+        lines = sorted(set(sents).union(start + m.end() for m in re.finditer("\n", body)))
+
+        pos = start
+        while count_tokens(md_text[pos:end]) > max_tokens:
+            # coarsest boundary that still fills at least half the budget, else the fullest one
+            cut = None
+            for points in (paras, sents, lines):
+                c = _last_fitting(md_text, pos, _between(points, pos, end),
+                                  max_tokens, count_tokens)
+                if c is not None and (cut is None or c > cut):
+                    cut = c
+                if cut is not None and count_tokens(md_text[pos:cut]) >= max_tokens // 2:
+                    break
+            if cut is None:
+                # no boundary fits: hard cut at the longest prefix that does (a range
+                # bisects like a list without materialising every offset)
+                cut = _last_fitting(md_text, pos, range(pos + 1, end),
+                                    max_tokens, count_tokens) or pos + 1
+            out.append(dict(sec, start_char=pos, end_char=cut))
+
+            # next piece starts at the earliest boundary whose tail fits in the overlap budget
+            nxt = None
+            if overlap_tokens:
+                nxt = _first_fitting_tail(md_text, _between(sents, pos, cut) or _between(lines, pos, cut),
+                                          cut, overlap_tokens, count_tokens)
+            pos = nxt or cut
+        out.append(dict(sec, start_char=pos, end_char=end))
+    return out
+
+
+def find_tables(md_text: str) -> List[Dict[str, Any]]:
+    """
+    CSV tables marked by extract.py: marker start, header line end, end of each
+    row line, and end of the closing fence. Rows are one line each, so no CSV
+    parsing is needed; a marker whose row count does not match is ignored.
+    """
+    tables: List[Dict[str, Any]] = []
+    for m in TABLE_RE.finditer(md_text):
+        pos = md_text.index("\n", m.end()) + 1  # past ```csv
+        ends: List[int] = []
+        for _ in range(int(m.group(1)) + 1):  # header + rows
+            nl = md_text.find("\n", pos)
+            if nl < 0:
+                break
+            pos = nl + 1
+            ends.append(pos)
+        if len(ends) != int(m.group(1)) + 1 or md_text[pos:pos + 4].rstrip() != "```":
+            continue
+        nl = md_text.find("\n", pos)
+        tables.append({"start": m.start(), "header_end": ends[0], "row_ends": ends[1:],
+                       "end": len(md_text) if nl < 0 else nl + 1})
+    return tables
+
+
+def split_tables(md_text: str, sections: List[Dict[str, Any]], tables: List[Dict[str, Any]],
+                 headed: List[Dict[str, Any]], max_tokens: int,
+                 count_tokens: Callable[[str], int]) -> List[Dict[str, Any]]:
+    """
+    Split CSV tables larger than max_tokens into row groups. Each group is a
+    piece whose text starts with the table's ```csv line and header row
+    ("table_prefix", added by chunk_text), so every chunk can be read on its own.
+    Headings come from headed (the sections before merge_short_sections): groups
+    take the heading of the table's own section, and the text around tables
+    becomes separate pieces under the heading of the section each piece starts
+    in. A heading line right above a table goes with its groups, not with the
+    text before it.
+    """
+    starts = [h["start_char"] for h in headed]
+    table_starts = [t["start"] for t in tables]
+
+    def _owner(pos: int) -> Dict[str, Any]:
+        m = NONSPACE_RE.search(md_text, pos)
+        return headed[max(0, bisect_right(starts, m.start() if m else pos) - 1)]
+
+    def _under(sec: Dict[str, Any], owner: Dict[str, Any], start: int, end: int) -> Dict[str, Any]:
+        return dict(sec, start_char=start, end_char=end, heading_line=owner["heading_line"],
+                    heading_path=owner["heading_path"], is_root=owner["is_root"])
+
+    out: List[Dict[str, Any]] = []
+
+    def _text(sec: Dict[str, Any], start: int, end: int) -> None:
+        owner = _owner(start)
+        body = PAGE_RE.sub("", md_text[start:end]).strip()
+        if body and body != owner["heading_line"].strip():
+            out.append(_under(sec, owner, start, end))
+
+    for sec in sections:
+        start, end = sec["start_char"], sec["end_char"]
+        big = [t for t in tables[bisect_left(table_starts, start):bisect_left(table_starts, end)]
+               if t["end"] <= end and count_tokens(md_text[t["start"]:t["end"]]) > max_tokens]
+        if not big:
+            out.append(sec)
+            continue
+        pos = start
+        for t in big:
+            owner = headed[max(0, bisect_right(starts, t["start"]) - 1)]
+            cut = owner["start_char"] if pos < owner["start_char"] < t["start"] else t["start"]
+            _text(sec, pos, cut)
+            _text(sec, cut, t["start"])
+            out.extend(_row_groups(md_text, _under(sec, owner, t["start"], t["end"]), t, max_tokens, count_tokens))
+            pos = t["end"]
+        _text(sec, pos, end)
+    return out
+
+
+def _row_groups(md_text: str, sec: Dict[str, Any], table: Dict[str, Any],
+                max_tokens: int, count_tokens: Callable[[str], int]) -> List[Dict[str, Any]]:
+    header_start = md_text.rindex("\n", 0, table["header_end"] - 1) + 1
+    prefix = "```csv\n" + md_text[header_start:table["header_end"]]
+    head = ("" if sec["is_root"] else sec["heading_line"] + "\n") + prefix
+    budget = max(1, max_tokens - count_tokens(head + "```"))
+    rows = list(zip([table["header_end"]] + table["row_ends"][:-1], table["row_ends"]))
+    sizes = [count_tokens(md_text[a:b]) for a, b in rows]
+    groups: List[Dict[str, Any]] = []
+    i = 0
+    while i < len(rows):
+        j, used = i + 1, sizes[i]
+        while j < len(rows) and used + sizes[j] <= budget:
+            used += sizes[j]
+            j += 1
+        # per-row counts need not add up to the count of the joined rows; shrink until it fits
+        while j - i > 1:
+            over = count_tokens(head + md_text[rows[i][0]:rows[j - 1][1]] + "```") - max_tokens
+            if over <= 0:
+                break
+            j -= max(1, min(j - i - 1, over * (j - i) // max(1, used)))
+        # slices end before the newline so balance_fences closes the fence directly
+        end = table["end"] if j == len(rows) else rows[j - 1][1] - 1
+        groups.append(dict(sec, start_char=rows[i][0], end_char=end, table_prefix=prefix))
+        i = j
+    return groups
 
 
 def estimate_tokens(text: str) -> int:
@@ -190,82 +465,524 @@ def estimate_tokens(text: str) -> int:
     return max(1, len(text) // 4)
 
 
-def print_chunk(f: Path, idx: int, section: Dict[str, Any], text: str) -> None:
-    sys.stderr.write(f"\n[CHUNK {idx}] Starting processing\n")
-    hp = section["heading_path"]
-    page = None  # markdown has no inherent page info
+def get_token_counter(name: str) -> Callable[[str], int]:
+    if name == "tiktoken":
+        try:
+            import tiktoken
+        except ImportError:
+            sys.exit("--tokenizer tiktoken needs the tiktoken package (pip install tiktoken).")
+        enc = tiktoken.get_encoding("cl100k_base")
+        return lambda text: max(1, len(enc.encode(text, disallowed_special=())))
+    return estimate_tokens
+
+
+def slice_text(md_text: str, start_char: int, end_char: int) -> str:
+    return md_text[start_char:end_char]
+
+
+def find_pages(md_text: str) -> Tuple[List[int], List[int]]:
+    """Page markers as parallel lists (char positions ascending, page numbers)."""
+    starts: List[int] = []
+    pages: List[int] = []
+    for m in PAGE_RE.finditer(md_text):
+        starts.append(m.start())
+        pages.append(int(m.group(1)))
+    return starts, pages
+
+
+def page_at(marks: Tuple[List[int], List[int]], pos: int) -> Optional[int]:
+    """Page a character position falls on (None without markers)."""
+    starts, pages = marks
+    if not pages:
+        return None
+    i = bisect_right(starts, pos) - 1
+    return pages[max(i, 0)]
+
+
+def embedding_cache_key(text: str, dimensions: int = EMBED_DIMENSIONS) -> str:
+    return content_key(AZURE_EMBEDDING_DEPLOYMENT, str(dimensions), text)
+
+
+def _pack(vec: List[float]) -> bytes:
+    return array("d", vec).tobytes()
+
 
-    # Calculate token count from the ORIGINAL text before any modifications
-    token_count = estimate_tokens(text)
-    sys.stderr.write(
-        f"[CHUNK {idx}] Original text length: {len(text)}, token_count: {token_count}\n")
+def _unpack(blob: bytes) -> List[float]:
+    return array("d", blob).tolist()
 
-    # Ensure heading line is present at the top of the chunk text (for non-root),
-    # but avoid duplicating if the slice already begins with that exact heading line.
-    out_text = text
+
+def embedding_scheduler(concurrency: int = 4, rpm: int = EMBED_RPM, tpm: int = EMBED_TPM) -> Scheduler:
+    return get_scheduler(f"embed:{AZURE_EMBEDDING_DEPLOYMENT}", concurrency, rpm, tpm)
+
+
+async def embed_all(texts: List[str], batch_size: int = 64, batch_tokens: int = 60_000,
+                    concurrency: int = 4, retries: int = 3, cache: Optional[LRUCache] = None,
+                    scheduler: Optional[Scheduler] = None, priority: int = INTERACTIVE,
+                    dimensions: int = EMBED_DIMENSIONS,
+                    count_tokens: Callable[[str], int] = estimate_tokens) -> List[List[float]]:
+    """
+    Embed many texts with batched, concurrent Azure OpenAI calls (dimensions per vector).
+    Batches are sized with count_tokens (pass get_token_counter(--tokenizer)).
+    Texts already in the cache (or repeated within this call) are not sent to the API.
+    Calls go through the process-wide embeddings scheduler unless one is given.
+    """
+    keys = [embedding_cache_key(t, dimensions) for t in texts]
+    cached = cache.get_many(keys) if cache else {}
+    out: List[List[float]] = [_unpack(cached[k]) if k in cached else [] for k in keys]
+
+    # one API input per distinct missing text
+    first_idx: Dict[str, int] = {}
+    for i, k in enumerate(keys):
+        if k not in cached:
+            first_idx.setdefault(k, i)
+    todo = list(first_idx.values())
+    count("embed_cache_hits", len(cached))
+    count("embed_inputs", len(todo))
+
+    with span("embed", sum(len(texts[i].encode("utf-8")) for i in todo)):
+        fresh = await embed_texts(
+            azure_client() if todo else None, AZURE_EMBEDDING_DEPLOYMENT, [texts[i] for i in todo], count_tokens,
+            batch_size=batch_size, batch_tokens=batch_tokens,
+            concurrency=concurrency, retries=retries,
+            scheduler=scheduler or embedding_scheduler(concurrency), priority=priority,
+            dimensions=dimensions if dimensions != AZURE_EMBEDDING_DIMENSIONS else None,
+        )
+    by_key = {keys[i]: vec for i, vec in zip(todo, fresh)}
+    for i, k in enumerate(keys):
+        if k in by_key:
+            out[i] = by_key[k]
+
+    if cache:
+        cache.put_many([(k, _pack(v)) for k, v in by_key.items() if v])
+        log.debug(f"[EMBEDDING] cache {json.dumps(cache.stats())}")
+    log.info(f"[EMBEDDING] {json.dumps(batch_stats(texts, out))}")
+    return out
+
+
+def generate_embedding(text: str) -> List[float]:
+    """Generate a single embedding (see embed_all for the batched path)"""
+    return asyncio.run(embed_all([text]))[0]
+
+
+def chunk_text(section: Dict[str, Any], text: str) -> str:
+    """
+    Ensure heading line is present at the top of the chunk text (for non-root),
+    but avoid duplicating if the slice already begins with that exact heading line.
+    """
+    out_text = section.get("table_prefix", "") + text
     if not section["is_root"]:
-        sys.stderr.write(f"[CHUNK {idx}] Non-root section, checking heading\n")
         # Compare the first non-empty line
         first_line = out_text.splitlines()[0] if out_text.splitlines() else ""
         if first_line.strip() != section["heading_line"].strip():
             # Prepend the exact heading line
-            sys.stderr.write(
-                f"[CHUNK {idx}] Prepending heading: {section['heading_line'][:50]}\n")
             out_text = section["heading_line"] + "\n" + out_text
+    return out_text
 
-    sys.stderr.write(f"[CHUNK {idx}] Final text length: {len(out_text)}\n")
 
-    # Generate embedding from the FINAL text (with heading prepended if needed)
-    sys.stderr.write(f"[CHUNK {idx}] Calling generate_embedding...\n")
-    embedding = generate_embedding(out_text)
-    sys.stderr.write(
-        f"[CHUNK {idx}] Embedding returned: {len(embedding)} dimensions\n")
+def balance_fences(out_text: str) -> str:
+    body = out_text
+    if body.count("```") % 2 != 0:
+        body += "\n```"
+    return body.rstrip()
 
-    if not embedding:
-        sys.stderr.write(f"[CHUNK {idx}] SKIPPING - Empty embedding\n")
+
+def print_chunk(f: Path, idx: int, section: Dict[str, Any], text: str, out_text: str, embedding: List[float],
+                out: TextIO = sys.stdout, writer: Optional[NdjsonChunkWriter] = None) -> None:
+    hp = section["heading_path"]
+    page = section.get("page")  # from extract.py page markers (PDFs only)
+    dup = section.get("duplicate_of")  # set by mark_duplicates
+
+    # Token count of the ORIGINAL text before any modifications (set by chunk_markdown)
+    token_count = section.get("token_count") or estimate_tokens(text)
+    log.debug(f"[CHUNK {idx}] Original text length: {len(text)}, token_count: {token_count}, "
+              f"final text length: {len(out_text)}, embedding: {len(embedding)} dimensions")
+
+    if dup:
+        count("chunks_duplicate")
+    elif not embedding:
+        log.warning(f"[CHUNK {idx}] {f.name}: SKIPPING - Empty embedding")
+        count("chunks_dropped")
         return
+    else:
+        count("chunks_emitted")
 
-    sys.stderr.write(f"[CHUNK {idx}] Wrapping in markdown fence\n")
+    if writer is not None:
+        writer.write(f, idx, hp, page, token_count,
+                     balance_fences(out_text), embedding, dup)
+        return
 
-    sys.stderr.write(f"[CHUNK {idx}] Wrapping in markdown fence\n")
     # Wrap in a markdown fence (balanced)
-    body = out_text
-    if body.count("```") % 2 != 0:
-        body += "\n```"
-    body = "```markdown\n" + body.rstrip() + "\n```"
-
-    sys.stderr.write(f"[CHUNK {idx}] Printing output\n")
-    print(f"\n[# {idx}]")
-    print(f"meta.file: {f}")
-    print(f"meta.heading_path: {' > '.join(hp)}")
-    print(f"meta.page: {page}")
-    print(f"meta.token_count: {token_count}")
+    body = "```markdown\n" + balance_fences(out_text) + "\n```"
+
+    print(f"\n[# {idx}]", file=out)
+    print(f"meta.file: {f}", file=out)
+    print(f"meta.heading_path: {' > '.join(hp)}", file=out)
+    print(f"meta.page: {page}", file=out)
+    print(f"meta.token_count: {token_count}", file=out)
+    if dup:
+        print(f"meta.duplicate_of: {dup['file']} #{dup['index']}", file=out)
     # Format embedding as PostgreSQL vector: [val1,val2,...]
     embedding_str = "[" + ",".join(str(x) for x in embedding) + "]"
-    print(f"meta.embedding: {embedding_str}")
-    print(body)
-    sys.stderr.write(f"[CHUNK {idx}] COMPLETE\n")
+    print(f"meta.embedding: {embedding_str}", file=out)
+    print(body, file=out, flush=True)
 
 
-def main() -> None:
-    root = Path("out").resolve()
+Chunk = Tuple[Dict[str, Any], str, str]  # (section, original slice, final text)
+
+
+def chunk_file(f: Path, max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS,
+               count_tokens: Callable[[str], int] = estimate_tokens, max_chunks: int = 0) -> List[Chunk]:
+    return chunk_markdown(read_markdown(f), max_tokens, overlap_tokens, count_tokens, max_chunks, f.name)
+
+
+def chunk_markdown(md_text: str, max_tokens: int = MAX_TOKENS, overlap_tokens: int = OVERLAP_TOKENS,
+                   count_tokens: Callable[[str], int] = estimate_tokens, max_chunks: int = 0,
+                   name: str = "") -> List[Chunk]:
+    """max_chunks: keep only the first N chunks (0 = all); truncation is logged as a warning."""
+    with span("section", len(md_text.encode("utf-8"))):
+        headings = find_headings(md_text)
+        headed = build_sections(md_text, headings)
+        sections = merge_short_sections(md_text, headed, MIN_CHARS)
+        tables = find_tables(md_text)
+        if tables:
+            sections = split_tables(md_text, sections, tables, headed, max_tokens, count_tokens)
+        sections = split_oversized_sections(
+            md_text, sections, max_tokens, overlap_tokens, count_tokens)
+
+        marks = find_pages(md_text)
+        if marks[0]:
+            # a page marker alone (e.g. before the first heading) is not a chunk
+            sections = [sec for sec in sections
+                        if PAGE_RE.sub("", md_text[sec["start_char"]:sec["end_char"]]).strip()]
+        chunks: List[Chunk] = []
+        if max_chunks and len(sections) > max_chunks:
+            log.warning(f"[CHUNKER] {name or 'document'}: {len(sections)} chunks, keeping the first "
+                        f"{max_chunks} (--max-chunks)")
+            count("sections_truncated", len(sections) - max_chunks)
+            sections = sections[:max_chunks]
+        for sec in sections:
+            text_slice = slice_text(md_text, sec["start_char"], sec["end_char"])
+            sec["page"] = page_at(marks, sec["start_char"])
+            if marks[0]:
+                text_slice = PAGE_RE.sub("", text_slice)
+            if tables:
+                text_slice = TABLE_RE.sub("", text_slice)
+            sec["token_count"] = count_tokens(text_slice)
+            chunks.append((sec, text_slice, chunk_text(sec, text_slice)))
+        return chunks
+
+
+def emit_file(f: Path, chunks: List[Chunk], embeddings: List[List[float]], out: TextIO = sys.stdout,
+              writer: Optional[NdjsonChunkWriter] = None, indices: Optional[List[int]] = None,
+              delta: Optional[Dict[str, List[Any]]] = None) -> None:
+    """indices: chunk numbers when only some of a file's chunks are emitted (default 1..n)."""
+    if writer is None:
+        print(f"\n=== {f} ===", file=out)
+        if delta is not None:
+            print(f"meta.delta: {json.dumps(delta)}", file=out, flush=True)
+    elif delta is not None:
+        writer.write_delta(f, delta)
+    if indices is None:
+        indices = list(range(1, len(chunks) + 1))
+    with span("emit", sum(len(c[2].encode("utf-8")) for c in chunks)):
+        for i, (sec, text_slice, out_text), embedding in zip(indices, chunks, embeddings):
+            print_chunk(f, i, sec, text_slice, out_text, embedding, out, writer)
+
+
+# ─────────────────────────── Near-duplicate chunks ───────────────────────────
+
+
+def open_dedup(args: argparse.Namespace) -> Optional[NearDupIndex]:
+    return NearDupIndex(args.dedup_threshold) if args.dedup else None
+
+
+def dedup_group(root: Path, f: Path, scope: str) -> str:
+    return f.relative_to(root).parts[0] if scope == "company" else ""
+
+
+def seed_duplicates(dedup: NearDupIndex, root: Path, f: Path, chunks: List[Chunk], scope: str,
+                    indices: List[int]) -> None:
+    """--incremental: chunks kept from earlier runs are embedded already, so they are the representatives."""
+    group = dedup_group(root, f, scope)
+    for i, (_s, _t, out_text) in zip(indices, chunks):
+        dedup.add((str(f), i), out_text, group)
+
+
+def mark_duplicates(dedup: NearDupIndex, root: Path, f: Path, chunks: List[Chunk], scope: str,
+                    indices: Optional[List[int]] = None) -> int:
+    """
+    Set section["duplicate_of"] = {"file", "index"} on chunks that repeat an
+    earlier chunk of the run (see neardup.py); returns how many were marked.
+    """
+    group = dedup_group(root, f, scope)
+    marked = 0
+    for i, (sec, _t, out_text) in zip(indices or range(1, len(chunks) + 1), chunks):
+        rep = dedup.check((str(f), i), out_text, group)
+        if rep is not None:
+            sec["duplicate_of"] = {"file": rep[0], "index": rep[1]}
+            marked += 1
+    return marked
+
+
+async def embed_chunks(chunks: List[Chunk], *args: Any, **kwargs: Any) -> List[List[float]]:
+    """embed_all over the chunks' final texts; chunks marked as duplicates are not sent and get []."""
+    todo = [i for i, (sec, _t, _o) in enumerate(chunks) if not sec.get("duplicate_of")]
+    fresh = await embed_all([chunks[i][2] for i in todo], *args, **kwargs)
+    out: List[List[float]] = [[] for _ in chunks]
+    for i, vec in zip(todo, fresh):
+        out[i] = vec
+    return out
+
+
+def promote_duplicates(keys: List[Tuple[str, int]], chunks: List[Chunk], failed: Set[Tuple[str, int]]) -> List[int]:
+    """
+    Duplicates of a representative in failed (not embedded): the first copy takes
+    its place and the other copies point to it. returns: positions of the promoted chunks
+    """
+    promoted: Dict[Tuple[str, int], Tuple[str, int]] = {}
+    todo: List[int] = []
+    for pos, (key, (sec, _t, _o)) in enumerate(zip(keys, chunks)):
+        dup = sec.get("duplicate_of")
+        if not dup or (dup["file"], dup["index"]) not in failed:
+            continue
+        rep = promoted.get((dup["file"], dup["index"]))
+        if rep is None:
+            promoted[(dup["file"], dup["index"])] = key
+            del sec["duplicate_of"]
+            todo.append(pos)
+        else:
+            sec["duplicate_of"] = {"file": rep[0], "index": rep[1]}
+    return todo
+
+
+async def embed_promoted(chunks: List[Chunk], keys: List[Tuple[str, int]], embeddings: List[List[float]],
+                         failed: Set[Tuple[str, int]], *args: Any, **kwargs: Any) -> None:
+    """
+    After embed_chunks: every duplicate whose representative was not embedded
+    (in failed, or one of chunks with an empty embedding) is re-pointed by
+    promote_duplicates and the promoted copies embedded (embed_all arguments),
+    until each duplicate refers to a chunk that has a vector. embeddings is
+    updated in place; failed gains the keys of chunks that were not embedded.
+    """
+    while True:
+        failed.update(key for key, (sec, _t, _o), vec in zip(keys, chunks, embeddings)
+                      if not vec and not sec.get("duplicate_of"))
+        todo = promote_duplicates(keys, chunks, failed)
+        if not todo:
+            return
+        count("duplicates_promoted", len(todo))
+        fresh = await embed_all([chunks[pos][2] for pos in todo], *args, **kwargs)
+        for pos, vec in zip(todo, fresh):
+            embeddings[pos] = vec
+
+
+# ─────────────────────────── Keyword index ───────────────────────────
+
+
+def open_bm25(args: argparse.Namespace) -> Optional[Bm25Index]:
+    if not args.bm25_index:
+        return None
+    from bm25index import Bm25Index
+
+    try:
+        return Bm25Index(Path(args.bm25_index))
+    except ImportError as e:
+        sys.exit(f"--bm25-index: {e}")
+
+
+def index_keywords(keywords: Bm25Index, f: Path, chunks: List[Chunk], embeddings: List[List[float]],
+                   indices: Optional[List[int]] = None, delta: Optional[Dict[str, List[Any]]] = None,
+                   company: str = "") -> None:
+    """
+    Add emitted chunks to the --bm25-index under the same (file, index) as the
+    NDJSON records; chunks removed by an --incremental delta are deleted and
+    moved ones re-keyed. Duplicates are indexed too (their identifiers may
+    differ); dropped chunks are not.
+    """
+    if delta is not None:
+        keywords.delete(str(f), delta["removed"])
+        keywords.move(str(f), delta["moved"])
+    records = [{"file": str(f), "index": i, "heading_path": sec["heading_path"], "page": sec.get("page"),
+                "token_count": sec.get("token_count"), "company": company, "text": balance_fences(out_text)}
+               for i, (sec, _t, out_text), embedding in zip(indices or range(1, len(chunks) + 1), chunks, embeddings)
+               if embedding or sec.get("duplicate_of")]
+    with span("bm25", sum(len(r["text"].encode("utf-8")) for r in records)):
+        keywords.add(records)
+
+
+# ─────────────────────────── Incremental runs ───────────────────────────
+
+
+def chunk_options_key(args: argparse.Namespace) -> str:
+    """Anything that changes chunk boundaries or vectors; a different key re-embeds the whole file."""
+    return content_key(AZURE_EMBEDDING_DEPLOYMENT, str(args.dimensions), str(MIN_CHARS),
+                       str(args.max_tokens), str(args.overlap_tokens), args.tokenizer, args.quantize)
+
+
+def open_manifest(args: argparse.Namespace) -> Optional[Manifest]:
+    if not args.incremental:
+        return None
+    return Manifest(Path(args.manifest) if args.manifest else Path(args.root).resolve() / CHUNK_MANIFEST)
+
+
+def plan_incremental(manifest: Manifest, key: str, chunks: List[Chunk],
+                     options: str) -> Tuple[List[Chunk], List[int], Dict[str, List[Any]], List[str]]:
+    """
+    Compare a file's chunks with the manifest entry.
+    returns: (chunks to embed, their 1-based indices, delta, hashes of all current chunks)
+    """
+    entry = manifest.get(key)
+    old: List[Optional[str]] = list(entry["chunks"]) if entry else []
+    if entry and entry.get("options") != options:
+        old = [None] * len(old)
+    hashes = [content_key(out_text) for _s, _t, out_text in chunks]
+    delta = diff_chunks(old, hashes)
+    todo = sorted(delta["added"] + delta["changed"])
+    return [chunks[i - 1] for i in todo], todo, delta, hashes
+
+
+def kept_indices(delta: Dict[str, List[Any]]) -> List[int]:
+    """Chunks a delta keeps from earlier runs (unchanged or moved), by their new index."""
+    return sorted(delta["unchanged"] + [new for _old, new in delta["moved"]])
+
+
+def record_incremental(manifest: Manifest, key: str, hashes: List[str], indices: List[int],
+                       chunks: List[Chunk], embeddings: List[List[float]], options: str) -> None:
+    # chunks whose embedding failed are not recorded, so the next run processes
+    # them again; duplicates were emitted (as references) and are recorded
+    done: List[Optional[str]] = list(hashes)
+    for i, (sec, _t, _o), embedding in zip(indices, chunks, embeddings):
+        if not embedding and not sec.get("duplicate_of"):
+            done[i - 1] = None
+    manifest.set(key, {"options": options, "chunks": done})
+
+
+def remove_files(manifest: Manifest, root: Path, keys: Iterable[str], out: TextIO = sys.stdout,
+                 writer: Optional[NdjsonChunkWriter] = None, keywords: Optional[Bm25Index] = None) -> None:
+    """Emit a delta removing every chunk of each file that is gone, and forget the files."""
+    for key in sorted(keys):
+        entry = manifest.get(key)
+        if entry is None:
+            continue
+        delta = diff_chunks([None] * len(entry["chunks"]), [])
+        emit_file(root / key, [], [], out, writer, [], delta)
+        if keywords is not None:
+            index_keywords(keywords, root / key, [], [], [], delta)
+        manifest.remove(key)
+
+
+def open_writer(args: argparse.Namespace, out: TextIO) -> Optional[NdjsonChunkWriter]:
+    if args.output_format != "ndjson":
+        return None
+    return NdjsonChunkWriter(out, Path(args.vectors_npy) if args.vectors_npy else None, args.quantize)
+
+
+def open_cache(args: argparse.Namespace) -> Optional[LRUCache]:
+    if args.no_cache:
+        return None
+    return LRUCache(Path(args.cache), args.cache_max_mb * 1024 * 1024)
+
+
+def run(args: argparse.Namespace, out: TextIO = sys.stdout,
+        run_async: Callable[[Coroutine[Any, Any, Any]], Any] = asyncio.run) -> None:
+    begin_run(args.log_level)
+    root = Path(args.root).resolve()
     md_files = sorted(root.rglob("*.md"))
     if not md_files:
-        print("No markdown files found under ./out")
+        print(f"No markdown files found under ./{args.root}", file=out)
         return
 
-    for f in md_files:
-        md_text = read_markdown(f)
-        headings = find_headings(md_text)
-        sections = build_sections(md_text, headings)
-        sections = merge_short_sections(md_text, sections, MIN_CHARS)
-
-        print(f"\n=== {f} ===")
-        # Print first 10 chunks
-        for i, sec in enumerate(sections[:10], start=1):
-            text_slice = slice_text(
-                md_text, sec["start_char"], sec["end_char"])
-            print_chunk(f, i, sec, text_slice)
+    # 1) Section every file; embedding texts are the FINAL chunk texts (heading prepended)
+    count_tokens = get_token_counter(args.tokenizer)
+    per_file = [(f, chunk_file(f, args.max_tokens, args.overlap_tokens, count_tokens, args.max_chunks))
+                for f in md_files]
+
+    # 1b) Incremental: keep only chunks whose text changed since the recorded run
+    manifest = open_manifest(args)
+    options = chunk_options_key(args)
+    plans: Dict[Path, Tuple[List[int], Dict[str, List[Any]], List[str]]] = {}
+    all_chunks = dict(per_file)
+    if manifest:
+        todo_per_file = []
+        for f, chunks in per_file:
+            todo, indices, delta, hashes = plan_incremental(
+                manifest, str(f.relative_to(root)), chunks, options)
+            plans[f] = (indices, delta, hashes)
+            todo_per_file.append((f, todo))
+        per_file = todo_per_file
+        log.info("[incremental] {} file(s), {} chunk(s) to embed, {} unchanged or moved".format(
+            len(md_files), sum(len(c) for _f, c in per_file),
+            sum(len(kept_indices(p[1])) for p in plans.values())))
+
+    # 1c) Near-duplicates across the run: only the first copy is embedded
+    dedup = open_dedup(args)
+    if dedup:
+        for f, chunks in all_chunks.items() if manifest else ():
+            kept = kept_indices(plans[f][1])
+            seed_duplicates(dedup, root, f, [chunks[i - 1] for i in kept], args.dedup_scope, kept)
+        for f, chunks in per_file:
+            mark_duplicates(dedup, root, f, chunks, args.dedup_scope, plans[f][0] if manifest else None)
+        log.info(f"[dedup] {json.dumps(dedup.stats())}")
+    todo_chunks = [c for _f, chunks in per_file for c in chunks]
+    todo_keys = [(str(f), i) for f, chunks in per_file
+                 for i in (plans[f][0] if manifest else range(1, len(chunks) + 1))]
+
+    # 2) Embed everything in batched, concurrent requests (cache first)
+    cache = open_cache(args)
+    scheduler = embedding_scheduler(args.concurrency, args.rpm, args.tpm)
+    try:
+        embed_args = (args.batch_size, args.batch_tokens, args.concurrency, args.retries, cache,
+                      scheduler, PRIORITIES[args.priority], args.dimensions, count_tokens)
+
+        async def _embed() -> List[List[float]]:
+            vecs = await embed_chunks(todo_chunks, *embed_args)
+            if dedup:
+                # a copy stands in for a representative whose embedding failed
+                await embed_promoted(todo_chunks, todo_keys, vecs, set(), *embed_args)
+            return vecs
+
+        embeddings = run_async(_embed())
+    finally:
+        if cache:
+            cache.close()
+        log.info(f"[scheduler] {json.dumps(scheduler.stats())}")
+
+    # 3) Print in document order
+    writer = open_writer(args, out)
+    keywords = open_bm25(args)
+    try:
+        pos = 0
+        for f, chunks in per_file:
+            file_embeddings = embeddings[pos:pos + len(chunks)]
+            pos += len(chunks)
+            if manifest is None:
+                emit_file(f, chunks, file_embeddings, out, writer)
+                if keywords is not None:
+                    index_keywords(keywords, f, chunks, file_embeddings, company=args.bm25_company)
+                continue
+            indices, delta, hashes = plans[f]
+            emit_file(f, chunks, file_embeddings, out, writer, indices, delta)
+            if keywords is not None:
+                index_keywords(keywords, f, chunks, file_embeddings, indices, delta, args.bm25_company)
+            record_incremental(manifest, str(f.relative_to(root)), hashes, indices, chunks, file_embeddings,
+                               options)
+
+        if manifest:
+            # files that disappeared since the last run: every chunk is removed
+            current = {str(f.relative_to(root)) for f in md_files}
+            remove_files(manifest, root, set(manifest.entries) - current, out, writer, keywords)
+            manifest.save()
+    finally:
+        if writer:
+            writer.close()
+        if keywords is not None:
+            keywords.save()
+            log.info(f"[bm25] {json.dumps(keywords.stats())}")
+        report_metrics("chunker", args.metrics_json, args.metrics_prom, files=len(md_files))
+
+
+def main() -> None:
+    run(parse_args())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,282 @@
+from __future__ import annotations
+import ast
+import base64
+import json
+import mmap
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, TextIO
+
+# ─────────────────────────── Machine-readable chunk output ───────────────────────────
+# NDJSON, one record per chunk:
+#   {"file": ..., "index": 1, "heading_path": [...], "page": null, "token_count": 123,
+#    "text": "...", "dims": 1536, "quant": "none", "embedding_b64": "<float32 little-endian, base64>"}
+# or, with a sidecar vectors file, "vector_row": <row in the .npy> instead of
+# "embedding_b64". The .npy is written incrementally (no numpy needed) and can be
+# memory-mapped by numpy.load(..., mmap_mode="r") or read back with NpyRows.
+#
+# With chunker.py --dedup, a near-duplicate of an earlier chunk has no vector
+# fields, only a reference to the chunk that was embedded:
+#   {"file": ..., "index": 7, ..., "text": "...", "dims": 0, "duplicate_of": {"file": ..., "index": 3}}
+#
+# With chunker.py --incremental, each file's chunks are preceded by a delta record
+# (chunk indices relative to the previous run; only added/changed chunks follow).
+# Apply it as: delete removed, re-key each moved [old, new] pair, then write the chunks:
+#   {"type": "delta", "file": ..., "added": [...], "changed": [...], "removed": [...], "unchanged": [...],
+#    "moved": [[old, new], ...]}
+#
+# "quant" says how embedding_b64 is encoded (read_chunks decodes all of them to floats):
+#   none     float32 little-endian (4 bytes/dim)
+#   float16  IEEE half little-endian (2 bytes/dim; pgvector halfvec)
+#   int8     round(x / scale), one signed byte per dim, with the record's "scale" (max |x| / 127)
+#   binary   sign bits, most significant bit first (1 bit/dim; pgvector bit); decodes to ±1.0
+
+_NPY_MAGIC = b"\x93NUMPY\x01\x00"
+_NPY_HEADER_LEN = 118  # magic(8) + len(2) + 118 = 128 bytes, 64-byte aligned
+
+QUANT_MODES = ("none", "float16", "int8", "binary")
+
+
+def pack_f32(vec: List[float]) -> str:
+    a = array("f", vec)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return base64.b64encode(a.tobytes()).decode("ascii")
+
+
+def unpack_f32(b64: str) -> List[float]:
+    a = array("f")
+    a.frombytes(base64.b64decode(b64))
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a.tolist()
+
+
+def sign_bits(vec: List[float]) -> bytes:
+    """1 bit per dimension (x > 0), most significant bit first, zero-padded to whole bytes."""
+    out = bytearray((len(vec) + 7) // 8)
+    for i, x in enumerate(vec):
+        if x > 0:
+            out[i >> 3] |= 0x80 >> (i & 7)
+    return bytes(out)
+
+
+def quantize(vec: List[float], mode: str) -> Dict[str, Any]:
+    """Record fields ("quant", "embedding_b64", and "scale" for int8) for one vector."""
+    if mode == "none":
+        return {"quant": mode, "embedding_b64": pack_f32(vec)}
+    if mode == "float16":
+        data = struct.pack(f"<{len(vec)}e", *vec)
+        return {"quant": mode, "embedding_b64": base64.b64encode(data).decode("ascii")}
+    if mode == "int8":
+        scale = max((abs(x) for x in vec), default=0.0) / 127 or 1.0
+        data = array("b", [max(-127, min(127, round(x / scale))) for x in vec]).tobytes()
+        return {"quant": mode, "scale": scale, "embedding_b64": base64.b64encode(data).decode("ascii")}
+    if mode == "binary":
+        return {"quant": mode, "embedding_b64": base64.b64encode(sign_bits(vec)).decode("ascii")}
+    raise ValueError(f"unknown quantization {mode!r} (expected one of {', '.join(QUANT_MODES)})")
+
+
+def dequantize(rec: Dict[str, Any]) -> List[float]:
+    """Floats back from a record's embedding_b64 (lossy for everything but "none")."""
+    mode = rec.get("quant", "none")
+    if mode == "none":
+        return unpack_f32(rec["embedding_b64"])
+    data = base64.b64decode(rec["embedding_b64"])
+    if mode == "float16":
+        return list(struct.unpack(f"<{len(data) // 2}e", data))
+    if mode == "int8":
+        scale = rec["scale"]
+        return [q * scale for q in array("b", data)]
+    if mode == "binary":
+        return [1.0 if data[i >> 3] & (0x80 >> (i & 7)) else -1.0 for i in range(rec["dims"])]
+    raise ValueError(f"unknown quantization {mode!r}")
+
+
+class NpyWriter:
+    """
+    Appends float32 rows to a .npy file; the shape in the header is patched on close().
+    append=True continues a file this class wrote earlier instead of truncating it.
+    """
+
+    def __init__(self, path: Path, append: bool = False) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.rows = 0
+        self.dims = 0
+        if append and self.path.exists():
+            existing = NpyRows(self.path)
+            offset = existing._offset
+            self.rows, self.dims = existing.rows, existing.dims
+            existing.close()
+            if offset != 10 + _NPY_HEADER_LEN:
+                raise ValueError(f"{self.path}: header not written by NpyWriter, cannot append")
+            self._fh: IO[bytes] = open(self.path, "r+b")
+            self._fh.seek(offset + self.rows * self.dims * 4)
+            self._fh.truncate()  # drop a partial row left by an interrupted write
+        else:
+            self._fh = open(self.path, "wb")
+            self._fh.write(self._header(0, 0))
+
+    @staticmethod
+    def _header(rows: int, dims: int) -> bytes:
+        d = f"{{'descr': '<f4', 'fortran_order': False, 'shape': ({rows}, {dims}), }}"
+        return _NPY_MAGIC + struct.pack("<H", _NPY_HEADER_LEN) + d.ljust(_NPY_HEADER_LEN - 1).encode("latin1") + b"\n"
+
+    def append(self, vec: List[float]) -> int:
+        if not self.dims:
+            self.dims = len(vec)
+        if len(vec) != self.dims:
+            raise ValueError(f"vector has {len(vec)} dims, file has {self.dims}")
+        a = array("f", vec)
+        if sys.byteorder != "little":
+            a.byteswap()
+        self._fh.write(a.tobytes())
+        self.rows += 1
+        return self.rows - 1
+
+    def append_raw(self, data: bytes, dims: int) -> int:
+        """Append whole rows already encoded as little-endian float32; returns the first row number."""
+        if not self.dims:
+            self.dims = dims
+        if dims != self.dims or len(data) % (4 * dims):
+            raise ValueError(f"expected rows of {self.dims} float32 values")
+        first = self.rows
+        self._fh.write(data)
+        self.rows += len(data) // (4 * dims)
+        return first
+
+    def truncate(self, rows: int) -> None:
+        """Drop rows past the first rows (e.g. ones whose metadata was never written)."""
+        if rows < self.rows:
+            self._fh.seek(10 + _NPY_HEADER_LEN + rows * self.dims * 4)
+            self._fh.truncate()
+            self.rows = rows
+
+    def flush(self) -> None:
+        """Make the rows written so far readable (header patched, file position kept)."""
+        pos = self._fh.tell()
+        self._fh.seek(0)
+        self._fh.write(self._header(self.rows, self.dims))
+        self._fh.seek(pos)
+        self._fh.flush()
+
+    def close(self) -> None:
+        self._fh.seek(0)
+        self._fh.write(self._header(self.rows, self.dims))
+        self._fh.close()
+
+
+class NpyRows:
+    """Memory-mapped row access to a 2-D little-endian float32 .npy file."""
+
+    def __init__(self, path: Path) -> None:
+        self._fh = open(path, "rb")
+        magic = self._fh.read(8)
+        if magic[:6] != _NPY_MAGIC[:6]:
+            raise ValueError(f"{path} is not a .npy file")
+        if magic[6] == 1:
+            (hlen,) = struct.unpack("<H", self._fh.read(2))
+            offset = 10 + hlen
+        else:
+            (hlen,) = struct.unpack("<I", self._fh.read(4))
+            offset = 12 + hlen
+        header = ast.literal_eval(self._fh.read(hlen).decode("latin1"))
+        if header["descr"] != "<f4" or header["fortran_order"]:
+            raise ValueError(f"{path}: expected C-ordered <f4, got {header}")
+        self.rows, self.dims = header["shape"]
+        self._offset = offset
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if self.rows else None
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def row(self, i: int) -> List[float]:
+        if not 0 <= i < self.rows or self._mm is None:
+            raise IndexError(i)
+        start = self._offset + i * self.dims * 4
+        a = array("f")
+        a.frombytes(self._mm[start:start + self.dims * 4])
+        if sys.byteorder != "little":
+            a.byteswap()
+        return a.tolist()
+
+    def close(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+        self._fh.close()
+
+
+class NdjsonChunkWriter:
+    def __init__(self, out: TextIO, vectors_path: Optional[Path] = None, quant: str = "none") -> None:
+        if quant not in QUANT_MODES:
+            raise ValueError(f"unknown quantization {quant!r}")
+        if vectors_path and quant != "none":
+            raise ValueError("the .npy sidecar holds float32 rows; quantized vectors are written inline")
+        self.out = out
+        self.quant = quant
+        self.vectors = NpyWriter(vectors_path) if vectors_path else None
+
+    def write(self, f: Path, idx: int, heading_path: List[str], page: Any, token_count: int,
+              text: str, embedding: List[float], duplicate_of: Optional[Dict[str, Any]] = None) -> None:
+        rec: Dict[str, Any] = {
+            "file": str(f),
+            "index": idx,
+            "heading_path": heading_path,
+            "page": page,
+            "token_count": token_count,
+            "text": text,
+            "dims": len(embedding),
+        }
+        if duplicate_of:
+            rec["duplicate_of"] = duplicate_of
+        elif self.vectors is not None:
+            rec["quant"] = "none"
+            rec["vector_row"] = self.vectors.append(embedding)
+        else:
+            rec.update(quantize(embedding, self.quant))
+        self.out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self.out.flush()
+
+    def write_delta(self, f: Path, delta: Dict[str, List[Any]]) -> None:
+        self.out.write(json.dumps(dict(type="delta", file=str(f), **delta)) + "\n")
+        self.out.flush()
+
+    def close(self) -> None:
+        if self.vectors is not None:
+            self.vectors.close()
+
+
+def read_chunks(lines: Iterable[str], vectors_path: Optional[Path] = None,
+                vectors: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Stream chunk records back from NDJSON lines (e.g. an open file or a pipe),
+    one at a time; each chunk record gets an "embedding" list (dequantized for
+    records written with a "quant" mode; the mode stays on the record). Delta records
+    ("type": "delta") are passed through unchanged. Non-JSON lines are skipped.
+    vectors=False leaves records as written (no "embedding", no sidecar needed)
+    for readers that only want the text and metadata.
+    """
+    rows = NpyRows(vectors_path) if vectors_path and vectors else None
+    try:
+        for line in lines:
+            line = line.strip()
+            if not line.startswith("{"):
+                continue
+            rec = json.loads(line)
+            if not vectors:
+                yield rec
+                continue
+            if "embedding_b64" in rec:
+                rec["embedding"] = dequantize(rec)
+                del rec["embedding_b64"]
+            elif "vector_row" in rec:
+                if rows is None:
+                    raise ValueError("record references vector_row but no vectors file was given")
+                rec["embedding"] = rows.row(rec["vector_row"])
+            yield rec
+    finally:
+        if rows is not None:
+            rows.close()
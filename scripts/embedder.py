@@ -0,0 +1,129 @@
+from __future__ import annotations
+import asyncio
+import json
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from metrics import log
+from scheduler import INTERACTIVE, RetryableError, Scheduler, is_transient
+
+# ─────────────────────────── Batched async embeddings ───────────────────────────
+# The embeddings endpoint accepts a list of inputs, so chunks are packed into
+# batches bounded by item count and an (estimated) token budget, several batches
+# run at once (paced by a scheduler.Scheduler), and results are mapped back to
+# the caller's order.
+
+# statuses one bad input can cause (invalid or too long); worth halving the batch for
+INPUT_ERROR_STATUS = (400, 413, 422)
+
+
+def plan_batches(texts: Sequence[str], max_items: int, max_tokens: int,
+                 count_tokens: Callable[[str], int]) -> List[List[int]]:
+    """
+    Greedily pack text indices into batches of at most max_items inputs and
+    max_tokens estimated tokens. A single text larger than max_tokens still
+    gets its own batch (the API decides whether it fits).
+    """
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    cur_tokens = 0
+    for i, text in enumerate(texts):
+        n = count_tokens(text)
+        if cur and (len(cur) >= max_items or cur_tokens + n > max_tokens):
+            batches.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(i)
+        cur_tokens += n
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+async def _create_with_retry(aclient, model: str, scheduler: Scheduler, texts: List[str], tokens: int,
+                             retries: int, priority: int, dimensions: Optional[int]) -> List[List[float]]:
+    def _parse(raw: Any) -> List[List[float]]:
+        data = sorted(raw.parse().data, key=lambda d: d.index)
+        if len(data) != len(texts):
+            raise RetryableError(
+                f"expected {len(texts)} embeddings, got {len(data)}")
+        return [list(d.embedding) for d in data]
+
+    extra = {"dimensions": dimensions} if dimensions else {}
+    return await scheduler.call(
+        lambda: aclient.embeddings.with_raw_response.create(model=model, input=texts, **extra),
+        tokens=tokens, priority=priority, retries=retries, parse=_parse)
+
+
+async def _embed_batch(aclient, model: str, scheduler: Scheduler, texts: List[str], count_tokens: Callable[[str], int],
+                       retries: int, priority: int, dimensions: Optional[int]) -> List[List[float]]:
+    """
+    Embed one batch; if an input is rejected (INPUT_ERROR_STATUS), split it in half
+    and embed each half separately so one bad input cannot sink its neighbours.
+    A single rejected input, or a batch still throttled/unreachable after retries,
+    gets empty vectors (the caller skips them). Any other error (auth, unknown
+    deployment, client config) is raised: every other batch would fail the same way.
+    """
+    try:
+        return await _create_with_retry(aclient, model, scheduler, texts,
+                                        sum(count_tokens(t) for t in texts), retries, priority, dimensions)
+    except Exception as e:
+        status = getattr(e, "status_code", None)
+        if status not in INPUT_ERROR_STATUS and not is_transient(e):
+            raise
+        if status in INPUT_ERROR_STATUS and len(texts) > 1:
+            mid = len(texts) // 2
+            left, right = await asyncio.gather(
+                _embed_batch(aclient, model, scheduler, texts[:mid], count_tokens, retries, priority, dimensions),
+                _embed_batch(aclient, model, scheduler, texts[mid:], count_tokens, retries, priority, dimensions),
+            )
+            return left + right
+        try:
+            detail = e.response.json()  # type: ignore[attr-defined]
+        except Exception:
+            detail = {"message": str(e)}
+        log.error(f"[embedding error] {status or type(e).__name__} {json.dumps(detail)[:800]}")
+        return [[] for _ in texts]
+
+
+async def embed_texts(
+    aclient,
+    model: str,
+    texts: Sequence[str],
+    count_tokens: Callable[[str], int],
+    batch_size: int = 64,
+    batch_tokens: int = 60_000,
+    concurrency: int = 4,
+    retries: int = 3,
+    scheduler: Optional[Scheduler] = None,
+    priority: int = INTERACTIVE,
+    dimensions: Optional[int] = None,
+) -> List[List[float]]:
+    """
+    concurrency only applies without a shared scheduler (a private one is made).
+    dimensions: ask the model for shorter vectors (text-embedding-3 models; None = model default).
+    returns: one embedding per input text, in input order ([] for failures)
+    """
+    out: List[List[float]] = [[] for _ in texts]
+    if not texts:
+        return out
+
+    if scheduler is None:
+        scheduler = Scheduler(model, max(1, concurrency))
+    batches = plan_batches(texts, max(1, batch_size),
+                           max(1, batch_tokens), count_tokens)
+
+    async def _run(idxs: List[int]) -> None:
+        vecs = await _embed_batch(aclient, model, scheduler, [texts[i] for i in idxs],
+                                  count_tokens, retries, priority, dimensions)
+        for i, vec in zip(idxs, vecs):
+            out[i] = vec
+
+    await asyncio.gather(*(_run(b) for b in batches))
+    return out
+
+
+def batch_stats(texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> Dict[str, int]:
+    return {
+        "inputs": len(texts),
+        "embedded": sum(1 for e in embeddings if e),
+        "failed": sum(1 for e in embeddings if not e),
+    }
@@ -1,27 +1,42 @@
 from __future__ import annotations
-from openai import AsyncAzureOpenAI
-import requests
 import argparse
 import os
+import shutil
 import re
 import sys
+import time
 import json
 import io
 import base64
 import asyncio
-import random
 import csv
+import contextvars
+import multiprocessing as mp
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Coroutine, Dict, Iterator, List, Optional, TextIO, Tuple
 
 from dotenv import load_dotenv
-from PIL import Image
-from openai import AsyncAzureOpenAI, APIError
 
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-from docling_core.types.doc import ImageRefMode
+from cache import DEFAULT_CACHE_DIR, LRUCache, content_key
+from manifest import EXTRACT_MANIFEST, Manifest, file_sha256
+from metrics import add_arguments as add_metrics_arguments, begin_run, count, current, log, span
+from metrics import report as report_metrics
+from scheduler import INTERACTIVE, PRIORITIES, RetryableError, Scheduler, get_scheduler
+from imagefilter import (DECORATIVE_LABEL, ImageInfo, filter_report, group_near_duplicates,
+                         inspect_image, is_decorative, merge_reports)
+
+# docling, Pillow and the OpenAI SDK take seconds to import; they are imported
+# where they are used, so --help, runs without --describe-images and DOCX/PPTX
+# batches do not pay for the parts they never touch.
+if TYPE_CHECKING:
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import DocumentConverter
+    from docling_core.types.doc import ImageRefMode
+    from openai import AsyncAzureOpenAI
 
 # ─────────────────────────── Azure OpenAI client ───────────────────────────
 
@@ -32,20 +47,35 @@ AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
 AZURE_OPENAI_VERSION = os.getenv("AZURE_OPENAI_VERSION")
 
 AZURE_MODEL_FOR_DESCRIPTION = "gpt-5-nano"  # hardcoded
+# client-side budgets for the deployment (0 = none; AIMD + rate-limit headers still apply)
+CAPTION_RPM = int(os.getenv("N8N_C3_CAPTION_RPM") or 0)
+CAPTION_TPM = int(os.getenv("N8N_C3_CAPTION_TPM") or 0)
+# tokens charged against the TPM budget per description (prompt + image + answer)
+CAPTION_TOKEN_ESTIMATE = 2000
 
-if not (AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY and AZURE_OPENAI_VERSION):
-    sys.exit("Missing Azure config. Set AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_OPENAI_VERSION.")
+_aclient: Optional[AsyncAzureOpenAI] = None
 
-aclient = AsyncAzureOpenAI(
-    api_key=AZURE_OPENAI_API_KEY,
-    api_version=AZURE_OPENAI_VERSION,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT,
-)
+
+def azure_client() -> AsyncAzureOpenAI:
+    """The shared Azure OpenAI client, created on first use (only image descriptions need it)."""
+    global _aclient
+    if _aclient is None:
+        if not (AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY and AZURE_OPENAI_VERSION):
+            sys.exit("Missing Azure config. Set AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_OPENAI_VERSION.")
+        from openai import AsyncAzureOpenAI
+
+        _aclient = AsyncAzureOpenAI(
+            api_key=AZURE_OPENAI_API_KEY,
+            api_version=AZURE_OPENAI_VERSION,
+            azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            max_retries=0,  # scheduler.Scheduler retries, so it sees every 429
+        )
+    return _aclient
 
 # ─────────────────────────── CLI ───────────────────────────
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     p = argparse.ArgumentParser(
         description="Docling → Markdown; inline CSV tables; Azure (gpt-5-nano) image descriptions in parallel."
     )
@@ -57,32 +87,520 @@ def parse_args() -> argparse.Namespace:
         "--image-mode", choices=["referenced", "embedded"], default="referenced")
     p.add_argument("--describe-images", action="store_true",
                    help="Replace images/placeholders with full textual descriptions.")
+    p.add_argument("--image-max-px", type=int, default=2048,
+                   help="Downscale images so the longest side is at most this before upload (0 = keep).")
+    p.add_argument("--image-format", choices=sorted(IMAGE_FORMATS), default="png",
+                   help="Upload encoding; jpeg/webp are much smaller and faster to encode than png.")
+    p.add_argument("--image-quality", type=int, default=85,
+                   help="JPEG/WebP quality.")
+    p.add_argument("--encode-workers", type=int, default=4,
+                   help="Threads decoding/encoding images for description.")
+    p.add_argument("--decorative-min-px", type=int, default=24,
+                   help="Images with a shorter side below this are labelled decorative, not described.")
+    p.add_argument("--decorative-min-entropy", type=float, default=1.0,
+                   help="Images with grey-level entropy (bits, 0-8) below this are labelled decorative.")
+    p.add_argument("--dedup-distance", type=int, default=3,
+                   help="Describe near-duplicate images (dHash within this many bits) once per document; -1 = off.")
+    p.add_argument("--no-image-filter", action="store_true",
+                   help="Describe every image: no decorative labels, no near-duplicate grouping.")
     p.add_argument("--concurrency", type=int, default=10,
-                   help="Max concurrent image descriptions.")
-    return p.parse_args()
+                   help="Max concurrent image descriptions (lowered automatically on 429s).")
+    p.add_argument("--rpm", type=int, default=CAPTION_RPM,
+                   help="Requests/min budget for the description deployment (default: $N8N_C3_CAPTION_RPM, 0 = none).")
+    p.add_argument("--tpm", type=int, default=CAPTION_TPM,
+                   help="Tokens/min budget for the description deployment (default: $N8N_C3_CAPTION_TPM, 0 = none).")
+    p.add_argument("--priority", choices=sorted(PRIORITIES), default="interactive",
+                   help="Queue position against other jobs sharing the deployment (backfill waits).")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Convert files in N processes (one converter each); 1 = in-process.")
+    p.add_argument("--profile", choices=list(CONVERSION_PROFILES), default=DEFAULT_PROFILE,
+                   help="Conversion profile: fast (no OCR), balanced (OCR only for scanned PDFs, "
+                        "no page images), full (OCR + page images everywhere).")
+    p.add_argument("--shard-pages", type=int, default=0,
+                   help="Convert PDFs longer than this as page-range shards (in parallel with --workers) "
+                        "and stitch them; 0 = never.")
+    p.add_argument("--worker-max-mb", type=int, default=0,
+                   help="Resident-memory cap per conversion process in MB (0 = unlimited). A worker that "
+                        "passes it fails only the file it was converting. Leave at least twice an idle "
+                        "worker's size (the docling models; a warning is logged when it is lower).")
+    p.add_argument("--image-cache", default=str(DEFAULT_CACHE_DIR / "image_descriptions.sqlite"),
+                   help="Image description cache file (SQLite, keyed by pixel hash + prompt + model).")
+    p.add_argument("--image-cache-max-mb", type=int, default=256,
+                   help="Cache size cap; least recently used entries are evicted.")
+    p.add_argument("--no-image-cache", action="store_true",
+                   help="Neither read nor write the image description cache.")
+    p.add_argument("--refresh-image-cache", action="store_true",
+                   help="Ignore cached descriptions for this run and overwrite them.")
+    p.add_argument("--clear-image-cache", action="store_true",
+                   help="Drop all cached image descriptions before running.")
+    p.add_argument("--incremental", action="store_true",
+                   help=f"Skip inputs unchanged since the last run (source hashes kept in <out>/{EXTRACT_MANIFEST}).")
+    add_metrics_arguments(p)
+    return p.parse_args(argv)
 
 # ─────────────────────────── Conversion ───────────────────────────
 
 
-def build_converter() -> DocumentConverter:
-    # Ensure PDF pipelines actually render figure/page images so artifacts exist for placeholders
+# Docling settings per profile. Downstream only uses picture images, so page
+# images are rendered only by "full"; "auto" OCR runs only on PDFs without a
+# usable text layer (scans), since born-digital text is extracted directly.
+CONVERSION_PROFILES: Dict[str, Dict[str, Any]] = {
+    "fast": {"ocr": "never", "tables": "fast", "page_images": False, "images_scale": 1.0},
+    "balanced": {"ocr": "auto", "tables": "accurate", "page_images": False, "images_scale": 2.0},
+    "full": {"ocr": "always", "tables": "accurate", "page_images": True, "images_scale": 2.0},
+}
+DEFAULT_PROFILE = "balanced"
+OFFICE_SUFFIXES = (".docx", ".pptx")
+
+
+def pdf_has_text_layer(path: Path, sample_pages: int = 3, min_chars: int = 100) -> bool:
+    """True if the first, middle and last pages all carry extractable text."""
+    import pypdfium2 as pdfium  # installed with docling
+    try:
+        pdf = pdfium.PdfDocument(str(path))
+    except Exception:
+        return False
+    try:
+        n = len(pdf)
+        for i in sorted({0, n // 2, n - 1})[:sample_pages] if n else []:
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                if len(textpage.get_text_range().strip()) < min_chars:
+                    return False
+            finally:
+                textpage.close()
+                page.close()
+        return n > 0
+    finally:
+        pdf.close()
+
+
+def pdf_pipeline_options(profile: str, ocr: bool) -> PdfPipelineOptions:
+    from docling.datamodel.pipeline_options import PdfPipelineOptions, TableFormerMode
+
+    cfg = CONVERSION_PROFILES[profile]
     pdf_opts = PdfPipelineOptions()
-    pdf_opts.images_scale = 2.0
-    pdf_opts.generate_page_images = True
+    pdf_opts.do_ocr = ocr
+    pdf_opts.do_table_structure = True
+    pdf_opts.table_structure_options.mode = (
+        TableFormerMode.FAST if cfg["tables"] == "fast" else TableFormerMode.ACCURATE)
+    pdf_opts.images_scale = cfg["images_scale"]
+    pdf_opts.generate_page_images = cfg["page_images"]
+    # picture images are what becomes *_artifacts/*.png for the placeholders
     pdf_opts.generate_picture_images = True
-    return DocumentConverter(format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pdf_opts)})
+    return pdf_opts
 
 
-def convert_one(converter: DocumentConverter, in_file: Path, out_root: Path, image_mode: ImageRefMode) -> Path:
-    res = converter.convert(in_file)
-    doc = res.document
-    out_dir = out_root / in_file.stem
-    out_dir.mkdir(parents=True, exist_ok=True)
-    md_path = out_dir / f"{in_file.stem}.md"
-    doc.save_as_markdown(md_path, image_mode=image_mode)
+TEXT_LAYER_CACHE = 256  # pdf_has_text_layer results kept by a ProfileConverter
+
+
+class ProfileConverter:
+    """
+    Picks a docling converter per document and builds each one on first use:
+    DOCX/PPTX go to an office-only converter (no PDF models are loaded), PDFs
+    to one configured by profile and, for "auto" OCR, by pdf_has_text_layer().
+    """
+
+    def __init__(self, default_profile: str = DEFAULT_PROFILE) -> None:
+        self.default_profile = default_profile
+        self._converters: Dict[Tuple[str, ...], DocumentConverter] = {}
+        # shards of one file ask repeatedly; LRU so a resident worker's converter stays
+        # small, keyed by mtime/size so a file replaced at the same path is checked again
+        self._text_layer: OrderedDict[Tuple[Path, int, int], bool] = OrderedDict()
+
+    def _get(self, key: Tuple[str, ...]) -> DocumentConverter:
+        conv = self._converters.get(key)
+        if conv is None:
+            from docling.datamodel.base_models import InputFormat
+            from docling.document_converter import DocumentConverter, PdfFormatOption
+
+            if key[0] == "office":
+                conv = DocumentConverter(allowed_formats=[InputFormat.DOCX, InputFormat.PPTX])
+            else:
+                _kind, profile, ocr = key
+                conv = DocumentConverter(format_options={InputFormat.PDF: PdfFormatOption(
+                    pipeline_options=pdf_pipeline_options(profile, ocr == "ocr"))})
+            self._converters[key] = conv
+        return conv
+
+    def for_file(self, in_file: Path, profile: Optional[str] = None) -> DocumentConverter:
+        profile = profile or self.default_profile
+        if in_file.suffix.lower() in OFFICE_SUFFIXES:
+            return self._get(("office",))
+        mode = CONVERSION_PROFILES[profile]["ocr"]
+        ocr = mode == "always" or (mode == "auto" and not self._has_text_layer(in_file, profile))
+        return self._get(("pdf", profile, "ocr" if ocr else "text"))
+
+    def _has_text_layer(self, in_file: Path, profile: str) -> bool:
+        st = in_file.stat()
+        key = (in_file, st.st_mtime_ns, st.st_size)
+        found = self._text_layer.get(key)
+        if found is not None:
+            self._text_layer.move_to_end(key)
+            return found
+        found = self._text_layer[key] = pdf_has_text_layer(in_file)
+        log.info(f"[profile] {in_file.name}: {profile}, {'text layer, no OCR' if found else 'OCR'}")
+        while len(self._text_layer) > TEXT_LAYER_CACHE:
+            self._text_layer.popitem(last=False)
+        return found
+
+    def convert(self, in_file: Path, profile: Optional[str] = None,
+                page_range: Optional[Tuple[int, int]] = None) -> Any:
+        conv = self.for_file(in_file, profile)
+        return conv.convert(in_file, page_range=page_range) if page_range else conv.convert(in_file)
+
+
+def build_converter(profile: str = DEFAULT_PROFILE) -> ProfileConverter:
+    return ProfileConverter(profile)
+
+
+PAGE_BREAK = "<!-- page break -->"
+PAGE_MARK = "<!-- page: {} -->"
+# written before each CSV table; chunker.py splits large tables at row boundaries using it
+TABLE_MARK = "<!-- table: {} rows -->"
+
+
+def page_numbers(doc: Any) -> List[int]:
+    """
+    Page of each part between page-break placeholders. docling-core puts a break
+    before every item whose page (prov[0].page_no) is later than the previous
+    item's, so blank pages get no part and a jump of several pages is one break.
+    """
+    pages: List[int] = []
+    prev: Optional[int] = None
+    for item, _level in doc.iterate_items():
+        prov = getattr(item, "prov", None)
+        if not prov:
+            continue
+        page_no = prov[0].page_no
+        if prev is None or page_no > prev:
+            pages.append(page_no)
+        prev = page_no
+    return pages
+
+
+def number_pages(md_text: str, pages: List[int]) -> str:
+    """Replace docling page-break placeholders with page markers (one at the top too); part i is on pages[i]."""
+    parts = md_text.split(PAGE_BREAK)
+    nums = pages[:len(parts)]
+    while len(nums) < len(parts):
+        nums.append(nums[-1] + 1 if nums else 1)
+    return "\n".join(PAGE_MARK.format(n) + "\n" + part.strip("\n") + "\n" for n, part in zip(nums, parts))
+
+
+def _save_markdown(doc: Any, md_path: Path, image_mode: ImageRefMode, first_page: Optional[int]) -> None:
+    if first_page is None:
+        doc.save_as_markdown(md_path, image_mode=image_mode)
+        return
+    try:
+        doc.save_as_markdown(md_path, image_mode=image_mode, page_break_placeholder=PAGE_BREAK)
+    except TypeError:
+        # docling-core without page-break support: markdown without page markers
+        doc.save_as_markdown(md_path, image_mode=image_mode)
+        return
+    pages = page_numbers(doc) or [first_page]  # no located items: the first page of the range
+    md_path.write_text(number_pages(md_path.read_text(encoding="utf-8"), pages), encoding="utf-8")
+
+
+def convert_one(converter: ProfileConverter, in_file: Path, out_root: Path, image_mode: ImageRefMode,
+                page_range: Optional[Tuple[int, int]] = None, profile: Optional[str] = None) -> Path:
+    """
+    Convert one file to <out_root>/<stem>/<stem>.md (PDFs get <!-- page: N --> markers).
+    With page_range (1-based, inclusive) only those pages are converted, into the
+    shard folder that stitch_shards() later merges.
+    """
+    with span("convert") as s:
+        if page_range:
+            res = converter.convert(in_file, profile=profile, page_range=page_range)
+            out_dir = shard_dir(out_root, in_file, page_range)
+        else:
+            res = converter.convert(in_file, profile=profile)
+            out_dir = out_root / in_file.stem
+        doc = res.document
+        out_dir.mkdir(parents=True, exist_ok=True)
+        md_path = out_dir / f"{in_file.stem}.md"
+        first_page = page_range[0] if page_range else (1 if in_file.suffix.lower() == ".pdf" else None)
+        _save_markdown(doc, md_path, image_mode, first_page)
+        s["bytes"] = md_path.stat().st_size
     return md_path
 
 
+# ─────────────────────────── Page-range sharding ───────────────────────────
+# A long PDF is converted as several page ranges in parallel, each into its
+# own folder under <stem>/.shards/, then stitched in page order. Artifacts are
+# renumbered globally so sorted(<stem>_artifacts/*.png) still follows document
+# order (the <!-- image --> placeholder mapping relies on that).
+
+_ARTIFACT_NUM_RE = re.compile(r"^image_\d+")
+
+
+def pdf_page_count(path: Path) -> int:
+    import pypdfium2 as pdfium  # installed with docling
+    pdf = pdfium.PdfDocument(str(path))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def plan_shards(in_file: Path, shard_pages: int) -> List[Optional[Tuple[int, int]]]:
+    """Page ranges for one input; [None] = convert the whole file in one go."""
+    if shard_pages <= 0 or in_file.suffix.lower() != ".pdf":
+        return [None]
+    try:
+        n = pdf_page_count(in_file)
+    except Exception:
+        return [None]  # let docling report unreadable files
+    if n <= shard_pages:
+        return [None]
+    return [(start, min(start + shard_pages - 1, n)) for start in range(1, n + 1, shard_pages)]
+
+
+def shard_dir(out_root: Path, in_file: Path, page_range: Tuple[int, int]) -> Path:
+    return out_root / in_file.stem / ".shards" / f"{page_range[0]:05d}-{page_range[1]:05d}"
+
+
+def stitch_shards(in_file: Path, out_root: Path, shard_mds: List[Path]) -> Path:
+    """Merge shard markdown (in page order) into <stem>/<stem>.md, moving artifacts over."""
+    stem = in_file.stem
+    out_dir = out_root / stem
+    artifacts = out_dir / f"{stem}_artifacts"
+    shutil.rmtree(artifacts, ignore_errors=True)  # stale images from an earlier run
+    counter = 0
+    parts: List[str] = []
+    for md in shard_mds:
+        text = md.read_text(encoding="utf-8")
+        shard_artifacts = md.parent / f"{stem}_artifacts"
+        if shard_artifacts.exists():
+            artifacts.mkdir(parents=True, exist_ok=True)
+            for img in sorted(shard_artifacts.iterdir()):
+                new_name = (_ARTIFACT_NUM_RE.sub(f"image_{counter:06d}", img.name)
+                            if _ARTIFACT_NUM_RE.match(img.name) else f"{counter:06d}_{img.name}")
+                os.replace(img, artifacts / new_name)
+                text = text.replace(img.name, new_name)
+                counter += 1
+        parts.append(text.strip("\n") + "\n")
+    md_path = out_dir / f"{stem}.md"
+    md_path.write_text("\n".join(parts), encoding="utf-8")
+    shutil.rmtree(out_dir / ".shards", ignore_errors=True)
+    return md_path
+
+
+def convert_sharded(converter: ProfileConverter, in_file: Path, out_root: Path, image_mode: ImageRefMode,
+                    shard_pages: int = 0, profile: Optional[str] = None) -> Path:
+    """convert_one, shard by shard in this process (same output as the pool path)."""
+    ranges = plan_shards(in_file, shard_pages)
+    if ranges == [None]:
+        return convert_one(converter, in_file, out_root, image_mode, None, profile)
+    return stitch_shards(in_file, out_root, [convert_one(converter, in_file, out_root, image_mode, r, profile)
+                                             for r in ranges])
+
+
+# ─────────────────────────── Process-pool conversion ───────────────────────────
+Job = Tuple[Path, Optional[Tuple[int, int]]]
+_POOL_CONVERTER: Optional[ProfileConverter] = None
+_POOL_EVENTS: Any = None  # SimpleQueue to the parent: ("start", job) and ("memory", job, mb)
+_POOL_JOB: Optional[Job] = None
+RSS_CHECK_SECONDS = 0.5
+
+
+def _rss_mb() -> float:
+    """Resident set size of this process in MB (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _watch_rss(max_mb: int) -> None:
+    while True:
+        time.sleep(RSS_CHECK_SECONDS)
+        job = _POOL_JOB
+        if job is None:
+            continue
+        rss = _rss_mb()
+        if rss > max_mb:
+            _POOL_EVENTS.put(("memory", job, round(rss)))
+            os._exit(1)
+
+
+def _init_convert_worker(max_mb: int, profile: str = DEFAULT_PROFILE, events: Any = None) -> None:
+    global _POOL_CONVERTER, _POOL_EVENTS
+    _POOL_EVENTS = events
+    _POOL_CONVERTER = build_converter(profile)
+    if max_mb > 0:
+        # Resident memory, not RLIMIT_AS: torch, OpenBLAS and glibc arenas reserve
+        # gigabytes of address space they never touch, so an address-space cap low
+        # enough to matter makes model loading fail. A worker whose resident size
+        # passes the cap while converting exits; the parent reports that file as a
+        # MemoryError and carries on with the rest.
+        idle = _rss_mb()
+        if idle > max_mb / 2:
+            log.warning(f"[convert] --worker-max-mb {max_mb}: a worker holds {idle:.0f} MB before its "
+                        f"first page; leave at least twice that")
+        threading.Thread(target=_watch_rss, args=(max_mb,), name="rss-watch", daemon=True).start()
+
+
+def _convert_in_worker(in_file: Path, out_root: Path, image_mode: ImageRefMode,
+                       page_range: Optional[Tuple[int, int]] = None) -> Tuple[Path, float]:
+    """returns: (md_path, seconds); spans recorded in a worker process are not seen by the parent"""
+    global _POOL_JOB
+    assert _POOL_CONVERTER is not None
+    _POOL_JOB = (in_file, page_range)
+    if _POOL_EVENTS is not None:
+        _POOL_EVENTS.put(("start", _POOL_JOB))
+    t0 = time.perf_counter()
+    try:
+        md_path = convert_one(_POOL_CONVERTER, in_file, out_root, image_mode, page_range)
+    finally:
+        _POOL_JOB = None
+    return md_path, time.perf_counter() - t0
+
+
+def convert_files_serially(converter: ProfileConverter, files: List[Path], out_root: Path,
+                           image_mode: ImageRefMode, shard_pages: int = 0, profile: Optional[str] = None,
+                           ) -> Iterator[Tuple[Path, Optional[Path], Optional[BaseException]]]:
+    """Same contract as convert_files_in_pool, with one in-process converter."""
+    for f in files:
+        try:
+            yield f, convert_sharded(converter, f, out_root, image_mode, shard_pages, profile), None
+        except Exception as e:
+            yield f, None, e
+
+
+def convert_files_in_pool(files: List[Path], out_root: Path, image_mode: ImageRefMode,
+                          workers: int, max_mb: int = 0, shard_pages: int = 0,
+                          profile: str = DEFAULT_PROFILE) -> Iterator[Tuple[Path, Optional[Path], Optional[BaseException]]]:
+    """
+    Convert files in a process pool; yields (in_file, md_path, error) in INPUT order.
+    PDFs longer than shard_pages (0 = never) are converted as page-range shards
+    on several workers and stitched. A failing file only affects itself. If a
+    worker dies outright, the pool is restarted and unfinished jobs are
+    resubmitted. Only the job that was converting in the dead worker is charged
+    for it (when several were, each is retried alone to find out which); it gets
+    two tries, and a job over max_mb resident MB fails with MemoryError at once.
+    """
+    ctx = mp.get_context("spawn")
+    events: Any = None
+
+    def _new_pool(n: int) -> ProcessPoolExecutor:
+        nonlocal events
+        events = ctx.SimpleQueue()
+        return ProcessPoolExecutor(max_workers=n, mp_context=ctx,
+                                   initializer=_init_convert_worker, initargs=(max_mb, profile, events))
+
+    def _submit(p: ProcessPoolExecutor, job: Job) -> Future:
+        return p.submit(_convert_in_worker, job[0], out_root, image_mode, job[1])
+
+    def _broken(fut: Future) -> bool:
+        return fut.done() and not fut.cancelled() and isinstance(fut.exception(), BrokenProcessPool)
+
+    jobs: Dict[Path, List[Job]] = {f: [(f, r) for r in plan_shards(f, shard_pages)] for f in files}
+    order: List[Job] = [job for f in files for job in jobs[f]]
+    pool = _new_pool(workers)
+    futures: Dict[Job, Future] = {job: _submit(pool, job) for job in order}
+    attempts = {job: 1 for job in order}
+    started: set = set()
+    over_memory: Dict[Job, int] = {}
+    given_up: set = set()
+
+    def _drain() -> None:
+        while not events.empty():
+            event = events.get()
+            if event[0] == "start":
+                started.add(event[1])
+            else:
+                over_memory[event[1]] = event[2]
+
+    def _give_up(job: Job, error: BaseException) -> None:
+        fut: Future = Future()
+        fut.set_exception(error)
+        futures[job] = fut
+        given_up.add(job)
+
+    def _blame(job: Job, error: BaseException) -> bool:
+        """Charge job for a dead worker; True when it is out of tries."""
+        if job in over_memory:
+            _give_up(job, MemoryError(f"worker passed --worker-max-mb {max_mb} ({over_memory[job]} MB resident)"))
+            return True
+        attempts[job] += 1
+        if attempts[job] > 2:
+            _give_up(job, error)
+            return True
+        return False
+
+    def _isolate(suspects: List[Job], error: BaseException) -> None:
+        """Run each suspect alone in a one-worker pool; the one that kills it is out."""
+        solo: Optional[ProcessPoolExecutor] = None
+        for g in suspects:
+            if solo is None:
+                solo = _new_pool(1)
+            fut = _submit(solo, g)
+            fut.exception()  # wait
+            _drain()
+            if _broken(fut):
+                solo.shutdown(wait=False, cancel_futures=True)
+                solo = None
+                if not _blame(g, error):
+                    _give_up(g, error)  # its second try, alone, killed the worker too
+            else:
+                futures[g] = fut
+        if solo is not None:
+            solo.shutdown(wait=True)
+
+    def _restart(pos: int, error: BaseException) -> None:
+        nonlocal pool
+        _drain()
+        pool.shutdown(wait=False, cancel_futures=True)
+        broken = [g for g in order[pos:] if g not in given_up and _broken(futures[g])]
+        culprits = [g for g in broken if g in over_memory] or [g for g in broken if g in started]
+        started.clear()
+        if len(culprits) > 1 and not any(g in over_memory for g in culprits):
+            _isolate(culprits, error)
+        else:
+            # a single culprit, or none (the worker died outside any job): charge every job that was hit
+            for g in culprits or broken:
+                _blame(g, error)
+        pool = _new_pool(workers)
+        for g in broken:
+            if g not in given_up and _broken(futures[g]):
+                futures[g] = _submit(pool, g)
+
+    def _result(pos: int, job: Job) -> Path:
+        while True:
+            try:
+                md_path, seconds = futures[job].result()
+                current().record("convert", seconds, md_path.stat().st_size)
+                return md_path
+            except BrokenProcessPool as e:
+                if job in given_up:
+                    raise
+                # restart even when giving up on this job, so later jobs get a live pool
+                _restart(pos, e)
+
+    try:
+        pos = 0
+        for f in files:
+            try:
+                mds = []
+                for job in jobs[f]:
+                    mds.append(_result(pos, job))
+                    pos += 1
+                if jobs[f][0][1] is None:
+                    yield f, mds[0], None
+                else:
+                    yield f, stitch_shards(f, out_root, mds), None
+            except Exception as e:
+                pos = order.index(jobs[f][-1]) + 1
+                yield f, None, e
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
 # ─────────────────────────── Tables → fenced CSV blocks (quoted) ───────────────────────────
 _PIPE = re.compile(r"^\s*\|.*\|\s*$")
 _ALIGN = re.compile(r"^\s*\|?\s*(:?-{3,}:?\s*\|)+\s*:?-{3,}:?\s*\|?\s*$")
@@ -107,17 +625,40 @@ def _csv_block(rows: List[List[str]]) -> str:
     return buf.getvalue().rstrip("\n")
 
 
-def convert_pipe_tables_to_csv(md_text: str) -> str:
+# ─────────────────────────── Single pass: tables + image discovery + placeholders ───────────────────────────
+IMG_MD_RE = re.compile(r"!\[[^\]]*\]\((?!https?://)(?!data:)([^)]+)\)")
+PLACEHOLDER_RE = re.compile(r"<!--\s*image\s*-->")
+
+
+def scan_markdown(md_text: str) -> Tuple[List[str], List[Tuple[int, str]], List[int]]:
+    """
+    One pass over the exported markdown:
+      - pipe tables → fenced CSV blocks (quoted fields, one row per line),
+        each preceded by a <!-- table: N rows --> marker
+      - finds markdown image references and <!-- image --> placeholders
+    returns: (output_lines, [(line_no, image_target)], [placeholder_line_no])
+    Line numbers refer to output_lines (i.e. after the table rewrite).
+    """
     lines = md_text.splitlines()
     out: List[str] = []
+    images: List[Tuple[int, str]] = []
+    placeholders: List[int] = []
+
+    def emit(line: str) -> None:
+        m = IMG_MD_RE.search(line)
+        if m:
+            images.append((len(out), m.group(1)))
+        if PLACEHOLDER_RE.search(line):
+            placeholders.append(len(out))
+        out.append(line)
+
     i = 0
     in_code = False
-
     while i < len(lines):
         line = lines[i]
         if line.strip().startswith("```"):
             in_code = not in_code
-            out.append(line)
+            emit(line)
             i += 1
             continue
 
@@ -128,36 +669,21 @@ def convert_pipe_tables_to_csv(md_text: str) -> str:
             while i < len(lines) and _PIPE.match(lines[i]):
                 body.append(_split_cells(lines[i]))
                 i += 1
-            csv_text = _csv_block([header] + body)
-            out.append("```csv")
-            out.append(csv_text)
-            out.append("```")
+            emit(TABLE_MARK.format(len(body)))
+            emit("```csv")
+            for row in _csv_block([header] + body).split("\n"):
+                emit(row)
+            emit("```")
             continue
 
-        out.append(line)
+        emit(line)
         i += 1
 
-    return "\n".join(out) + "\n"
-
-
-# ─────────────────────────── Image discovery + placeholders ───────────────────────────
-IMG_MD_RE = re.compile(r"!\[[^\]]*\]\((?!https?://)(?!data:)([^)]+)\)")
-PLACEHOLDER_RE = re.compile(r"<!--\s*image\s*-->")
-
-
-def list_md_images_with_line_numbers(md_path: Path) -> List[Tuple[int, str]]:
-    lines = md_path.read_text(encoding="utf-8").splitlines()
-    hits: List[Tuple[int, str]] = []
-    for i, line in enumerate(lines):
-        m = IMG_MD_RE.search(line)
-        if m:
-            hits.append((i, m.group(1)))
-    return hits
+    return out, images, placeholders
 
 
-def list_placeholders_with_line_numbers(md_path: Path) -> List[int]:
-    lines = md_path.read_text(encoding="utf-8").splitlines()
-    return [i for i, line in enumerate(lines) if PLACEHOLDER_RE.search(line)]
+def convert_pipe_tables_to_csv(md_text: str) -> str:
+    return "\n".join(scan_markdown(md_text)[0]) + "\n"
 
 
 def guess_pdf_artifact_images(md_path: Path) -> List[Path]:
@@ -168,15 +694,65 @@ def guess_pdf_artifact_images(md_path: Path) -> List[Path]:
     return sorted([p for p in artifacts_dir.glob("*.png")])
 
 
-def image_to_png_data_url(path: Path) -> str:
+IMAGE_FORMATS = {"png": ("PNG", "image/png"), "jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+
+def image_to_data_url(path: Path, max_px: int = 2048, image_format: str = "png", quality: int = 85) -> str:
+    """
+    Encode an image for the vision model: longest side capped at max_px (0 = keep),
+    PNG (lossless) or JPEG/WebP at the given quality. Runs off the event loop.
+    """
+    from PIL import Image
+
+    p = path if path.is_absolute() else path.resolve()
+    pil_format, mime = IMAGE_FORMATS[image_format]
+    with span("encode") as s, Image.open(p) as im:
+        if max_px > 0 and max(im.size) > max_px:
+            im.draft("RGB", (max_px, max_px))  # JPEG sources decode at reduced size
+            im = im.copy()
+            im.thumbnail((max_px, max_px), Image.LANCZOS)
+        if image_format == "jpeg" and im.mode != "RGB":
+            # no alpha in JPEG: flatten onto white
+            rgba = im.convert("RGBA")
+            im = Image.new("RGB", rgba.size, (255, 255, 255))
+            im.paste(rgba, mask=rgba.getchannel("A"))
+        elif im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGB")
+        buf = io.BytesIO()
+        if pil_format == "PNG":
+            im.save(buf, format="PNG")
+        else:
+            im.save(buf, format=pil_format, quality=quality)
+        url = f"data:{mime};base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+        s["bytes"] = len(url)
+    return url
+
+
+# one pool per process, never replaced: concurrent jobs in the resident worker share it,
+# and each job bounds its own use with --encode-workers (see describe_images_in_parallel)
+ENCODE_POOL_THREADS = min(32, (os.cpu_count() or 1) + 4)
+_ENCODE_POOL: Optional[ThreadPoolExecutor] = None
+_ENCODE_POOL_LOCK = threading.Lock()
+
+
+def encode_pool() -> ThreadPoolExecutor:
+    """Shared threads for image decode/hash/encode (Pillow releases the GIL while coding)."""
+    global _ENCODE_POOL
+    with _ENCODE_POOL_LOCK:
+        if _ENCODE_POOL is None:
+            _ENCODE_POOL = ThreadPoolExecutor(max_workers=ENCODE_POOL_THREADS, thread_name_prefix="img-encode")
+    return _ENCODE_POOL
+
+
+def image_pixel_hash(path: Path) -> str:
+    """Hash of the decoded pixels, so re-encoded/re-exported copies of the same figure match"""
+    from PIL import Image
+
     p = path if path.is_absolute() else path.resolve()
     with Image.open(p) as im:
         if im.mode not in ("RGB", "RGBA"):
             im = im.convert("RGB")
-        buf = io.BytesIO()
-        im.save(buf, format="PNG", optimize=True)
-        b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    return "data:image/png;base64," + b64
+        return content_key(im.mode, f"{im.width}x{im.height}", im.tobytes())
 
 
 FULL_DESCRIPTION_PROMPT = (
@@ -194,12 +770,29 @@ FULL_DESCRIPTION_PROMPT = (
 )
 
 
-async def _describe_one_with_retry(sema: asyncio.Semaphore, idx: int, data_url: str, retries: int = 3) -> Tuple[int, str]:
-    delay = 0.8
-    for attempt in range(1, retries + 1):
-        async with sema:
-            try:
-                resp = await aclient.chat.completions.create(
+def description_cache_key(pixel_hash: str) -> str:
+    return content_key(AZURE_MODEL_FOR_DESCRIPTION, content_key(FULL_DESCRIPTION_PROMPT), pixel_hash)
+
+
+def caption_scheduler(args: argparse.Namespace) -> Scheduler:
+    return get_scheduler(f"caption:{AZURE_MODEL_FOR_DESCRIPTION}", args.concurrency, args.rpm, args.tpm)
+
+
+async def _describe_one_with_retry(scheduler: Scheduler, idx: int, data_url: str, retries: int = 3,
+                                   priority: int = INTERACTIVE) -> Tuple[int, str]:
+    from openai import APIError
+
+    def _parse(raw: Any) -> str:
+        resp = raw.parse()
+        text = (resp.choices[0].message.content or "").strip()
+        if not text:
+            raise RetryableError("empty description")
+        return text
+
+    try:
+        with span("caption", len(data_url)):
+            text = await scheduler.call(
+                lambda: azure_client().chat.completions.with_raw_response.create(
                     model=AZURE_MODEL_FOR_DESCRIPTION,
                     messages=[{
                         "role": "user",
@@ -208,42 +801,66 @@ async def _describe_one_with_retry(sema: asyncio.Semaphore, idx: int, data_url:
                             {"type": "image_url", "image_url": {"url": data_url}},
                         ],
                     }],
-                )
-                text = (resp.choices[0].message.content or "").strip()
-                if text:
-                    return idx, text
-                raise RuntimeError("empty description")
-            except APIError as e:
-                status = getattr(e, "status_code", None)
-                if status in (429, 500, 502, 503, 504) and attempt < retries:
-                    await asyncio.sleep(delay + random.random() * 0.4)
-                    delay *= 2
-                    continue
-                try:
-                    detail = e.response.json()
-                except Exception:
-                    detail = {"message": str(e)}
-                sys.stderr.write(
-                    f"[azure error] {status} {json.dumps(detail)[:800]}\n")
-                return idx, ""
-            except Exception as e:
-                if attempt < retries:
-                    await asyncio.sleep(delay + random.random() * 0.4)
-                    delay *= 2
-                    continue
-                sys.stderr.write(f"[caption error] {e}\n")
-                return idx, ""
-    return idx, ""
+                ),
+                tokens=CAPTION_TOKEN_ESTIMATE, priority=priority, retries=retries, parse=_parse)
+        return idx, text
+    except APIError as e:
+        status = getattr(e, "status_code", None)
+        try:
+            detail = e.response.json()
+        except Exception:
+            detail = {"message": str(e)}
+        log.error(f"[azure error] {status} {json.dumps(detail)[:800]}")
+        count("captions_failed")
+        return idx, ""
+    except Exception as e:
+        log.error(f"[caption error] {e}")
+        count("captions_failed")
+        return idx, ""
 
 
-async def describe_images_in_parallel(md_path: Path, line_to_imgpath: List[Tuple[int, Path]], concurrency: int) -> Dict[int, Tuple[str, str]]:
+async def describe_images_in_parallel(md_path: Path, line_to_imgpath: List[Tuple[int, Path]], concurrency: int,
+                                      cache: Optional[LRUCache] = None, refresh_cache: bool = False,
+                                      scheduler: Optional[Scheduler] = None,
+                                      priority: int = INTERACTIVE, max_px: int = 2048,
+                                      image_format: str = "png", quality: int = 85,
+                                      encode_workers: int = 4, decorative_min_px: int = 0,
+                                      decorative_min_entropy: float = 0.0, dedup_distance: int = -1,
+                                      report: Optional[Dict[str, int]] = None) -> Dict[int, Tuple[str, str]]:
     """
     returns: {line_no: (relative_path_str, description_text)}
+    Decorative images (shorter side < decorative_min_px or grey-level entropy
+    < decorative_min_entropy) get DECORATIVE_LABEL; near-duplicates (dHash within
+    dedup_distance bits, -1 = off) share their group's description. Cached
+    descriptions are used instead of calling the model (unless refresh_cache);
+    new non-empty descriptions are written back to the cache.
+    Calls go through scheduler (default: a private one limited to concurrency).
+    Images are inspected and encoded on the shared pool (at most encode_workers at a
+    time for this call), and only as fast as requests
+    drain: at most concurrency + encode_workers data URLs exist at once.
+    Counts of calls made/saved are added to report.
     """
-    sema = asyncio.Semaphore(max(1, concurrency))
-    tasks = []
-    refs: Dict[int, str] = {}
+    if scheduler is None:
+        scheduler = Scheduler(AZURE_MODEL_FOR_DESCRIPTION, max(1, concurrency))
+    loop = asyncio.get_running_loop()
+    pool = encode_pool()
+    encoders = asyncio.Semaphore(max(1, encode_workers))  # this call's share of the shared pool
+    slots = asyncio.Semaphore(max(1, concurrency) + max(1, encode_workers))
 
+    async def _on_pool(fn: Callable[..., Any], *a: Any) -> Any:
+        async with encoders:
+            # in this job's context, so its spans land in this job's metrics
+            return await loop.run_in_executor(pool, contextvars.copy_context().run, fn, *a)
+
+    async def _encode_and_describe(idx: int, img_path: Path) -> Tuple[int, str]:
+        async with slots:  # the data URL lives only while this slot is held
+            data_url = await _on_pool(image_to_data_url, img_path, max_px, image_format, quality)
+            return await _describe_one_with_retry(scheduler, idx, data_url, priority=priority)
+
+    # 1) Resolve references; decode each image once for its hashes and stats
+    out: Dict[int, Tuple[str, str]] = {}
+    refs: Dict[int, str] = {}
+    found: List[Tuple[int, Path]] = []
     for line_no, img_path in line_to_imgpath:
         # prepare relative reference string for the MD
         if img_path.exists():
@@ -254,26 +871,58 @@ async def describe_images_in_parallel(md_path: Path, line_to_imgpath: List[Tuple
                 # if not under md folder, keep absolute
                 rel = rel
             refs[line_no] = rel.as_posix()
-            data_url = image_to_png_data_url(img_path)
-            tasks.append(asyncio.create_task(
-                _describe_one_with_retry(sema, line_no, data_url)))
+            found.append((line_no, img_path))
         else:
-            refs[line_no] = ""
-            async def _noop(idx=line_no): return (
-                idx, "(Image file not found for description.)")
-            tasks.append(asyncio.create_task(_noop()))
+            out[line_no] = ("", "(Image file not found for description.)")
+    infos = await asyncio.gather(*(_on_pool(inspect_image, p) for _idx, p in found), return_exceptions=True)
 
-    out: Dict[int, Tuple[str, str]] = {}
-    for t in asyncio.as_completed(tasks):
-        try:
-            idx, desc = await t
-            out[idx] = (refs.get(idx, ""), desc)
-        except Exception as e:
-            sys.stderr.write(f"[async task error] {e}\n")
+    # 2) Decorative images get a fixed label; near-duplicates share one description
+    candidates: List[Tuple[int, ImageInfo]] = []
+    decorative = 0
+    for (idx, img_path), info in zip(found, infos):
+        if isinstance(info, BaseException):
+            log.error(f"[image error] {img_path.name}: {info}")
+            out[idx] = (refs[idx], "")
+        elif is_decorative(info, decorative_min_px, decorative_min_entropy):
+            out[idx] = (refs[idx], DECORATIVE_LABEL)
+            decorative += 1
+        else:
+            candidates.append((idx, info))
+    rep_of = group_near_duplicates(candidates, dedup_distance)
+    reps = [idx for idx, _info in candidates if rep_of[idx] == idx]
+
+    # 3) One cache lookup / API call per group representative
+    keys = {idx: description_cache_key(info.pixel_hash) for idx, info in candidates if idx in reps}
+    hits = cache.get_many(keys.values()) if cache and not refresh_cache else {}
+    desc_of = {idx: hits[keys[idx]].decode("utf-8") for idx in reps if keys[idx] in hits}
+    paths = dict(found)
+    todo = [idx for idx in reps if idx not in desc_of]
+    for res in await asyncio.gather(*(_encode_and_describe(idx, paths[idx]) for idx in todo),
+                                    return_exceptions=True):
+        if isinstance(res, BaseException):
+            log.error(f"[async task error] {res}")
+            continue
+        idx, desc = res
+        desc_of[idx] = desc
+    for idx, _info in candidates:
+        out[idx] = (refs[idx], desc_of.get(rep_of[idx], ""))
+
+    if cache:
+        cache.put_many([(keys[idx], desc_of[idx].encode("utf-8"))
+                       for idx in todo if desc_of.get(idx, "").strip()])
+    stats = filter_report(len(found), decorative, len(candidates) - len(reps),
+                          len(reps) - len(todo), len(todo))
+    log.debug(f"[image filter] {md_path.name} {json.dumps(stats)}")
+    count("images", stats["images"])
+    count("images_decorative", stats["decorative"])
+    count("images_duplicate", stats["duplicates"])
+    count("caption_cache_hits", stats["cached"])
+    if report is not None:
+        merge_reports(report, stats)
     return out
 
 
-def replace_lines_with_codefenced_descriptions(md_path: Path, line_to_ref_and_desc: Dict[int, Tuple[str, str]]) -> None:
+def apply_descriptions(lines: List[str], line_to_ref_and_desc: Dict[int, Tuple[str, str]]) -> List[str]:
     """
     Replace target lines with:
       ```image description
@@ -281,7 +930,6 @@ def replace_lines_with_codefenced_descriptions(md_path: Path, line_to_ref_and_de
       <description>
       ```
     """
-    lines = md_path.read_text(encoding="utf-8").splitlines()
     out: List[str] = []
     for idx, line in enumerate(lines):
         if idx in line_to_ref_and_desc:
@@ -293,74 +941,195 @@ def replace_lines_with_codefenced_descriptions(md_path: Path, line_to_ref_and_de
             out.append("```")
         else:
             out.append(line)
-    md_path.write_text("\n".join(out) + "\n", encoding="utf-8")
+    return out
 
 # ─────────────────────────── Orchestration ───────────────────────────
 
 
-def main() -> None:
-    args = parse_args()
-    in_dir = Path(args.in_dir).resolve()
-    out_dir = Path(args.out_dir).resolve()
-    out_dir.mkdir(parents=True, exist_ok=True)
+async def postprocess_markdown_async(md_path: Path, args: argparse.Namespace, cache: Optional[LRUCache] = None,
+                                     report: Optional[Dict[str, int]] = None) -> str:
+    """
+    Tables → fenced CSV, then (optionally) images/placeholders → fenced descriptions.
+    Reads the exported markdown once, works on it in memory, writes it back once.
+    returns: the final markdown text
+    """
+    # 1) Convert pipe tables to inline fenced CSV (quoted fields) + find images/placeholders
+    md_text = md_path.read_text(encoding="utf-8")
+    with span("table", len(md_text.encode("utf-8"))):
+        lines, img_hits, placeholder_lines = scan_markdown(md_text)
+
+    # 2) Replace images/placeholders with full descriptions (parallel + retries) → fenced block
+    if args.describe_images:
+        # Normal Markdown images
+        line_to_imgpath: List[Tuple[int, Path]] = []
+        for line_no, rel in img_hits:
+            p = Path(rel)
+            if not p.is_absolute():
+                p = (md_path.parent / p).resolve()
+            line_to_imgpath.append((line_no, p))
+
+        # PDF placeholders: map each <!-- image --> to artifact PNGs by order
+        if placeholder_lines:
+            # Guess artifacts folder and images
+            stem = md_path.stem
+            artifacts_dir = md_path.parent / f"{stem}_artifacts"
+            artifact_imgs = sorted(artifacts_dir.glob(
+                "*.png")) if artifacts_dir.exists() else []
+            for i, line_no in enumerate(placeholder_lines):
+                p = artifact_imgs[i] if i < len(
+                    artifact_imgs) else Path("/nonexistent.png")
+                line_to_imgpath.append((line_no, p))
+
+        if line_to_imgpath:
+            # Dedup by line number, keep first occurrence
+            seen = set()
+            dedup: List[Tuple[int, Path]] = []
+            for ln, p in sorted(line_to_imgpath, key=lambda t: t[0]):
+                if ln in seen:
+                    continue
+                seen.add(ln)
+                dedup.append((ln, p))
+
+            line_to_ref_and_desc = await describe_images_in_parallel(
+                md_path, dedup, args.concurrency, cache, args.refresh_image_cache,
+                caption_scheduler(args), PRIORITIES[args.priority], args.image_max_px,
+                args.image_format, args.image_quality, args.encode_workers,
+                *image_filter_options(args), report=report)
+            if line_to_ref_and_desc:
+                lines = apply_descriptions(lines, line_to_ref_and_desc)
+
+    new_md = "\n".join(lines) + "\n"
+    if new_md != md_text:
+        md_path.write_text(new_md, encoding="utf-8")
+    return new_md
+
+
+def postprocess_markdown(md_path: Path, args: argparse.Namespace, cache: Optional[LRUCache] = None,
+                         run_async: Callable[[Coroutine[Any, Any, Any]], Any] = asyncio.run,
+                         report: Optional[Dict[str, int]] = None) -> str:
+    return run_async(postprocess_markdown_async(md_path, args, cache, report))
+
+
+def image_filter_options(args: argparse.Namespace) -> Tuple[int, float, int]:
+    """(decorative_min_px, decorative_min_entropy, dedup_distance) for describe_images_in_parallel."""
+    if args.no_image_filter:
+        return 0, 0.0, -1
+    return args.decorative_min_px, args.decorative_min_entropy, args.dedup_distance
+
 
+def list_input_files(args: argparse.Namespace) -> List[Path]:
+    in_dir = Path(args.in_dir).resolve()
     files = sorted([p for p in in_dir.iterdir()
                    if p.suffix.lower() in {".pdf", ".docx", ".pptx"}])
     if not files:
         sys.exit(f"No .pdf/.docx/.pptx in {in_dir}")
+    return files
+
+
+def image_ref_mode(args: argparse.Namespace) -> ImageRefMode:
+    from docling_core.types.doc import ImageRefMode
+
+    return ImageRefMode.REFERENCED if args.image_mode == "referenced" else ImageRefMode.EMBEDDED
+
+
+def open_image_cache(args: argparse.Namespace) -> Optional[LRUCache]:
+    if not args.describe_images or args.no_image_cache:
+        return None
+    cache = LRUCache(Path(args.image_cache),
+                     args.image_cache_max_mb * 1024 * 1024)
+    if args.clear_image_cache:
+        cache.clear()
+    return cache
 
-    image_mode = ImageRefMode.REFERENCED if args.image_mode == "referenced" else ImageRefMode.EMBEDDED
-    converter = build_converter()
 
+def extract_options_key(args: argparse.Namespace) -> str:
+    """Anything that changes the markdown produced from the same source file."""
+    described = (AZURE_MODEL_FOR_DESCRIPTION, FULL_DESCRIPTION_PROMPT) if args.describe_images else ("", "")
+    return content_key(args.image_mode, args.profile, *described)
+
+
+def open_manifest(args: argparse.Namespace) -> Optional[Manifest]:
+    if not args.incremental:
+        return None
+    return Manifest(Path(args.out_dir).resolve() / EXTRACT_MANIFEST)
+
+
+def skip_unchanged(files: List[Path], manifest: Manifest, options: str,
+                   out: TextIO = sys.stdout) -> Tuple[List[Path], Dict[str, str]]:
+    """
+    Drop files whose hash and options match the manifest and whose markdown still exists.
+    returns: (files to convert, {file name: source sha256})
+    """
+    todo: List[Path] = []
+    hashes: Dict[str, str] = {}
     for f in files:
-        md_path = convert_one(converter, f, out_dir, image_mode)
-        print(f"[ok] {f.name} -> {md_path}")
+        h = hashes[f.name] = file_sha256(f)
+        entry = manifest.get(f.name)
+        if (entry and entry["sha256"] == h and entry["options"] == options
+                and Path(entry["md_path"]).exists()):
+            print(f"[skip] {f.name} (unchanged) -> {entry['md_path']}", file=out, flush=True)
+            continue
+        todo.append(f)
+    return todo, hashes
+
+
+def record_converted(manifest: Manifest, f: Path, sha256: str, options: str, md_path: Path) -> None:
+    manifest.set(f.name, {"sha256": sha256, "options": options, "md_path": str(md_path)})
+    manifest.save()
+
+
+def run(args: argparse.Namespace, converter: Optional[ProfileConverter], out: TextIO = sys.stdout,
+        run_async: Callable[[Coroutine[Any, Any, Any]], Any] = asyncio.run) -> None:
+    begin_run(args.log_level)
+    if args.describe_images:
+        azure_client()  # missing Azure config fails here, not after the conversions
+    files = list_input_files(args)
+    out_dir = Path(args.out_dir).resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = open_manifest(args)
+    options = extract_options_key(args)
+    hashes: Dict[str, str] = {}
+    if manifest:
+        files, hashes = skip_unchanged(files, manifest, options, out)
+    image_mode = image_ref_mode(args)
+    cache = open_image_cache(args)
 
-        # 1) Convert pipe tables to inline fenced CSV (quoted fields)
-        md_text = md_path.read_text(encoding="utf-8")
-        new_md = convert_pipe_tables_to_csv(md_text)
-        if new_md != md_text:
-            md_path.write_text(new_md, encoding="utf-8")
+    # Pool mode: conversion of later files overlaps post-processing of earlier ones
+    if args.workers > 1:
+        results = convert_files_in_pool(
+            files, out_dir, image_mode, args.workers, args.worker_max_mb, args.shard_pages, args.profile)
+    else:
+        assert converter is not None
+        results = convert_files_serially(converter, files, out_dir, image_mode, args.shard_pages, args.profile)
 
-        # 2) Replace images/placeholders with full descriptions (parallel + retries) → fenced block
+    failed: List[str] = []
+    report: Dict[str, int] = {}
+    try:
+        for f, md_path, err in results:
+            if md_path is None:
+                log.error(f"[error] {f.name}: {type(err).__name__}: {err}")
+                failed.append(f.name)
+                continue
+            print(f"[ok] {f.name} -> {md_path}", file=out, flush=True)
+            postprocess_markdown(md_path, args, cache, run_async, report)
+            if manifest:
+                record_converted(manifest, f, hashes[f.name], options, md_path)
+    finally:
+        if cache:
+            log.info(f"[image cache] {json.dumps(cache.stats())}")
+            cache.close()
         if args.describe_images:
-            # Normal Markdown images
-            img_hits = list_md_images_with_line_numbers(md_path)
-            line_to_imgpath: List[Tuple[int, Path]] = []
-            for line_no, rel in img_hits:
-                p = Path(rel)
-                if not p.is_absolute():
-                    p = (md_path.parent / p).resolve()
-                line_to_imgpath.append((line_no, p))
+            log.info(f"[image filter] total {json.dumps(report)}")
+            log.info(f"[scheduler] {json.dumps(caption_scheduler(args).stats())}")
+        report_metrics("extract", args.metrics_json, args.metrics_prom, files=len(files), failed=len(failed))
+
+    if failed:
+        sys.exit(f"{len(failed)} file(s) failed to convert: {', '.join(failed)}")
 
-            # PDF placeholders: map each <!-- image --> to artifact PNGs by order
-            placeholder_lines = list_placeholders_with_line_numbers(md_path)
-            if placeholder_lines:
-                # Guess artifacts folder and images
-                stem = md_path.stem
-                artifacts_dir = md_path.parent / f"{stem}_artifacts"
-                artifact_imgs = sorted(artifacts_dir.glob(
-                    "*.png")) if artifacts_dir.exists() else []
-                for i, line_no in enumerate(placeholder_lines):
-                    p = artifact_imgs[i] if i < len(
-                        artifact_imgs) else Path("/nonexistent.png")
-                    line_to_imgpath.append((line_no, p))
-
-            if line_to_imgpath:
-                # Dedup by line number, keep first occurrence
-                seen = set()
-                dedup: List[Tuple[int, Path]] = []
-                for ln, p in sorted(line_to_imgpath, key=lambda t: t[0]):
-                    if ln in seen:
-                        continue
-                    seen.add(ln)
-                    dedup.append((ln, p))
-
-                line_to_ref_and_desc = asyncio.run(
-                    describe_images_in_parallel(md_path, dedup, args.concurrency))
-                if line_to_ref_and_desc:
-                    replace_lines_with_codefenced_descriptions(
-                        md_path, line_to_ref_and_desc)
+
+def main() -> None:
+    args = parse_args()
+    run(args, build_converter(args.profile) if args.workers <= 1 else None)
 
 
 if __name__ == "__main__":
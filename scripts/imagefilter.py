@@ -0,0 +1,109 @@
+from __future__ import annotations
+import math
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+from cache import content_key
+
+if TYPE_CHECKING:
+    from PIL import Image  # imported in inspect_image, so importing this module stays cheap
+
+# ─────────────────────────── Pre-captioning image filter ───────────────────────────
+# PDFs repeat the same logo / footer badge / rule on every page, and docling
+# exports each as its own artifact. Before any description call:
+#   - tiny or near-uniform images are decorative and get a fixed label
+#   - near-duplicates (64-bit difference hash within a Hamming distance, same
+#     size ±10%) are grouped so each group is described once
+# One decode per image also yields the exact pixel hash used as cache key.
+
+K = TypeVar("K")
+
+DECORATIVE_LABEL = "(Decorative image; not described.)"
+
+
+class ImageInfo(NamedTuple):
+    pixel_hash: str
+    dhash: int
+    width: int
+    height: int
+    entropy: float
+
+
+def _dhash(gray: Image.Image) -> int:
+    from PIL import Image
+
+    small = gray.resize((9, 8), Image.BILINEAR)
+    px = list(small.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits
+
+
+def _entropy(gray: Image.Image) -> float:
+    """Shannon entropy of the grey-level histogram, 0 (flat) … 8 bits."""
+    hist = gray.histogram()
+    total = float(sum(hist))
+    return -sum(n / total * math.log2(n / total) for n in hist if n) if total else 0.0
+
+
+def inspect_image(path: Path) -> ImageInfo:
+    from PIL import Image
+
+    p = path if path.is_absolute() else path.resolve()
+    with Image.open(p) as im:
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGB")
+        # same recipe as extract.image_pixel_hash so cache keys match
+        pixel_hash = content_key(im.mode, f"{im.width}x{im.height}", im.tobytes())
+        gray = im.convert("L")
+        return ImageInfo(pixel_hash, _dhash(gray), im.width, im.height, _entropy(gray))
+
+
+def is_decorative(info: ImageInfo, min_px: int, min_entropy: float) -> bool:
+    return min(info.width, info.height) < min_px or info.entropy < min_entropy
+
+
+def _same_size(a: ImageInfo, b: ImageInfo) -> bool:
+    return (abs(a.width - b.width) <= 0.1 * max(a.width, b.width)
+            and abs(a.height - b.height) <= 0.1 * max(a.height, b.height))
+
+
+def group_near_duplicates(items: Sequence[Tuple[K, ImageInfo]], max_distance: int) -> Dict[K, K]:
+    """
+    returns: {key: representative key}; the first image of each group represents it.
+    max_distance < 0 disables grouping (every image represents itself).
+    """
+    reps: List[Tuple[K, ImageInfo]] = []
+    out: Dict[K, K] = {}
+    for key, info in items:
+        rep = None
+        if max_distance >= 0:
+            for rkey, rinfo in reps:
+                if (rinfo.pixel_hash == info.pixel_hash
+                        or (bin(rinfo.dhash ^ info.dhash).count("1") <= max_distance and _same_size(rinfo, info))):
+                    rep = rkey
+                    break
+        if rep is None:
+            reps.append((key, info))
+            rep = key
+        out[key] = rep
+    return out
+
+
+def filter_report(images: int, decorative: int, duplicates: int, cached: int,
+                  api_calls: int) -> Dict[str, int]:
+    return {
+        "images": images,
+        "decorative": decorative,
+        "duplicates": duplicates,
+        "cached": cached,
+        "api_calls": api_calls,
+        "calls_saved": images - api_calls,
+    }
+
+
+def merge_reports(total: Dict[str, int], report: Optional[Dict[str, int]]) -> None:
+    for k, v in (report or {}).items():
+        total[k] = total.get(k, 0) + v
@@ -0,0 +1,84 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+# ─────────────────────────── Re-ingestion manifests ───────────────────────────
+# A manifest is a small JSON file next to the outputs that remembers what was
+# produced from what: extract.py records each source file's hash, chunker.py
+# each markdown file's per-chunk content hashes. A re-run compares against it
+# to skip unchanged work and to report a delta downstream storage can apply.
+
+EXTRACT_MANIFEST = ".c3_extract_manifest.json"
+CHUNK_MANIFEST = ".c3_chunk_manifest.json"
+
+
+def file_sha256(path: Path, bufsize: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(bufsize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class Manifest:
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text(encoding="utf-8"))
+                self.entries = dict(data.get("entries", {}))
+            except (ValueError, OSError):
+                self.entries = {}  # unreadable manifest = start over
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.entries.get(key)
+
+    def set(self, key: str, entry: Dict[str, Any]) -> None:
+        self.entries[key] = entry
+
+    def remove(self, key: str) -> None:
+        self.entries.pop(key, None)
+
+    def save(self) -> None:
+        """Write atomically so an interrupted run leaves the previous manifest intact."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({"version": 1, "entries": self.entries}, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+
+def diff_chunks(old: Sequence[Optional[str]], new: Sequence[str]) -> Dict[str, List[Any]]:
+    """
+    Compare per-chunk content hashes; indices are 1-based like chunk output.
+    A chunk whose text is still at its old index is unchanged; one whose text was
+    at another index is moved there ([old, new] pairs: re-key it, its vector is
+    still good); any other is added (past the old end) or changed. removed lists
+    old indices to delete: text that is gone, unless a changed chunk overwrites it.
+    returns: {"added": [...], "changed": [...], "removed": [...], "unchanged": [...], "moved": [[old, new], ...]}
+    """
+    delta: Dict[str, List[Any]] = {"added": [], "changed": [], "removed": [], "unchanged": [], "moved": []}
+    same = {i for i, h in enumerate(new, start=1) if i <= len(old) and old[i - 1] == h}
+    spare: Dict[str, List[int]] = {}
+    for j, h in enumerate(old, start=1):
+        if h is not None and j not in same:
+            spare.setdefault(h, []).append(j)
+    sources, targets = set(), set()
+    for i, h in enumerate(new, start=1):
+        if i in same:
+            delta["unchanged"].append(i)
+        elif spare.get(h):
+            j = spare[h].pop(0)
+            delta["moved"].append([j, i])
+            sources.add(j)
+            targets.add(i)
+        elif i > len(old):
+            delta["added"].append(i)
+        else:
+            delta["changed"].append(i)
+    delta["removed"] = [j for j in range(1, len(old) + 1)
+                        if j not in same and j not in sources and (j > len(new) or j in targets)]
+    return delta
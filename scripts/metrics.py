@@ -0,0 +1,211 @@
+from __future__ import annotations
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+# ─────────────────────────── Logging, spans and counters ───────────────────────────
+# Shared by extract.py, chunker.py and pipeline.py:
+#
+#   - log: the "c3" logger; stderr lines keep their "[tag] ..." form, and
+#     --log-level hides the per-chunk/per-image detail (debug) by default
+#   - span("embed", nbytes): wall time + bytes of one unit of stage work
+#   - count("chunks_dropped"): plain counters
+#
+# summary() folds in the Azure scheduler counters (calls, retries, 429s) and is
+# printed as one "[metrics] {...}" line per run; write_prometheus() produces a
+# node_exporter text-file collector file. begin_run() gives each run its own
+# registry and log level in a context variable, which the run's tasks and
+# asyncio.to_thread calls inherit, so overlapping resident-worker jobs keep
+# separate summaries (the Azure counters stay per process: the schedulers are shared).
+
+LOG_LEVELS = ("debug", "info", "warning", "error")
+STAGES = ("convert", "table", "encode", "caption", "section", "embed", "emit")
+
+log = logging.getLogger("c3")
+
+
+class _StderrHandler(logging.Handler):
+    # resolves sys.stderr per record, so redirect_stderr() and the worker see the lines
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            sys.stderr.write(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+
+
+_LEVEL: ContextVar[int] = ContextVar("c3_log_level", default=logging.INFO)
+
+
+def setup_logging(level: str = "info") -> None:
+    """Set the level for this context (a run, or a worker job and what it starts)."""
+    if not log.handlers:
+        handler = _StderrHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler.addFilter(lambda record: record.levelno >= _LEVEL.get())
+        log.addHandler(handler)
+        log.propagate = False
+        log.setLevel(logging.DEBUG)  # the handler filters by the caller's level
+    _LEVEL.set(logging.getLevelName(level.upper()))
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, max(0, int(q / 100.0 * len(s) + 0.5) - 1))]
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started = time.time()
+            self._t0 = time.perf_counter()
+            self.durations: Dict[str, List[float]] = {}
+            self.bytes: Dict[str, int] = {}
+            self.counters: Dict[str, int] = {}
+
+    def record(self, name: str, seconds: float, nbytes: int = 0) -> None:
+        with self._lock:
+            self.durations.setdefault(name, []).append(seconds)
+            self.bytes[name] = self.bytes.get(name, 0) + nbytes
+
+    @contextmanager
+    def span(self, name: str, nbytes: int = 0) -> Iterator[Dict[str, int]]:
+        """Time the block; the yielded dict's "bytes" may be set inside it."""
+        info = {"bytes": nbytes}
+        t0 = time.perf_counter()
+        try:
+            yield info
+        finally:
+            self.record(name, time.perf_counter() - t0, info["bytes"])
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def summary(self, **extra: Any) -> Dict[str, Any]:
+        from scheduler import all_stats
+
+        with self._lock:
+            spans = {}
+            for name in [s for s in STAGES if s in self.durations] + sorted(set(self.durations) - set(STAGES)):
+                d = self.durations[name]
+                spans[name] = {
+                    "count": len(d),
+                    "total_s": round(sum(d), 3),
+                    "p50_ms": round(_percentile(d, 50) * 1000, 1),
+                    "p95_ms": round(_percentile(d, 95) * 1000, 1),
+                    "max_ms": round(max(d) * 1000, 1),
+                    "bytes": self.bytes.get(name, 0),
+                }
+            return {
+                "started": round(self.started, 3),
+                "wall_s": round(time.perf_counter() - self._t0, 3),
+                "spans": spans,
+                "counters": dict(sorted(self.counters.items())),
+                "api": all_stats(),
+                **extra,
+            }
+
+
+METRICS = Metrics()  # used outside begin_run() (imports, tests, bench scripts)
+_CURRENT: ContextVar[Metrics] = ContextVar("c3_metrics", default=METRICS)
+
+
+def current() -> Metrics:
+    return _CURRENT.get()
+
+
+def begin_run(level: str = "info") -> Metrics:
+    """A fresh registry and log level for the run started in this context."""
+    setup_logging(level)
+    metrics = Metrics()
+    _CURRENT.set(metrics)
+    return metrics
+
+
+def span(name: str, nbytes: int = 0) -> Any:
+    return current().span(name, nbytes)
+
+
+def count(name: str, n: int = 1) -> None:
+    current().count(name, n)
+
+
+def _prom_name(s: str) -> str:
+    return re.sub(r"[^a-zA-Z0-9_]", "_", s)
+
+
+def _prom_label(s: str) -> str:
+    return s.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def prometheus_text(summary: Dict[str, Any], job: str) -> str:
+    lines: List[str] = []
+
+    def _metric(name: str, kind: str, help_: str, samples: List[tuple]) -> None:
+        lines.append(f"# HELP c3_{name} {help_}")
+        lines.append(f"# TYPE c3_{name} {kind}")
+        for labels, value in samples:
+            label_str = ",".join(f'{k}="{_prom_label(str(v))}"' for k, v in [("script", job), *labels])
+            lines.append(f"c3_{name}{{{label_str}}} {value}")
+
+    spans = summary["spans"]
+    _metric("stage_seconds_total", "counter", "Time spent per stage.",
+            [([("stage", k)], v["total_s"]) for k, v in spans.items()])
+    _metric("stage_runs_total", "counter", "Units of work per stage.",
+            [([("stage", k)], v["count"]) for k, v in spans.items()])
+    _metric("stage_bytes_total", "counter", "Bytes processed per stage.",
+            [([("stage", k)], v["bytes"]) for k, v in spans.items()])
+    _metric("stage_p95_seconds", "gauge", "95th percentile duration per stage in the last run.",
+            [([("stage", k)], v["p95_ms"] / 1000) for k, v in spans.items()])
+    for name, value in summary["counters"].items():
+        _metric(f"{_prom_name(name)}_total", "counter", f"{name} in the last run.", [([], value)])
+    api = summary.get("api") or []
+    for key in ("requests", "retries", "throttled", "failed", "tokens"):
+        _metric(f"api_{key}_total", "counter", f"Azure {key} per deployment.",
+                [([("deployment", s["name"])], s.get(key, 0)) for s in api])
+    _metric("run_wall_seconds", "gauge", "Wall time of the last run.", [([], summary["wall_s"])])
+    _metric("run_timestamp_seconds", "gauge", "Start of the last run (unix time).", [([], summary["started"])])
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: Path, summary: Dict[str, Any], job: str) -> None:
+    """Atomic write, as the text-file collector may read at any moment."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(prometheus_text(summary, job), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def report(job: str, json_path: Optional[str] = None, prom_path: Optional[str] = None,
+           **extra: Any) -> Dict[str, Any]:
+    """End of run: log the JSON summary and write the optional files."""
+    summary = current().summary(job=job, **extra)
+    log.info(f"[metrics] {json.dumps(summary)}")
+    if json_path:
+        Path(json_path).write_text(json.dumps(summary, indent=1) + "\n", encoding="utf-8")
+    if prom_path:
+        write_prometheus(Path(prom_path), summary, job)
+    return summary
+
+
+def add_arguments(p: Any) -> None:
+    """--log-level / --metrics-json / --metrics-prom, shared by the CLIs."""
+    p.add_argument("--log-level", choices=LOG_LEVELS, default=os.getenv("N8N_C3_LOG_LEVEL") or "info",
+                   help="stderr verbosity; debug adds per-chunk and per-image lines (default: $N8N_C3_LOG_LEVEL or info).")
+    p.add_argument("--metrics-json", default=None,
+                   help="Write the run's metrics summary (stage spans, counters, Azure calls) to this JSON file.")
+    p.add_argument("--metrics-prom", default=None,
+                   help="Write the metrics in Prometheus text format (for node_exporter's text-file collector).")
@@ -0,0 +1,150 @@
+from __future__ import annotations
+import hashlib
+import re
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+# ─────────────────────────── Near-duplicate chunks (MinHash + LSH) ───────────────────────────
+# Company reports repeat whole blocks (disclaimers, methodology, standard
+# tables) with small edits. Each chunk's text becomes a set of word 5-grams;
+# its MinHash signature estimates the Jaccard similarity of two such sets, and
+# LSH banding finds the candidate pairs without comparing every chunk with every
+# other one.
+#
+# The index is streaming: check() compares a chunk with the representatives seen
+# so far (in the same scope) and either returns the one it duplicates or makes
+# it a new representative. The first copy is the one that gets embedded.
+#
+# Signatures use one-permutation hashing (each shingle hashed once, its bucket =
+# hash mod num_perm, with optimal densification for empty buckets), so cost is
+# linear in text length rather than num_perm × text length.
+
+SHINGLE_WORDS = 5
+NUM_PERM = 128
+_MASK64 = (1 << 64) - 1
+_EMPTY = 1 << 64
+
+WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text: str, n: int = SHINGLE_WORDS) -> set:
+    words = WORD_RE.findall(text.lower())
+    if len(words) <= n:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _h64(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _mix(x: int) -> int:
+    """splitmix64 finaliser; picks the donor bucket when densifying."""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return x ^ (x >> 31)
+
+
+def signature(text: str, num_perm: int = NUM_PERM) -> Optional[Tuple[int, ...]]:
+    """MinHash signature of the text's shingles (None for text without words)."""
+    sig = [_EMPTY] * num_perm
+    for sh in shingles(text):
+        h = _h64(sh)
+        b, v = h % num_perm, h // num_perm
+        if v < sig[b]:
+            sig[b] = v
+    filled = [i for i, v in enumerate(sig) if v != _EMPTY]
+    if not filled:
+        return None
+    if len(filled) < num_perm:
+        # optimal densification: an empty bucket copies a filled one chosen by a
+        # hash of (bucket, attempt), the same choice for every text
+        full = list(sig)
+        for i in range(num_perm):
+            attempt = 0
+            while sig[i] == _EMPTY:
+                donor = _mix((i << 32) | attempt) % num_perm
+                if full[donor] != _EMPTY:
+                    sig[i] = full[donor]
+                attempt += 1
+    return tuple(sig)
+
+
+def similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for x, y in zip(a, b) if x == y) / len(a)
+
+
+def choose_bands(threshold: float, num_perm: int = NUM_PERM) -> Tuple[int, int]:
+    """
+    (bands, rows) with bands × rows = num_perm, and the LSH S-curve midpoint
+    (1/bands)^(1/rows) a little below the threshold, so true duplicates are
+    rarely missed; candidates are then checked against the threshold itself.
+    """
+    options = [(num_perm // r, r) for r in range(1, num_perm + 1) if num_perm % r == 0]
+    below = [(b, r) for b, r in options if (1 / b) ** (1 / r) <= threshold - 0.05]
+    return max(below, key=lambda br: (1 / br[0]) ** (1 / br[1])) if below else options[-1]
+
+
+class NearDupIndex:
+    def __init__(self, threshold: float = 0.8, num_perm: int = NUM_PERM) -> None:
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands, self.rows = choose_bands(threshold, num_perm)
+        self._buckets: Dict[Tuple[Any, int, Tuple[int, ...]], List[Hashable]] = {}
+        self._sigs: Dict[Hashable, Tuple[int, ...]] = {}
+        self.checked = 0
+        self.duplicates = 0
+
+    def check(self, key: Hashable, text: str, scope: Any = "") -> Optional[Hashable]:
+        """
+        Key of the most similar earlier representative in this scope if it
+        reaches the threshold; otherwise key becomes a representative and None is returned.
+        """
+        self.checked += 1
+        sig = signature(text, self.num_perm)
+        if sig is None:
+            return None
+        bands = self._bands(sig, scope)
+        best: Optional[Hashable] = None
+        best_sim = self.threshold
+        seen = set()
+        for band in bands:
+            for cand in self._buckets.get(band, ()):
+                if cand in seen:
+                    continue
+                seen.add(cand)
+                sim = similarity(sig, self._sigs[cand])
+                if sim >= best_sim:
+                    best, best_sim = cand, sim
+        if best is not None:
+            self.duplicates += 1
+            return best
+        self._insert(key, sig, bands)
+        return None
+
+    def add(self, key: Hashable, text: str, scope: Any = "") -> None:
+        """Make key a representative without checking it (e.g. a chunk embedded by an earlier run)."""
+        sig = signature(text, self.num_perm)
+        if sig is not None:
+            self._insert(key, sig, self._bands(sig, scope))
+
+    def _bands(self, sig: Tuple[int, ...], scope: Any) -> List[Tuple[Any, int, Tuple[int, ...]]]:
+        return [(scope, b, sig[b * self.rows:(b + 1) * self.rows]) for b in range(self.bands)]
+
+    def _insert(self, key: Hashable, sig: Tuple[int, ...], bands: List[Tuple[Any, int, Tuple[int, ...]]]) -> None:
+        self._sigs[key] = sig
+        for band in bands:
+            self._buckets.setdefault(band, []).append(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "representatives": len(self._sigs),
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+        }
@@ -20,76 +20,34 @@ type ParsedChunk = {
   embedding: number[];
 };
 
-const FILE_MARK = /^===\s+(.*?)\s+===\s*$/m,
-  CHUNK_START = /^\[#\s*(\d+)\]/m,
-  META_LINE = /^meta\.(file|heading_path|page|token_count|embedding):\s*(.*)$/,
-  FENCE_OPEN = /^```markdown\s*$/,
-  FENCE_CLOSE = /^```$/;
+// NDJSON records from chunker.py --output-format ndjson (see chunkio.py)
+function decodeFloat32(b64: string): number[] {
+  const buf = Buffer.from(b64, "base64");
+  const out = new Array<number>(buf.length >> 2);
+  for (let k = 0; k < out.length; k++) out[k] = buf.readFloatLE(k * 4);
+  return out;
+}
 
-function parseStdout(stdout: string): ParsedChunk[] {
-  const lines = stdout.split(/\r?\n/);
+function parseNdjson(stdout: string): ParsedChunk[] {
   const chunks: ParsedChunk[] = [];
-  let currentFile = "";
-  let i = 0;
-  while (i < lines.length) {
-    const fm = lines[i].match(FILE_MARK);
-    if (fm) {
-      currentFile = fm[1].trim();
-      i++;
-      continue;
-    }
-    const cs = lines[i].match(CHUNK_START);
-    if (cs) {
-      const index = Number(cs[1]);
-      i++;
-      let headingPath = "",
-        page: string | number | null = null,
-        tokenCount = 0,
-        embedding: number[] = [];
-      for (; i < lines.length; i++) {
-        const m = lines[i].match(META_LINE);
-        if (!m) break;
-        if (m[1] === "heading_path") headingPath = m[2].trim();
-        if (m[1] === "page") page = m[2].trim() === "None" ? null : m[2].trim();
-        if (m[1] === "token_count") tokenCount = Number(m[2].trim());
-        if (m[1] === "embedding") {
-          try {
-            embedding = JSON.parse(m[2].trim());
-          } catch (e) {
-            embedding = [];
-          }
-        }
-      }
-      if (!FENCE_OPEN.test(lines[i] || "")) {
-        while (
-          i < lines.length &&
-          !CHUNK_START.test(lines[i]) &&
-          !FILE_MARK.test(lines[i])
-        )
-          i++;
-        continue;
-      }
-      i++;
-      const buf: string[] = [];
-      for (; i < lines.length; i++) {
-        if (FENCE_CLOSE.test(lines[i])) {
-          i++;
-          break;
-        }
-        buf.push(lines[i]);
-      }
-      chunks.push({
-        file: currentFile,
-        index,
-        heading_path: headingPath,
-        page,
-        text: buf.join("\n"),
-        token_count: tokenCount,
-        embedding,
-      });
+  for (const line of stdout.split(/\r?\n/)) {
+    if (!line.startsWith("{")) continue;
+    let rec: any;
+    try {
+      rec = JSON.parse(line);
+    } catch (e) {
       continue;
     }
-    i++;
+    if (rec.type === "delta") continue;
+    chunks.push({
+      file: rec.file ?? "",
+      index: Number(rec.index),
+      heading_path: (rec.heading_path ?? []).join(" > "),
+      page: rec.page ?? null,
+      text: rec.text ?? "",
+      token_count: Number(rec.token_count ?? 0),
+      embedding: rec.embedding_b64 ? decodeFloat32(rec.embedding_b64) : [],
+    });
   }
   return chunks;
 }
@@ -153,6 +111,30 @@ export class C3Embedder implements INodeType {
         default: 10,
         description: "Number of concurrent extraction processes",
       },
+      {
+        displayName: "Conversion Profile",
+        name: "conversionProfile",
+        type: "options",
+        options: [
+          {
+            name: "Fast",
+            value: "fast",
+            description: "No OCR, fast table model, smaller figure images",
+          },
+          {
+            name: "Balanced",
+            value: "balanced",
+            description: "OCR only for PDFs without a text layer, no page images",
+          },
+          {
+            name: "Full",
+            value: "full",
+            description: "OCR and page images for every PDF",
+          },
+        ],
+        default: "balanced",
+        description: "Docling conversion settings (speed vs. coverage of scanned pages)",
+      },
       {
         displayName: "Max Chunks (optional)",
         name: "maxChunks",
@@ -160,6 +142,23 @@ export class C3Embedder implements INodeType {
         default: 0,
         description: "Maximum number of chunks to return (0 = all)",
       },
+      {
+        displayName: "Worker URL (optional)",
+        name: "workerUrl",
+        type: "string",
+        default: "",
+        placeholder: "e.g., http://127.0.0.1:8765",
+        description:
+          "Resident worker (scripts/worker.py) to run extraction and chunking on; empty = N8N_C3_WORKER_URL, or spawn Python per item",
+      },
+      {
+        displayName: "Streaming Pipeline",
+        name: "streamingPipeline",
+        type: "boolean",
+        default: false,
+        description:
+          "Run conversion, image captioning and embedding as one overlapping pipeline (pipeline.py) instead of extract.py then chunker.py",
+      },
     ],
   };
 
@@ -206,6 +205,21 @@ export class C3Embedder implements INodeType {
     const filePath = this.getNodeParameter("filePath", 0) as string;
     const concurrency = this.getNodeParameter("concurrency", 0) as number;
     const maxChunks = this.getNodeParameter("maxChunks", 0) as number;
+    const conversionProfile = this.getNodeParameter(
+      "conversionProfile",
+      0,
+      "balanced"
+    ) as string;
+    const streamingPipeline = this.getNodeParameter(
+      "streamingPipeline",
+      0,
+      false
+    ) as boolean;
+    const workerUrl = (
+      (this.getNodeParameter("workerUrl", 0, "") as string) ||
+      process.env.N8N_C3_WORKER_URL ||
+      ""
+    ).replace(/\/+$/, "");
 
     // Step 1: Extract document to markdown
     const outRoot = join(tmpdir(), `n8n-output-${Date.now()}`);
@@ -228,7 +242,25 @@ export class C3Embedder implements INodeType {
       }
     }
 
-    const pythonBin = findPython();
+    // Resident worker: same CLI args, same stdout, one warm converter
+    const runOnWorker = async (
+      path: string,
+      args: string[]
+    ): Promise<{ code: number; stdout: string; stderr: string }> => {
+      const body = (await this.helpers.httpRequest({
+        method: "POST",
+        url: `${workerUrl}${path}`,
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ args }),
+        json: false,
+      })) as string;
+      const trailer = body.trimEnd().split(/\r?\n/).pop() || "";
+      return trailer === "[worker] done"
+        ? { code: 0, stdout: body, stderr: "" }
+        : { code: 1, stdout: body, stderr: trailer };
+    };
+
+    const pythonBin = workerUrl ? "" : findPython();
     const extractScript = resolve(__dirname, "../extract.py");
     const extractCwd = dirname(resolve(__dirname, ".."));
 
@@ -240,49 +272,22 @@ export class C3Embedder implements INodeType {
       outDir,
       "--image-mode",
       "referenced",
+      "--profile",
+      conversionProfile,
       "--concurrency",
       String(concurrency),
       "--describe-images",
     ];
 
-    // Run extract.py
-    const runExtract = (): Promise<{
-      code: number;
-      stdout: string;
-      stderr: string;
-    }> =>
-      new Promise((res, rej) => {
-        const child = spawn(pythonBin, extractArgs, {
-          cwd: extractCwd,
-          env: process.env,
-        });
-        let stdout = "",
-          stderr = "";
-        child.stdout.on("data", (d) => (stdout += d.toString()));
-        child.stderr.on("data", (d) => (stderr += d.toString()));
-        child.on("error", rej);
-        child.on("close", (code) => res({ code: code ?? -1, stdout, stderr }));
-      });
-
-    const extractResult = await runExtract();
-    if (extractResult.code !== 0) {
-      throw new NodeOperationError(
-        this.getNode(),
-        `extract.py failed (code ${extractResult.code}).\n${extractResult.stderr}\n${extractResult.stdout}`
-      );
-    }
+    type RunResult = { code: number; stdout: string; stderr: string };
 
-    // Step 2: Chunk and generate embeddings
-    const chunkerScript = resolve(__dirname, "../chunker.py");
+    // Max Chunks also bounds what gets embedded (chunker.py logs the truncation)
+    const maxChunksArgs = maxChunks > 0 ? ["--max-chunks", String(maxChunks)] : [];
 
-    const runChunker = (): Promise<{
-      code: number;
-      stdout: string;
-      stderr: string;
-    }> =>
+    const runPython = (args: string[], cwd: string): Promise<RunResult> =>
       new Promise((res, rej) => {
-        const child = spawn(pythonBin, [chunkerScript], {
-          cwd: outRoot,
+        const child = spawn(pythonBin, args, {
+          cwd,
           env: process.env,
         });
         let stdout = "",
@@ -293,16 +298,72 @@ export class C3Embedder implements INodeType {
         child.on("close", (code) => res({ code: code ?? -1, stdout, stderr }));
       });
 
-    const chunkerResult = await runChunker();
-    if (chunkerResult.code !== 0) {
-      throw new NodeOperationError(
-        this.getNode(),
-        `chunker.py failed (code ${chunkerResult.code}).\n${chunkerResult.stderr}\n${chunkerResult.stdout}`
-      );
+    let chunkerResult: RunResult;
+    if (streamingPipeline) {
+      // Extract, caption and embed in one process with overlapping stages
+      const pipelineScript = resolve(__dirname, "../pipeline.py");
+      const pipelineArgs = [
+        pipelineScript,
+        "--in",
+        tempInDir,
+        "--out",
+        outDir,
+        "--image-mode",
+        "referenced",
+        "--profile",
+        conversionProfile,
+        "--caption-concurrency",
+        String(concurrency),
+        "--describe-images",
+        "--output-format",
+        "ndjson",
+        ...maxChunksArgs,
+      ];
+      chunkerResult = workerUrl
+        ? await runOnWorker("/pipeline", pipelineArgs.slice(1))
+        : await runPython(pipelineArgs, extractCwd);
+      if (chunkerResult.code !== 0) {
+        throw new NodeOperationError(
+          this.getNode(),
+          `pipeline.py failed (code ${chunkerResult.code}).\n${chunkerResult.stderr}\n${chunkerResult.stdout}`
+        );
+      }
+    } else {
+      // Run extract.py
+      const extractResult = workerUrl
+        ? await runOnWorker("/extract", extractArgs.slice(1))
+        : await runPython(extractArgs, extractCwd);
+      if (extractResult.code !== 0) {
+        throw new NodeOperationError(
+          this.getNode(),
+          `extract.py failed (code ${extractResult.code}).\n${extractResult.stderr}\n${extractResult.stdout}`
+        );
+      }
+
+      // Step 2: Chunk and generate embeddings
+      const chunkerScript = resolve(__dirname, "../chunker.py");
+      chunkerResult = workerUrl
+        ? await runOnWorker("/chunk", [
+            "--root",
+            outDir,
+            "--output-format",
+            "ndjson",
+            ...maxChunksArgs,
+          ])
+        : await runPython(
+            [chunkerScript, "--output-format", "ndjson", ...maxChunksArgs],
+            outRoot
+          );
+      if (chunkerResult.code !== 0) {
+        throw new NodeOperationError(
+          this.getNode(),
+          `chunker.py failed (code ${chunkerResult.code}).\n${chunkerResult.stderr}\n${chunkerResult.stdout}`
+        );
+      }
     }
 
-    // Parse chunker output
-    const parsed = parseStdout(chunkerResult.stdout);
+    // Parse chunker output (NDJSON records with packed float32 vectors)
+    const parsed = parseNdjson(chunkerResult.stdout);
     const limited = maxChunks > 0 ? parsed.slice(0, maxChunks) : parsed;
 
     // Return chunks with document metadata
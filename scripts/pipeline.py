@@ -0,0 +1,331 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Coroutine, Dict, Iterable, List, Optional, Set, TextIO, Tuple
+
+import chunker
+import extract
+from chunkio import QUANT_MODES
+from metrics import add_arguments as add_metrics_arguments, begin_run, log
+from metrics import report as report_metrics
+from scheduler import PRIORITIES, all_stats
+
+# ─────────────────────────── Streaming extract → caption → embed pipeline ───────────────────────────
+# Runs extract.py and chunker.py as one process with the three stages
+# overlapping across documents:
+#
+#   files ─▶ convert (CPU: thread, or extract.py's process pool) ─▶ q ─▶ tables + captions (network) + section ─▶ q ─▶ embed + emit
+#
+# Queues are bounded so a fast stage blocks instead of piling up documents.
+# Each document's chunks are printed (in chunker.py's stdout format) as soon
+# as its markdown is final, so output order follows completion order. With
+# --dedup, documents are still marked in input order.
+
+_DONE = object()
+Plan = Tuple[List[int], Dict[str, List[Any]], List[str]]  # chunker.plan_incremental: indices, delta, hashes
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Streaming Docling → Markdown → chunks + embeddings, with overlapping stages.")
+    p.add_argument("--in", dest="in_dir", required=True,
+                   help="Input folder (e.g., ./data)")
+    p.add_argument("--out", dest="out_dir", required=True,
+                   help="Output folder for markdown + artifacts (e.g., ./out)")
+    p.add_argument(
+        "--image-mode", choices=["referenced", "embedded"], default="referenced")
+    p.add_argument("--describe-images", action="store_true",
+                   help="Replace images/placeholders with full textual descriptions.")
+    p.add_argument("--workers", type=int, default=1,
+                   help="Conversion processes (1 = one in-process converter on a thread).")
+    p.add_argument("--profile", choices=list(extract.CONVERSION_PROFILES), default=extract.DEFAULT_PROFILE,
+                   help="Conversion profile (see extract.py).")
+    p.add_argument("--shard-pages", type=int, default=0,
+                   help="Convert PDFs longer than this as parallel page-range shards (see extract.py).")
+    p.add_argument("--caption-concurrency", type=int, default=10,
+                   help="Max concurrent image descriptions across all documents (the process-wide "
+                        "caption scheduler's ceiling; a resident worker's jobs share it).")
+    p.add_argument("--caption-docs", type=int, default=2,
+                   help="Documents being captioned at once.")
+    p.add_argument("--embed-concurrency", type=int, default=4,
+                   help="Max concurrent embeddings requests across all documents (the process-wide "
+                        "embeddings scheduler's ceiling; a resident worker's jobs share it).")
+    p.add_argument("--embed-docs", type=int, default=2,
+                   help="Documents being embedded at once.")
+    p.add_argument("--priority", choices=sorted(PRIORITIES), default="interactive",
+                   help="Queue position for Azure calls against other jobs in this process.")
+    p.add_argument("--queue-size", type=int, default=2,
+                   help="Max documents waiting between two stages.")
+    p.add_argument("--no-cache", action="store_true",
+                   help="Disable the embedding and image description caches.")
+    p.add_argument("--output-format", choices=["text", "ndjson"], default="text",
+                   help="Chunk output format (see chunker.py).")
+    p.add_argument("--vectors-npy", default=None,
+                   help="With --output-format ndjson: write vectors to this .npy instead of inline base64.")
+    p.add_argument("--dimensions", type=int, default=chunker.EMBED_DIMENSIONS,
+                   help="Embedding size requested from the model (see chunker.py).")
+    p.add_argument("--quantize", choices=QUANT_MODES, default="none",
+                   help="With --output-format ndjson: vector encoding (see chunker.py).")
+    p.add_argument("--max-chunks", type=int, default=0,
+                   help="Keep only the first N chunks of each file (0 = all; see chunker.py).")
+    p.add_argument("--dedup", action="store_true",
+                   help="Embed near-duplicate chunks once across the run (see chunker.py --dedup).")
+    p.add_argument("--dedup-threshold", type=float, default=0.8,
+                   help="Estimated Jaccard similarity at which two chunks count as duplicates.")
+    p.add_argument("--dedup-scope", choices=["global", "company"], default="global",
+                   help="Duplicate scope (see chunker.py).")
+    p.add_argument("--bm25-index", default=None,
+                   help="Also add the emitted chunks to this local BM25 keyword index (see chunker.py).")
+    p.add_argument("--bm25-company", default="",
+                   help="Company stored on chunks added to --bm25-index.")
+    p.add_argument("--incremental", action="store_true",
+                   help="Skip unchanged inputs and embed only changed chunks (see extract.py / chunker.py --incremental).")
+    add_metrics_arguments(p)
+    return p.parse_args(argv)
+
+
+def stage_args(args: argparse.Namespace) -> Tuple[argparse.Namespace, argparse.Namespace]:
+    """Build extract.py / chunker.py namespaces so their defaults stay in one place."""
+    ex = ["--in", args.in_dir, "--out", args.out_dir, "--image-mode", args.image_mode, "--profile", args.profile,
+          "--concurrency", str(args.caption_concurrency)]
+    ch = ["--root", args.out_dir, "--concurrency", str(args.embed_concurrency),
+          "--output-format", args.output_format, "--dimensions", str(args.dimensions), "--quantize", args.quantize,
+          "--max-chunks", str(args.max_chunks)]
+    ex += ["--priority", args.priority]
+    ch += ["--priority", args.priority]
+    if args.vectors_npy:
+        ch += ["--vectors-npy", args.vectors_npy]
+    if args.dedup:
+        ch += ["--dedup", "--dedup-threshold", str(args.dedup_threshold), "--dedup-scope", args.dedup_scope]
+    if args.bm25_index:
+        ch += ["--bm25-index", args.bm25_index, "--bm25-company", args.bm25_company]
+    if args.describe_images:
+        ex.append("--describe-images")
+    if args.no_cache:
+        ex.append("--no-image-cache")
+        ch.append("--no-cache")
+    if args.incremental:
+        ex.append("--incremental")
+        ch.append("--incremental")
+    return extract.parse_args(ex), chunker.parse_args(ch)
+
+
+async def _stage(name: str, n: int, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue],
+                 fn: Callable[[Any], Awaitable[Any]], failed: List[str]) -> None:
+    """Run n consumers of inbox; each result is put on outbox. Errors drop only that document."""
+
+    async def _consumer() -> None:
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                break
+            try:
+                result = await fn(item)
+            except Exception as e:
+                f: Path = item[0]
+                log.error(f"[{name} error] {f.name}: {type(e).__name__}: {e}")
+                failed.append(f.name)
+                continue
+            if outbox is not None:
+                await outbox.put(result)
+
+    await asyncio.gather(*(_consumer() for _ in range(max(1, n))))
+
+
+async def run_async(args: argparse.Namespace, out: TextIO = sys.stdout,
+                    converter: Optional[extract.ProfileConverter] = None) -> List[str]:
+    """
+    Returns the names of documents that failed in any stage. With --workers 1,
+    converter (e.g. the resident worker's warm one) is used instead of a new one.
+    """
+    begin_run(args.log_level)
+    ex_args, ch_args = stage_args(args)
+    # fail on missing Azure config before any conversion starts
+    chunker.azure_client()
+    if args.describe_images:
+        extract.azure_client()
+    files = extract.list_input_files(ex_args)
+    out_dir = Path(ex_args.out_dir).resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    image_mode = extract.image_ref_mode(ex_args)
+    image_cache = extract.open_image_cache(ex_args)
+    embed_cache = chunker.open_cache(ch_args)
+    embed_scheduler = chunker.embedding_scheduler(ch_args.concurrency, ch_args.rpm, ch_args.tpm)
+
+    count_tokens = chunker.get_token_counter(ch_args.tokenizer)
+    writer = chunker.open_writer(ch_args, out)
+    dedup = chunker.open_dedup(ch_args)
+    keywords = chunker.open_bm25(ch_args)
+
+    # Incremental: unchanged sources never enter the pipeline
+    ex_manifest = extract.open_manifest(ex_args)
+    ch_manifest = chunker.open_manifest(ch_args)
+    ex_options = extract.extract_options_key(ex_args)
+    ch_options = chunker.chunk_options_key(ch_args)
+    hashes: Dict[str, str] = {}
+    listed = {f.name for f in files}
+    if ex_manifest:
+        files, hashes = extract.skip_unchanged(files, ex_manifest, ex_options, sys.stderr)
+
+    loop = asyncio.get_running_loop()
+    converted: asyncio.Queue = asyncio.Queue(maxsize=max(1, args.queue_size))
+    finished: asyncio.Queue = asyncio.Queue(maxsize=max(1, args.queue_size))
+    failed: List[str] = []
+    image_report: Dict[str, int] = {}
+    t0 = time.perf_counter()
+    # --dedup: documents are marked in input order whatever order they finish in, so
+    # the representative of a group is its first copy by (file, index), as in chunker.py.
+    # turns[name] is set once that document is marked (or has failed before it);
+    # embedded[md path] once its chunks are embedded, and unembedded collects
+    # representatives that got no vector, so their copies can stand in for them.
+    turns = {f.name: asyncio.Event() for f in files}
+    previous = {f.name: files[k - 1].name for k, f in enumerate(files) if k}
+    embedded: Dict[str, asyncio.Event] = {}
+    unembedded: Set[Tuple[str, int]] = set()
+
+    def _produce() -> None:
+        """Conversion stage (on its own thread): blocks when the caption stage is behind."""
+        results: Iterable[Tuple[Path, Optional[Path], Optional[BaseException]]]
+        if args.workers > 1:
+            results = extract.convert_files_in_pool(
+                files, out_dir, image_mode, args.workers, shard_pages=args.shard_pages, profile=args.profile)
+        else:
+            results = extract.convert_files_serially(converter or extract.build_converter(args.profile), files,
+                                                     out_dir, image_mode, args.shard_pages, args.profile)
+        try:
+            for f, md_path, err in results:
+                if md_path is None:
+                    log.error(f"[convert error] {f.name}: {type(err).__name__}: {err}")
+                    failed.append(f.name)
+                    loop.call_soon_threadsafe(turns[f.name].set)
+                    continue
+                log.info(f"[ok] {f.name} -> {md_path}")
+                asyncio.run_coroutine_threadsafe(converted.put((f, md_path)), loop).result()
+        finally:
+            for _ in range(max(1, args.caption_docs)):
+                asyncio.run_coroutine_threadsafe(converted.put(_DONE), loop).result()
+
+    async def _postprocess(item: Tuple[Path, Path]) -> None:
+        f, md_path = item
+        try:
+            md_text = await extract.postprocess_markdown_async(md_path, ex_args, image_cache, image_report)
+            if ex_manifest:
+                extract.record_converted(ex_manifest, f, hashes[f.name], ex_options, md_path)
+            # chunk the final text directly; no second read of the file. CPU-bound, so
+            # off the event loop: captions and embeddings of other documents keep going
+            chunks = await asyncio.to_thread(
+                chunker.chunk_markdown,
+                md_text, ch_args.max_tokens, ch_args.overlap_tokens, count_tokens, ch_args.max_chunks, md_path.name)
+            plan: Optional[Plan] = None
+            if ch_manifest:
+                all_chunks = chunks
+                chunks, indices, delta, chunk_hashes = chunker.plan_incremental(
+                    ch_manifest, str(md_path.relative_to(out_dir)), chunks, ch_options)
+                plan = (indices, delta, chunk_hashes)
+            if dedup:
+                if f.name in previous:
+                    await turns[previous[f.name]].wait()
+                if plan is not None:
+                    kept = chunker.kept_indices(plan[1])
+                    chunker.seed_duplicates(dedup, out_dir, md_path, [all_chunks[i - 1] for i in kept],
+                                            ch_args.dedup_scope, kept)
+                chunker.mark_duplicates(dedup, out_dir, md_path, chunks, ch_args.dedup_scope,
+                                        plan[0] if plan else None)
+                embedded[str(md_path)] = asyncio.Event()
+            # queued before the next document may mark, so the embed stage takes
+            # representatives before the copies that wait for them
+            await finished.put((f, md_path, chunks, plan))
+        finally:
+            turns[f.name].set()
+
+    async def _embed(item: Tuple[Path, Path, List[chunker.Chunk], Optional[Plan]]) -> None:
+        _f, md_path, chunks, plan = item
+        indices, delta, chunk_hashes = plan if plan else (None, None, [])
+        embed_args = (ch_args.batch_size, ch_args.batch_tokens, ch_args.concurrency, ch_args.retries,
+                      embed_cache, embed_scheduler, PRIORITIES[ch_args.priority], ch_args.dimensions,
+                      count_tokens)
+        keys = [(str(md_path), i) for i in indices or range(1, len(chunks) + 1)]
+        embeddings: List[List[float]] = [[] for _ in chunks]
+        try:
+            embeddings = await chunker.embed_chunks(chunks, *embed_args)
+            if dedup:
+                # representatives in documents still embedding: wait, then stand in for any that failed
+                reps = {sec["duplicate_of"]["file"] for sec, _t, _o in chunks if sec.get("duplicate_of")}
+                await asyncio.gather(*(embedded[r].wait() for r in reps - {str(md_path)} if r in embedded))
+                await chunker.embed_promoted(chunks, keys, embeddings, unembedded, *embed_args)
+        finally:
+            if dedup:
+                unembedded.update(key for key, (sec, _t, _o), vec in zip(keys, chunks, embeddings)
+                                  if not vec and not sec.get("duplicate_of"))
+                embedded[str(md_path)].set()
+        chunker.emit_file(md_path, chunks, embeddings, out, writer, indices, delta)
+        if keywords is not None:
+            chunker.index_keywords(keywords, md_path, chunks, embeddings, indices, delta, ch_args.bm25_company)
+        if ch_manifest:
+            chunker.record_incremental(ch_manifest, str(md_path.relative_to(out_dir)), chunk_hashes, indices,
+                                       chunks, embeddings, ch_options)
+            ch_manifest.save()
+        log.info(f"[pipeline] {md_path.name} emitted at {time.perf_counter() - t0:.1f}s")
+
+    async def _caption_stage() -> None:
+        await _stage("caption", args.caption_docs, converted, None, _postprocess, failed)
+        for _ in range(max(1, args.embed_docs)):
+            await finished.put(_DONE)
+
+    try:
+        await asyncio.gather(
+            asyncio.to_thread(_produce),
+            _caption_stage(),
+            _stage("embed", args.embed_docs, finished, None, _embed, failed),
+        )
+        if ex_manifest and ch_manifest:
+            # sources that disappeared from --in-dir since the last run: every chunk is removed
+            gone = sorted(set(ex_manifest.entries) - listed)
+            chunker.remove_files(ch_manifest, out_dir, [
+                str(Path(ex_manifest.entries[name]["md_path"]).relative_to(out_dir)) for name in gone],
+                out, writer, keywords)
+            ch_manifest.save()
+            for name in gone:
+                ex_manifest.remove(name)
+            ex_manifest.save()
+    finally:
+        if writer:
+            writer.close()
+        if keywords is not None:
+            keywords.save()
+            log.info(f"[bm25] {json.dumps(keywords.stats())}")
+        for name, cache in (("image cache", image_cache), ("embedding cache", embed_cache)):
+            if cache:
+                log.info(f"[{name}] {json.dumps(cache.stats())}")
+                cache.close()
+        if dedup:
+            log.info(f"[dedup] {json.dumps(dedup.stats())}")
+        if args.describe_images:
+            log.info(f"[image filter] total {json.dumps(image_report)}")
+        for stats in all_stats():
+            log.info(f"[scheduler] {json.dumps(stats)}")
+        report_metrics("pipeline", args.metrics_json, args.metrics_prom, files=len(files), failed=len(failed))
+    return failed
+
+
+def run(args: argparse.Namespace, converter: Optional[extract.ProfileConverter] = None, out: TextIO = sys.stdout,
+        runner: Callable[[Coroutine[Any, Any, Any]], Any] = asyncio.run) -> None:
+    """run_async on runner (the resident worker passes its own loop); exits if any document failed."""
+    failed = runner(run_async(args, out, converter))
+    if failed:
+        sys.exit(f"{len(failed)} file(s) failed: {', '.join(failed)}")
+
+
+def main() -> None:
+    run(parse_args())
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except BrokenPipeError:
+        sys.exit(0)
@@ -0,0 +1,287 @@
+from __future__ import annotations
+import asyncio
+import heapq
+import itertools
+import random
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Tuple, TypeVar
+
+from metrics import log
+
+# ─────────────────────────── Rate-limit-aware request scheduler ───────────────────────────
+# One Scheduler per Azure deployment, shared by every caller in the process
+# (captioning, embeddings, all worker jobs):
+#
+#   - token buckets for requests/min and tokens/min (0 = no client-side budget)
+#   - AIMD concurrency: +1 slot per window of successes, halved on a 429
+#   - retry-after / retry-after-ms pause all dispatch; x-ratelimit-remaining-*
+#     clamp the buckets and hold back increases when quota runs low
+#   - waiting requests are served interactive first, then backfill
+#
+# stats() is safe to read from other threads (worker /health).
+
+T = TypeVar("T")
+
+INTERACTIVE = 0
+BACKFILL = 1
+PRIORITIES = {"interactive": INTERACTIVE, "backfill": BACKFILL}
+
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class RetryableError(Exception):
+    """Raised by a call's parse callback for a response worth asking for again (e.g. empty)."""
+
+
+def is_transient(e: BaseException) -> bool:
+    """429/5xx, connection errors and timeouts, or RetryableError; anything else is final."""
+    status = getattr(e, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    if isinstance(e, (RetryableError, TimeoutError, ConnectionError)):
+        return True
+    # the SDK's connection errors (APITimeoutError is one); only checked if it is already loaded
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(e, openai.APIConnectionError)
+
+
+class TokenBucket:
+    """
+    Refills at per_minute/60 per second. Capacity is one 10-second share of the
+    budget (Azure enforces quotas over short windows, not whole minutes).
+    A request larger than the capacity is let through once the bucket is full.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.configure(per_minute)
+
+    def configure(self, per_minute: float) -> None:
+        self.per_minute = per_minute
+        self.rate = max(0.0, per_minute) / 60.0
+        self.capacity = max(1.0, per_minute / 6.0)
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait(self, n: float, now: float) -> float:
+        """Seconds until n units are available (0 = now)."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        need = min(n, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def take(self, n: float) -> None:
+        if self.rate:
+            self.level -= n  # may go negative: a large request is paid back before the next
+
+    def clamp(self, remaining: float, now: float) -> None:
+        if self.rate:
+            self._refill(now)
+            self.level = min(self.level, remaining)
+
+
+def _header(headers: Optional[Mapping[str, str]], name: str) -> Optional[float]:
+    if not headers:
+        return None
+    try:
+        value = headers.get(name)
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    ms = _header(headers, "retry-after-ms")
+    if ms is not None:
+        return ms / 1000.0
+    return _header(headers, "retry-after")
+
+
+class Scheduler:
+    def __init__(self, name: str, max_concurrency: int = 4, rpm: float = 0, tpm: float = 0,
+                 min_concurrency: int = 1) -> None:
+        self.name = name
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.counters: Dict[str, int] = {
+            "requests": 0, "tokens": 0, "succeeded": 0, "failed": 0, "retries": 0, "throttled": 0}
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._bind()
+
+    def configure(self, max_concurrency: int, rpm: float, tpm: float) -> None:
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.limit = min(self.limit, float(self.max_concurrency))
+        if rpm != self.requests.per_minute:
+            self.requests.configure(rpm)
+        if tpm != self.tokens.per_minute:
+            self.tokens.configure(tpm)
+
+    def _bind(self) -> None:
+        # per-event-loop state; extract.py runs one asyncio.run() per document
+        self._waiters: List[Tuple[int, int, int, asyncio.Future]] = []
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    # ---- slots ----
+
+    async def _acquire(self, tokens: int, priority: int) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._bind()
+        fut = loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, fut))
+        self._pump()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release()
+            raise
+
+    def _release(self) -> None:
+        self._in_flight -= 1
+        self._pump()
+
+    def _pump(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = time.monotonic()
+        wait = 0.0
+        while self._waiters and self._in_flight < int(self.limit):
+            _prio, _seq, tokens, fut = self._waiters[0]
+            if fut.done():  # cancelled while queued
+                heapq.heappop(self._waiters)
+                continue
+            wait = max(self._paused_until - now,
+                       self.requests.wait(1, now), self.tokens.wait(tokens, now))
+            if wait > 0:
+                break
+            heapq.heappop(self._waiters)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self._in_flight += 1
+            fut.set_result(None)
+        if wait > 0 and self._loop is not None:
+            self._timer = self._loop.call_later(wait, self._pump)
+
+    # ---- feedback ----
+
+    def _observe(self, headers: Optional[Mapping[str, str]], tokens: int) -> bool:
+        """Apply rate-limit headers; True if quota is running low."""
+        now = time.monotonic()
+        low = False
+        rem_requests = _header(headers, "x-ratelimit-remaining-requests")
+        if rem_requests is not None:
+            self.requests.clamp(rem_requests, now)
+            low = low or rem_requests <= self._in_flight
+        rem_tokens = _header(headers, "x-ratelimit-remaining-tokens")
+        if rem_tokens is not None:
+            self.tokens.clamp(rem_tokens, now)
+            low = low or rem_tokens < 2 * tokens
+        return low
+
+    def _on_success(self, headers: Optional[Mapping[str, str]], tokens: int) -> None:
+        self.counters["succeeded"] += 1
+        if not self._observe(headers, tokens) and self.limit < self.max_concurrency:
+            self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+
+    def _on_throttle(self, headers: Optional[Mapping[str, str]], tokens: int, fallback: float) -> float:
+        """Record a 429: halve concurrency (once per second at most) and pause dispatch."""
+        self.counters["throttled"] += 1
+        self._observe(headers, tokens)
+        now = time.monotonic()
+        before = self.limit
+        if now - self._last_decrease >= 1.0:
+            self.limit = max(float(self.min_concurrency), self.limit / 2)
+            self._last_decrease = now
+        delay = _retry_after(headers)
+        delay = fallback if delay is None else delay
+        self._paused_until = max(self._paused_until, now + delay)
+        log.warning(f"[throttle] {self.name} 429 retry in {delay:.2f}s, "
+                    f"concurrency {int(before)}→{int(self.limit)}")
+        return delay
+
+    # ---- public ----
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], tokens: int = 0, priority: int = INTERACTIVE,
+                   retries: int = 3, parse: Optional[Callable[[Any], T]] = None) -> T:
+        """
+        Run fn() under the budgets, retrying 429/5xx, connection errors and timeouts
+        up to retries attempts in total; other errors are raised at once. fn may
+        return a raw response (with .headers); parse turns it into the result and
+        may raise RetryableError to trigger a retry.
+        """
+        delay = 0.8
+        for attempt in range(1, max(1, retries) + 1):
+            await self._acquire(tokens, priority)
+            self.counters["requests"] += 1
+            self.counters["tokens"] += tokens
+            try:
+                raw = await fn()
+                headers = getattr(raw, "headers", None)
+                result = parse(raw) if parse else raw
+                self._on_success(headers, tokens)
+                return result
+            except Exception as e:
+                status = getattr(e, "status_code", None)
+                retryable = is_transient(e)
+                if status == 429:
+                    response = getattr(e, "response", None)
+                    wait = self._on_throttle(getattr(response, "headers", None), tokens,
+                                             delay + random.random() * 0.4)
+                else:
+                    wait = delay + random.random() * 0.4
+                if not retryable or attempt >= retries:
+                    self.counters["failed"] += 1
+                    raise
+                self.counters["retries"] += 1
+                delay *= 2
+            finally:
+                self._release()
+            await asyncio.sleep(wait)
+        raise RuntimeError("retries exhausted")
+
+    def stats(self) -> Dict[str, Any]:
+        queued = {"interactive": 0, "backfill": 0}
+        for prio, _seq, _tokens, fut in list(self._waiters):
+            if not fut.done():
+                queued["interactive" if prio == INTERACTIVE else "backfill"] += 1
+        return {
+            "name": self.name,
+            "concurrency": int(self.limit),
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "queued": queued,
+            "paused_s": round(max(0.0, self._paused_until - time.monotonic()), 1),
+            **self.counters,
+        }
+
+
+_SCHEDULERS: Dict[str, Scheduler] = {}
+
+
+def get_scheduler(name: str, max_concurrency: int = 4, rpm: float = 0, tpm: float = 0) -> Scheduler:
+    """The process-wide scheduler for one deployment, (re)configured with the given budgets."""
+    sched = _SCHEDULERS.get(name)
+    if sched is None:
+        sched = _SCHEDULERS[name] = Scheduler(name, max_concurrency, rpm, tpm)
+    else:
+        sched.configure(max_concurrency, rpm, tpm)
+    return sched
+
+
+def all_stats() -> List[Dict[str, Any]]:
+    return [s.stats() for s in list(_SCHEDULERS.values())]
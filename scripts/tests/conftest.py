@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the scripts are flat modules (import chunker, import chunkio, ...), as in bench/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
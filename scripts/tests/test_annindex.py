@@ -0,0 +1,62 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+
+import pytest
+
+np = pytest.importorskip("numpy")
+import annindex  # noqa: E402
+from annindex import AnnIndex  # noqa: E402
+
+
+def _rec(file: str, i: int, vec: List[float], company: str = "") -> Dict[str, Any]:
+    return {"file": file, "index": i, "heading_path": ["H"], "page": 1, "token_count": 3,
+            "text": f"{file} {i}", "embedding": vec, "company": company}
+
+
+def _hits(index: AnnIndex, query: List[float], **kw: Any) -> List[Any]:
+    return [(h["file"], h["index"]) for h in index.search([query], **kw)[0]]
+
+
+def test_exact_search_filters_and_replaces(tmp_path) -> None:
+    index = AnnIndex(tmp_path / "idx")
+    stats = index.add_records([_rec("a.md", 1, [1, 0, 0]), _rec("a.md", 2, [0, 1, 0], "ACME"),
+                               _rec("b.md", 1, [0.9, 0.1, 0])], company="Default")
+    assert stats == {"added": 3, "removed": 0, "rows": 3}
+    assert _hits(index, [1, 0, 0], k=2) == [("a.md", 1), ("b.md", 1)]
+    assert _hits(index, [1, 0, 0], filters={"company": "ACME"}) == [("a.md", 2)]
+    assert _hits(index, [1, 0, 0], filters={"file": "b.md"}) == [("b.md", 1)]
+
+    index.add_records([_rec("a.md", 1, [0, 0, 1])])  # re-chunked: replaces the old row
+    index.save()
+    reopened = AnnIndex(tmp_path / "idx")
+    assert len(reopened) == 3
+    assert _hits(reopened, [0, 0, 1], k=1) == [("a.md", 1)]
+    assert reopened.search([[0, 0, 1]], k=1)[0][0]["score"] == pytest.approx(1.0)
+
+
+def test_delta_deletes_and_moves(tmp_path) -> None:
+    index = AnnIndex(tmp_path / "idx")
+    index.add_records([_rec("a.md", i, [float(i), 1, 0]) for i in range(1, 4)])
+    stats = index.add_records([{"type": "delta", "file": "a.md", "removed": [1], "moved": [[3, 4]]},
+                               {**_rec("a.md", 2, [0, 1, 0]), "duplicate_of": ["b.md", 7]}])
+    assert stats["removed"] == 2 and len(index) == 1
+    assert _hits(index, [1, 0, 0]) == [("a.md", 4)]
+
+
+def test_ivf_search_matches_exact(tmp_path) -> None:
+    rng = np.random.default_rng(1)
+    centres = rng.normal(size=(8, 16))
+    vecs = np.repeat(centres, 40, axis=0) + rng.normal(scale=0.05, size=(320, 16))
+    index = AnnIndex(tmp_path / "idx")
+    index.add(vecs.tolist(), [{"file": "f.md", "index": i} for i in range(len(vecs))])
+    index.train(nlist=8)
+    queries = (centres + rng.normal(scale=0.05, size=centres.shape)).tolist()
+    approx = index.search(queries, k=5, nprobe=2)
+    exact = index.search(queries, k=5, exact=True)
+    assert [[h["row"] for h in hits] for hits in approx] == [[h["row"] for h in hits] for hits in exact]
+
+
+def test_missing_numpy_raises_import_error(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(annindex, "np", None)
+    with pytest.raises(ImportError, match="needs numpy"):
+        AnnIndex(tmp_path / "idx")
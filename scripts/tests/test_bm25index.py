@@ -0,0 +1,76 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+
+import pytest
+
+pytest.importorskip("numpy")
+import bm25index  # noqa: E402
+from annindex import AnnIndex  # noqa: E402
+from bm25index import Bm25Index, hybrid_search, tokenize  # noqa: E402
+
+TEXTS = {
+    1: "Control AC-2 covers account management for all systems.",
+    2: "Account reviews happen quarterly; access is revoked on exit.",
+    3: "Transmission capacity grows by 2030 across the network.",
+    4: "Patch CVE-2024-3094 in xz before the next release.",
+}
+
+
+def _recs(file: str = "a.md", company: str = "") -> List[Dict[str, Any]]:
+    return [{"file": file, "index": i, "heading_path": ["H"], "page": 1, "token_count": 9, "text": t,
+             "company": company} for i, t in TEXTS.items()]
+
+
+def _hits(index: Bm25Index, text: str, **kw: Any) -> List[Any]:
+    return [(h["file"], h["index"]) for h in index.search([text], **kw)[0]]
+
+
+def test_tokenize_keeps_identifiers_whole_and_split() -> None:
+    assert tokenize("See AC-2, CVE-2024-3094.") == ["see", "ac-2", "ac", "2", "cve-2024-3094", "cve", "2024", "3094"]
+
+
+def test_search_ranks_and_filters(tmp_path) -> None:
+    index = Bm25Index(tmp_path / "kw")
+    assert index.add_records(_recs(), company="BC Hydro")["added"] == 4
+    index.add_records(_recs("b.md", company="ACME"))
+    assert _hits(index, "CVE-2024-3094", k=1) == [("a.md", 4)]
+    assert _hits(index, "account management", k=2, filters={"company": "ACME"}) == [("b.md", 1), ("b.md", 2)]
+    assert _hits(index, "nothing matches", k=3) == []
+
+    index.save()
+    reopened = Bm25Index(tmp_path / "kw")
+    assert _hits(reopened, "AC-2", k=1, filters={"file": "a.md"}) == [("a.md", 1)]
+
+
+def test_delta_and_merge_keep_results(tmp_path) -> None:
+    index = Bm25Index(tmp_path / "kw")
+    index.add_records(_recs())
+    index.flush()
+    index.add_records([{"type": "delta", "file": "a.md", "removed": [4], "moved": [[3, 5]]}])
+    index.add_records(_recs("b.md"))
+    index.merge()
+    index.save()
+    reopened = Bm25Index(tmp_path / "kw")
+    assert _hits(reopened, "CVE-2024-3094") == [("b.md", 4)]
+    assert ("a.md", 5) in _hits(reopened, "transmission capacity")
+    assert reopened.stats()["segments"] == 1 and reopened.stats()["live"] == 7
+
+
+def test_hybrid_search_fuses_both_sides(tmp_path) -> None:
+    keywords = Bm25Index(tmp_path / "kw")
+    keywords.add_records(_recs())
+    vectors = AnnIndex(tmp_path / "ann")
+    vectors.add([[1, 0], [0.8, 0.2], [0, 1], [0.1, 0.9]], _recs())
+    for fusion in ("linear", "rrf"):
+        hits = hybrid_search(keywords, vectors, ["AC-2"], [[0, 1]], k=4, fusion=fusion)[0]
+        scored = {h["index"]: h for h in hits}
+        assert scored[1]["bm25"] is not None and scored[3]["cosine"] == pytest.approx(1.0)
+        assert scored[3]["bm25"] is None
+    with pytest.raises(ValueError):
+        hybrid_search(keywords, vectors, ["x"], [[1, 0]], fusion="max")
+
+
+def test_missing_numpy_raises_import_error(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(bm25index, "np", None)
+    with pytest.raises(ImportError, match="needs numpy"):
+        Bm25Index(tmp_path / "kw")
@@ -0,0 +1,57 @@
+from __future__ import annotations
+import itertools
+
+import pytest
+
+import cache
+from cache import LRUCache, content_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Strictly increasing time.time() so access order is unambiguous."""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(cache.time, "time", lambda: float(next(ticks)))
+
+
+def test_content_key_separates_parts() -> None:
+    assert content_key("ab", "c") != content_key("a", "bc")
+    assert content_key("x", b"y") == content_key(b"x", "y")
+
+
+def test_hits_and_misses(tmp_path, clock) -> None:
+    c = LRUCache(tmp_path / "c.sqlite", 1000)
+    c.put_many([("a", b"1"), ("b", b"22")])
+    assert c.get_many(["a", "b", "zz", "a"]) == {"a": b"1", "b": b"22"}
+    assert c.get("nope") is None
+    assert c.stats() == {"hits": 2, "misses": 2, "evictions": 0, "entries": 2, "bytes": 3}
+    c.close()
+
+
+def test_evicts_least_recently_used(tmp_path, clock) -> None:
+    c = LRUCache(tmp_path / "c.sqlite", 30)
+    c.put("a", b"x" * 10)
+    c.put("b", b"x" * 10)
+    c.put("c", b"x" * 10)
+    assert c.get("a") is not None  # a is now newer than b
+    c.put("d", b"x" * 10)
+    assert c.get_many(["a", "b", "c", "d"]).keys() == {"a", "c", "d"}
+    c.put("e", b"x" * 25)  # needs room for 25 bytes: the three oldest go
+    assert c.get_many(["a", "c", "d", "e"]).keys() == {"e"}
+    s = c.stats()
+    assert (s["evictions"], s["entries"], s["bytes"]) == (4, 1, 25)
+    c.close()
+
+
+def test_shared_between_connections(tmp_path, clock) -> None:
+    one = LRUCache(tmp_path / "c.sqlite", 20)
+    two = LRUCache(tmp_path / "c.sqlite", 20)
+    one.put("a", b"x" * 15)
+    two.put("b", b"x" * 15)  # sees one's entry in the total and evicts it
+    assert one.get("a") is None and one.get("b") == b"x" * 15
+    assert two.delete(["b", "missing"]) == 1
+    two.put("c", b"1")
+    two.clear()
+    assert two.stats()["entries"] == 0
+    one.close()
+    two.close()
@@ -0,0 +1,121 @@
+from __future__ import annotations
+from typing import Any, Dict, List
+
+import pytest
+
+chunker = pytest.importorskip("chunker")  # needs openai / python-dotenv installed
+
+count = chunker.estimate_tokens
+
+
+def _section(md: str, heading: List[str] = ()) -> List[Dict[str, Any]]:
+    return [dict(start_char=0, end_char=len(md), heading_line="", heading_path=list(heading), is_root=True)]
+
+
+def _pieces(md: str, out: List[Dict[str, Any]]) -> List[str]:
+    return [md[p["start_char"]:p["end_char"]] for p in out]
+
+
+# ─────────────────────────── sections ───────────────────────────
+
+def test_sections_follow_headings() -> None:
+    md = "pre\n# A\ntext\n## B\nmore\n# C\nend\n"
+    secs = chunker.build_sections(md, chunker.find_headings(md))
+    assert [(s["heading_path"], md[s["start_char"]:s["end_char"]]) for s in secs] == [
+        (["(root)"], "pre\n"), (["A"], "# A\ntext\n"), (["A", "B"], "## B\nmore\n"), (["C"], "# C\nend\n")]
+    # short sections merge forward; the root is exempt and the last has nowhere to go
+    merged = chunker.merge_short_sections(md, secs, 12)
+    assert [md[s["start_char"]:s["end_char"]] for s in merged] == ["pre\n", "# A\ntext\n## B\nmore\n", "# C\nend\n"]
+    assert merged[1]["heading_path"] == ["A"]
+
+
+# ─────────────────────────── split_oversized_sections ───────────────────────────
+
+def test_small_section_untouched() -> None:
+    md = "Short text."
+    assert chunker.split_oversized_sections(md, _section(md), 100, 10, count) == _section(md)
+
+
+def test_pieces_fit_and_cover_without_overlap() -> None:
+    md = "\n\n".join(f"Paragraph {i}. " + "word " * 30 for i in range(20))
+    out = chunker.split_oversized_sections(md, _section(md), 100, 0, count)
+    assert len(out) > 1
+    assert all(count(t) <= 100 for t in _pieces(md, out))
+    assert out[0]["start_char"] == 0 and out[-1]["end_char"] == len(md)
+    assert all(a["end_char"] == b["start_char"] for a, b in zip(out, out[1:]))
+    # cut at paragraph ends: every later piece starts a paragraph
+    assert all(t.startswith("Paragraph") for t in _pieces(md, out))
+
+
+def test_sentence_boundary_when_no_paragraph_fits() -> None:
+    md = " ".join(f"Sentence {i} " + "x" * 30 + "." for i in range(40))
+    out = chunker.split_oversized_sections(md, _section(md), 60, 0, count)
+    assert all(count(t) <= 60 for t in _pieces(md, out))
+    assert all(t.rstrip().endswith(".") for t in _pieces(md, out))
+
+
+def test_hard_cut_without_boundaries() -> None:
+    md = "x" * 10_001
+    out = chunker.split_oversized_sections(md, _section(md), 500, 0, count)
+    assert [len(t) for t in _pieces(md, out)] == [2003] * 4 + [1989]
+
+
+def test_overlap_starts_on_boundary_and_fits() -> None:
+    md = " ".join(f"Sentence {i} " + "y" * 30 + "." for i in range(40))
+    out = chunker.split_oversized_sections(md, _section(md), 80, 20, count)
+    for a, b in zip(out, out[1:]):
+        assert a["start_char"] < b["start_char"] < a["end_char"]
+        assert count(md[b["start_char"]:a["end_char"]]) <= 20
+        assert md[b["start_char"]:].startswith("Sentence")
+    assert out[-1]["end_char"] == len(md)
+
+
+def test_pieces_keep_heading() -> None:
+    md = "## Costs\n\n" + "\n\n".join("z " * 80 for _ in range(5))
+    out = chunker.split_oversized_sections(md, _section(md, ["Costs"]), 100, 0, count)
+    assert len(out) > 1 and all(p["heading_path"] == ["Costs"] for p in out)
+
+
+# ─────────────────────────── split_tables ───────────────────────────
+
+def _report(rows: int, before: str = "Intro text here.\n\n") -> str:
+    body = "\n".join(f"r{i},value {i} " + "x" * 40 for i in range(rows))
+    return (f"# Report\n\n{before}## Costs\n\n<!-- table: {rows} rows -->\n```csv\nid,desc\n{body}\n```\n\n"
+            "After the table some words.\n")
+
+
+def test_table_rows_split_once_each() -> None:
+    md = _report(60)
+    chunks = chunker.chunk_markdown(md, max_tokens=200, overlap_tokens=0)
+    groups = [c for c in chunks if c[0].get("table_prefix")]
+    assert len(groups) > 1
+    rows = [line for c in groups for line in c[1].splitlines() if line.startswith("r")]
+    assert rows == [f"r{i},value {i} " + "x" * 40 for i in range(60)]
+    for sec, _orig, text in groups:
+        assert sec["heading_path"] == ["Report", "Costs"]
+        assert text.startswith("## Costs\n```csv\nid,desc\n")
+        assert sec["token_count"] <= 200
+    assert groups[-1][1].rstrip().endswith("```")
+
+
+def test_heading_above_table_goes_with_groups() -> None:
+    chunks = chunker.chunk_markdown(_report(60), max_tokens=200, overlap_tokens=0)
+    texts = [c[1] for c in chunks if not c[0].get("table_prefix")]
+    # the "## Costs" line is not left behind as a piece of its own or at the end of the intro
+    assert not any(t.strip() == "## Costs" or t.rstrip().endswith("## Costs") for t in texts)
+    assert chunks[0][0]["heading_path"] == ["Report"]
+    assert chunks[-1][0]["heading_path"] == ["Report", "Costs"]
+    assert "After the table" in chunks[-1][1]
+
+
+def test_small_table_not_split() -> None:
+    md = _report(3)
+    chunks = chunker.chunk_markdown(md, max_tokens=500, overlap_tokens=0)
+    assert not any(c[0].get("table_prefix") for c in chunks)
+    assert "".join(c[1] for c in chunks) == md.replace("<!-- table: 3 rows -->\n", "")  # marker dropped
+
+
+def test_find_tables_ignores_wrong_row_count() -> None:
+    md = _report(5).replace("table: 5 rows", "table: 9 rows")
+    assert chunker.find_tables(md) == []
+    assert len(chunker.find_tables(_report(5))) == 1
@@ -0,0 +1,130 @@
+from __future__ import annotations
+import io
+import json
+
+import pytest
+
+from chunkio import NdjsonChunkWriter, NpyRows, NpyWriter, dequantize, pack_f32, quantize, read_chunks, unpack_f32
+
+VEC = [0.5, -0.25, 0.0, 1.0, -1.0, 0.125, 0.3, -0.7, 0.01]
+
+
+def test_pack_f32_round_trip() -> None:
+    vec = [0.5, -0.25, 1e-3, 3.0]
+    assert unpack_f32(pack_f32(vec)) == pytest.approx(vec, abs=1e-7)
+    assert unpack_f32(pack_f32([])) == []
+
+
+@pytest.mark.parametrize("mode,tol", [("none", 1e-7), ("float16", 1e-3), ("int8", 1.0 / 127)])
+def test_quantize_round_trip(mode: str, tol: float) -> None:
+    rec = dict(quantize(VEC, mode), dims=len(VEC))
+    assert rec["quant"] == mode
+    out = dequantize(rec)
+    assert len(out) == len(VEC)
+    assert max(abs(a - b) for a, b in zip(out, VEC)) <= tol
+
+
+def test_int8_scale_and_range() -> None:
+    rec = quantize(VEC, "int8")
+    assert rec["scale"] == pytest.approx(1.0 / 127)
+    assert dequantize(dict(rec, dims=len(VEC)))[3] == pytest.approx(1.0)
+    # all-zero vectors keep a usable scale
+    assert dequantize(dict(quantize([0.0, 0.0], "int8"), dims=2)) == [0.0, 0.0]
+
+
+def test_binary_keeps_signs() -> None:
+    rec = dict(quantize(VEC, "binary"), dims=len(VEC))
+    assert dequantize(rec) == [1.0 if x > 0 else -1.0 for x in VEC]
+    assert len(quantize([1.0] * 9, "binary")["embedding_b64"]) == 4  # 2 bytes, base64
+
+
+def test_unknown_mode() -> None:
+    with pytest.raises(ValueError):
+        quantize(VEC, "int4")
+    with pytest.raises(ValueError):
+        dequantize({"quant": "int4", "embedding_b64": ""})
+
+
+def test_npy_writer_round_trip(tmp_path) -> None:
+    path = tmp_path / "v.npy"
+    w = NpyWriter(path)
+    assert w.append([1.0, 2.0]) == 0
+    assert w.append([3.0, 4.0]) == 1
+    with pytest.raises(ValueError):
+        w.append([1.0])
+    w.close()
+
+    w = NpyWriter(path, append=True)
+    assert w.append([5.0, 6.0]) == 2
+    assert w.append([7.0, 8.0]) == 3
+    w.truncate(3)
+    w.close()
+
+    rows = NpyRows(path)
+    assert len(rows) == 3 and rows.dims == 2
+    assert [rows.row(i) for i in range(3)] == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+    with pytest.raises(IndexError):
+        rows.row(3)
+    rows.close()
+
+    np = pytest.importorskip("numpy")
+    assert np.load(path, mmap_mode="r").tolist() == [[1.0, 2.0], [3.0, 4.0], [5.0, 6.0]]
+
+
+def _write(writer: NdjsonChunkWriter) -> None:
+    writer.write("a.md", 1, ["H"], 1, 3, "one", [0.5, -0.5])
+    writer.write("a.md", 2, ["H"], 2, 3, "two", [0.25, 0.75])
+    writer.close()
+
+
+def test_ndjson_inline_round_trip() -> None:
+    out = io.StringIO()
+    _write(NdjsonChunkWriter(out))
+    lines = out.getvalue().splitlines()
+    assert json.loads(lines[0])["quant"] == "none" and "embedding_b64" in lines[0]
+    recs = list(read_chunks(["[progress] not json"] + lines))
+    assert [r["embedding"] for r in recs] == [[0.5, -0.5], [0.25, 0.75]]
+    assert [(r["file"], r["index"], r["heading_path"], r["page"], r["text"]) for r in recs] == [
+        ("a.md", 1, ["H"], 1, "one"), ("a.md", 2, ["H"], 2, "two")]
+    assert "embedding_b64" not in recs[0]
+
+
+def test_ndjson_sidecar_round_trip(tmp_path) -> None:
+    out = io.StringIO()
+    _write(NdjsonChunkWriter(out, tmp_path / "v.npy"))
+    lines = out.getvalue().splitlines()
+    assert "embedding_b64" not in lines[0]
+    assert [json.loads(line)["vector_row"] for line in lines] == [0, 1]
+
+    recs = list(read_chunks(lines, tmp_path / "v.npy"))
+    assert [r["embedding"] for r in recs] == [[0.5, -0.5], [0.25, 0.75]]
+    with pytest.raises(ValueError):
+        list(read_chunks(lines))  # vector_row without the sidecar
+    assert "embedding" not in list(read_chunks(lines, vectors=False))[0]
+
+
+def test_ndjson_quantized_inline(tmp_path) -> None:
+    out = io.StringIO()
+    _write(NdjsonChunkWriter(out, quant="float16"))
+    recs = list(read_chunks(out.getvalue().splitlines()))
+    assert recs[0]["quant"] == "float16" and recs[0]["embedding"] == [0.5, -0.5]
+    assert "embedding_b64" not in recs[0]
+    with pytest.raises(ValueError):
+        NdjsonChunkWriter(io.StringIO(), tmp_path / "v.npy", quant="int8")
+
+
+def test_ndjson_duplicates_and_deltas(tmp_path) -> None:
+    out = io.StringIO()
+    writer = NdjsonChunkWriter(out, tmp_path / "v.npy")
+    writer.write_delta("a.md", {"added": [1, 2], "changed": [], "removed": [3], "unchanged": [], "moved": []})
+    writer.write("a.md", 1, ["H"], 1, 3, "one", [0.5, -0.5])
+    writer.write("a.md", 2, ["H"], None, 3, "one", [], duplicate_of={"file": "a.md", "index": 1})
+    writer.write("a.md", 4, ["H"], 2, 3, "four", [0.25, 0.75])
+    writer.close()
+    lines = out.getvalue().splitlines()
+    assert json.loads(lines[3])["vector_row"] == 1  # duplicates take no row
+
+    recs = list(read_chunks(lines, tmp_path / "v.npy"))
+    assert recs[0]["type"] == "delta" and recs[0]["removed"] == [3]
+    assert "embedding" not in recs[2] and recs[2]["duplicate_of"]["index"] == 1
+    assert [recs[1]["embedding"], recs[3]["embedding"]] == [[0.5, -0.5], [0.25, 0.75]]
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import asyncio
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+
+import scheduler
+from embedder import batch_stats, embed_texts, plan_batches
+
+
+class ApiError(Exception):
+    def __init__(self, status_code: int) -> None:
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FakeEmbeddings:
+    """
+    embeddings.with_raw_response.create stand-in: one vector [len(text)] per input,
+    400 for a batch holding "bad", and `status` for every call if set.
+    """
+
+    def __init__(self, status: int = 0) -> None:
+        self.calls: List[List[str]] = []
+        self.status = status
+        self.with_raw_response = self
+
+    async def create(self, model: str, input: List[str], **extra: Any) -> Any:
+        self.calls.append(list(input))
+        if self.status:
+            raise ApiError(self.status)
+        if any("bad" in t for t in input):
+            raise ApiError(400)
+        data = [SimpleNamespace(index=i, embedding=[float(len(t))]) for i, t in reversed(list(enumerate(input)))]
+        return SimpleNamespace(headers={}, parse=lambda: SimpleNamespace(data=data))
+
+
+def _client(status: int = 0) -> Any:
+    return SimpleNamespace(embeddings=FakeEmbeddings(status))
+
+
+def test_plan_batches_limits() -> None:
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d" * 400, "e"]
+    assert plan_batches(texts, 10, 25, lambda t: len(t) // 4) == [[0, 1], [2], [3], [4]]
+    assert plan_batches(texts, 2, 10**6, len) == [[0, 1], [2, 3], [4]]
+    assert plan_batches([], 2, 10, len) == []
+
+
+def test_results_in_input_order() -> None:
+    client = _client()
+    texts = ["x" * n for n in range(1, 11)]
+    out = asyncio.run(embed_texts(client, "m", texts, len, batch_size=3))
+    assert out == [[float(n)] for n in range(1, 11)]
+    assert len(client.embeddings.calls) == 4
+
+
+def test_bad_input_is_split_out() -> None:
+    client = _client()
+    texts = ["one", "two", "bad", "four", "five", "six", "seven", "eight"]
+    out = asyncio.run(embed_texts(client, "m", texts, len, batch_size=8, retries=1))
+    assert out[2] == []
+    assert [v for i, v in enumerate(out) if i != 2] == [[float(len(t))] for t in texts if t != "bad"]
+    assert batch_stats(texts, out) == {"inputs": 8, "embedded": 7, "failed": 1}
+    # 8 → 4 + 4 → 2 + 2 → 1 + 1: the healthy half is sent once
+    assert ["bad"] in client.embeddings.calls and ["one", "two", "bad", "four"] in client.embeddings.calls
+    assert ["five", "six", "seven", "eight"] in client.embeddings.calls
+
+
+@pytest.mark.parametrize("status", [401, 403, 404])
+def test_auth_and_config_errors_raised_without_splitting(status: int) -> None:
+    client = _client(status)
+    with pytest.raises(ApiError):
+        asyncio.run(embed_texts(client, "m", ["a", "b", "c", "d"], len, batch_size=4, retries=3))
+    assert client.embeddings.calls == [["a", "b", "c", "d"]]
+
+
+def test_transient_failure_fails_batch_without_splitting(monkeypatch) -> None:
+    monkeypatch.setattr(scheduler.asyncio, "sleep", lambda _s, sleep=asyncio.sleep: sleep(0))
+    client = _client(503)
+    out = asyncio.run(embed_texts(client, "m", ["a", "b", "c", "d"], len, batch_size=4, retries=2))
+    assert out == [[], [], [], []]
+    assert client.embeddings.calls == [["a", "b", "c", "d"]] * 2
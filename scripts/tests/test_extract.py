@@ -0,0 +1,83 @@
+from __future__ import annotations
+import io
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, List, Optional
+
+import pytest
+
+extract = pytest.importorskip("extract")  # needs python-dotenv installed
+
+
+def _convert(converter: Any, f: Path, out_root: Path, *rest: Any) -> Path:
+    if f.stem == "broken":
+        raise RuntimeError("not a PDF")
+    md_path = out_root / f.stem / f"{f.stem}.md"
+    md_path.parent.mkdir(parents=True, exist_ok=True)
+    md_path.write_text(f"# {f.stem}\n", encoding="utf-8")
+    return md_path
+
+
+# ─────────────────────────── serial conversion ───────────────────────────
+
+def test_serial_failure_skips_only_that_file(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(extract, "convert_sharded", _convert)
+    in_dir = tmp_path / "in"
+    in_dir.mkdir()
+    for name in ("a.pdf", "broken.pdf", "c.docx"):
+        (in_dir / name).write_bytes(b"x")
+    out = io.StringIO()
+    args = extract.parse_args(["--in", str(in_dir), "--out", str(tmp_path / "out")])
+    with pytest.raises(SystemExit, match="1 file\\(s\\) failed to convert: broken.pdf"):
+        extract.run(args, converter=object(), out=out)
+    assert [line.split(" -> ")[0] for line in out.getvalue().splitlines()] == ["[ok] a.pdf", "[ok] c.docx"]
+    assert (tmp_path / "out" / "c" / "c.md").read_text(encoding="utf-8").startswith("# c")
+
+
+# ─────────────────────────── page markers ───────────────────────────
+
+class _Doc:
+    """DoclingDocument stand-in: iterate_items() over items on the given pages (None = no provenance)."""
+
+    def __init__(self, pages: List[Optional[int]]) -> None:
+        self.items = [SimpleNamespace(prov=[SimpleNamespace(page_no=p)] if p else []) for p in pages]
+
+    def iterate_items(self) -> Any:
+        return ((item, 1) for item in self.items)
+
+
+def test_page_numbers_follow_provenance() -> None:
+    # page 1 has no text, 4 and 5 are blank; a group without provenance in between
+    assert extract.page_numbers(_Doc([2, 2, None, 3, 6, 6, 7])) == [2, 3, 6, 7]
+    assert extract.page_numbers(_Doc([None])) == []
+
+
+def test_number_pages_uses_given_pages() -> None:
+    br = extract.PAGE_BREAK
+    md = extract.number_pages(f"two\n{br}\nthree\n{br}\nsix\n", [2, 3, 6])
+    assert md == "<!-- page: 2 -->\ntwo\n\n<!-- page: 3 -->\nthree\n\n<!-- page: 6 -->\nsix\n"
+    # more parts than located pages: count on from the last one
+    assert extract.number_pages(f"a{br}b", [9]) == "<!-- page: 9 -->\na\n\n<!-- page: 10 -->\nb\n"
+
+
+def test_stitch_shards_renumbers_artifacts(tmp_path) -> None:
+    in_file = tmp_path / "report.pdf"
+    shard_mds = []
+    for rng, images in (((1, 2), ["image_000000_a.png", "image_000001_b.png"]), ((3, 4), ["image_000000_c.png"])):
+        d = extract.shard_dir(tmp_path, in_file, rng)
+        (d / "report_artifacts").mkdir(parents=True)
+        for name in images:
+            (d / "report_artifacts" / name).write_text(name)
+        md = d / "report.md"
+        md.write_text(f"<!-- page: {rng[0]} -->\n" + "".join(f"![Image](report_artifacts/{n})\n" for n in images))
+        shard_mds.append(md)
+
+    md_path = extract.stitch_shards(in_file, tmp_path, shard_mds)
+    text = md_path.read_text(encoding="utf-8")
+    assert md_path == tmp_path / "report" / "report.md"
+    assert text.index("<!-- page: 1 -->") < text.index("<!-- page: 3 -->")
+    assert "image_000002_c.png" in text and "image_000000_c.png" not in text
+    artifacts = sorted(p.name for p in (tmp_path / "report" / "report_artifacts").iterdir())
+    assert artifacts == ["image_000000_a.png", "image_000001_b.png", "image_000002_c.png"]
+    assert (tmp_path / "report" / "report_artifacts" / "image_000002_c.png").read_text() == "image_000000_c.png"
+    assert not (tmp_path / "report" / ".shards").exists()
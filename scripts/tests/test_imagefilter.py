@@ -0,0 +1,50 @@
+from __future__ import annotations
+from typing import Dict
+
+import pytest
+
+from imagefilter import ImageInfo, filter_report, group_near_duplicates, inspect_image, is_decorative, merge_reports
+
+
+def _info(pixel_hash: str, dhash: int, width: int = 100, height: int = 100, entropy: float = 5.0) -> ImageInfo:
+    return ImageInfo(pixel_hash, dhash, width, height, entropy)
+
+
+def test_decorative_by_size_or_entropy() -> None:
+    assert is_decorative(_info("a", 0, width=12), 16, 1.0)
+    assert is_decorative(_info("a", 0, entropy=0.2), 16, 1.0)
+    assert not is_decorative(_info("a", 0), 16, 1.0)
+
+
+def test_near_duplicates_grouped_under_first() -> None:
+    items = [("logo", _info("a", 0b1111)),
+             ("logo-again", _info("b", 0b1110, width=105)),   # 1 bit off, same size ±10%
+             ("logo-big", _info("c", 0b1111, width=300)),     # same hash, other size
+             ("copy", _info("c", 0)),                         # identical pixels to logo-big
+             ("chart", _info("d", 0xFFFF_0000))]
+    assert group_near_duplicates(items, 2) == {
+        "logo": "logo", "logo-again": "logo", "logo-big": "logo-big", "copy": "logo-big", "chart": "chart"}
+    assert group_near_duplicates(items, -1) == {k: k for k, _ in items}
+
+
+def test_reports_add_up() -> None:
+    total: Dict[str, int] = {}
+    merge_reports(total, filter_report(10, 3, 2, 1, 4))
+    merge_reports(total, filter_report(2, 0, 0, 0, 2))
+    merge_reports(total, None)
+    assert total == {"images": 12, "decorative": 3, "duplicates": 2, "cached": 1, "api_calls": 6, "calls_saved": 6}
+
+
+def test_inspect_image(tmp_path) -> None:
+    Image = pytest.importorskip("PIL.Image")
+    flat = Image.new("RGB", (40, 20), (200, 200, 200))
+    flat.save(tmp_path / "flat.png")
+    ramp = Image.linear_gradient("L").convert("RGB")
+    ramp.save(tmp_path / "ramp.png")
+
+    a = inspect_image(tmp_path / "flat.png")
+    assert (a.width, a.height, a.entropy, a.dhash) == (40, 20, 0.0, 0)
+    b = inspect_image(tmp_path / "ramp.png")
+    assert b.entropy > 7.5 and b.pixel_hash != a.pixel_hash
+    flat.save(tmp_path / "flat-copy.png")
+    assert inspect_image(tmp_path / "flat-copy.png").pixel_hash == a.pixel_hash
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from manifest import Manifest, diff_chunks
+
+
+def test_identical() -> None:
+    d = diff_chunks(["a", "b"], ["a", "b"])
+    assert d == {"added": [], "changed": [], "removed": [], "unchanged": [1, 2], "moved": []}
+
+
+def test_append_change_and_shrink() -> None:
+    assert diff_chunks(["a", "b"], ["a", "x", "c"]) == {
+        "added": [3], "changed": [2], "removed": [], "unchanged": [1], "moved": []}
+    assert diff_chunks(["a", "b", "c"], ["a"]) == {
+        "added": [], "changed": [], "removed": [2, 3], "unchanged": [1], "moved": []}
+    assert diff_chunks([], ["a"])["added"] == [1]
+    assert diff_chunks(["a"], [])["removed"] == [1]
+
+
+def test_insert_at_front_moves() -> None:
+    d = diff_chunks(["a", "b"], ["x", "a", "b"])
+    assert d["moved"] == [[1, 2], [2, 3]]
+    assert d["changed"] == [1] and d["added"] == [] and d["unchanged"] == []
+    # old 1 and 2 are both re-keyed away; nothing is left to delete
+    assert d["removed"] == []
+
+
+def test_delete_at_front_moves() -> None:
+    d = diff_chunks(["x", "a", "b"], ["a", "b"])
+    assert d["moved"] == [[2, 1], [3, 2]]
+    # old 1 is a move target: its chunk must be deleted before the re-key
+    assert d["removed"] == [1]
+
+
+def test_swap_and_duplicate_hashes() -> None:
+    assert diff_chunks(["a", "b"], ["b", "a"])["moved"] == [[2, 1], [1, 2]]
+    d = diff_chunks(["a", "a", "b"], ["b", "a", "a"])
+    assert d["unchanged"] == [2]
+    assert d["moved"] == [[3, 1], [1, 3]]
+    assert d["removed"] == []
+
+
+def test_unknown_old_hashes_never_move() -> None:
+    # entries written before chunk hashes were recorded
+    d = diff_chunks([None, None], ["a", "b"])
+    assert d["changed"] == [1, 2] and d["moved"] == [] and d["removed"] == []
+
+
+def test_every_new_index_classified_once() -> None:
+    old, new = list("abcdefab"), list("bxafgaab")
+    d = diff_chunks(old, new)
+    targets = [n for _, n in d["moved"]]
+    assert sorted(d["added"] + d["changed"] + d["unchanged"] + targets) == list(range(1, len(new) + 1))
+    for o, n in d["moved"]:
+        assert old[o - 1] == new[n - 1]
+    assert len({o for o, _ in d["moved"]}) == len(d["moved"])
+
+
+def test_manifest_save_and_reload(tmp_path) -> None:
+    m = Manifest(tmp_path / "m.json")
+    m.set("a.pdf", {"sha256": "1"})
+    m.set("b.pdf", {"sha256": "2"})
+    m.remove("b.pdf")
+    m.save()
+    again = Manifest(tmp_path / "m.json")
+    assert again.get("a.pdf") == {"sha256": "1"} and again.get("b.pdf") is None
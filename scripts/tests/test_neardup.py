@@ -0,0 +1,62 @@
+from __future__ import annotations
+import random
+from typing import List
+
+import pytest
+
+from neardup import NearDupIndex, choose_bands, shingles, signature, similarity
+
+WORDS = [f"w{i}" for i in range(500)]
+
+
+def _text(seed: int, n: int = 200) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _edit(text: str, every: int) -> str:
+    words: List[str] = text.split()
+    return " ".join("edited" if i % every == 0 else w for i, w in enumerate(words))
+
+
+def test_shingles_and_empty_text() -> None:
+    assert shingles("One two three") == {"one two three"}
+    assert len(shingles(" ".join(WORDS[:7]))) == 3
+    assert signature("  ... ") is None
+
+
+def test_signature_estimates_jaccard() -> None:
+    a = _text(1)
+    assert signature(a) == signature(a) and similarity(signature(a), signature(a)) == 1.0
+    assert similarity(signature(a), signature(_edit(a, 50))) > 0.7
+    assert similarity(signature(a), signature(_text(2))) < 0.1
+    # short texts fill every bucket by densification
+    assert len(signature("a short line of text here")) == 128
+
+
+def test_choose_bands_midpoint_below_threshold() -> None:
+    for threshold in (0.5, 0.8, 0.95):
+        bands, rows = choose_bands(threshold)
+        assert bands * rows == 128 and (1 / bands) ** (1 / rows) <= threshold - 0.05
+
+
+def test_index_returns_first_copy_per_scope() -> None:
+    index = NearDupIndex(threshold=0.7)
+    a = _text(1)
+    assert index.check("a", a) is None
+    assert index.check("a-edited", _edit(a, 50)) == "a"
+    assert index.check("b", _text(2)) is None
+    assert index.check("a-other-company", a, scope="ACME") is None
+    assert index.check("a-again", a, scope="ACME") == "a-other-company"
+    assert index.check("blank", "") is None
+    stats = index.stats()
+    assert (stats["checked"], stats["duplicates"], stats["representatives"]) == (6, 2, 3)
+
+
+def test_add_marks_representative_without_counting() -> None:
+    index = NearDupIndex()
+    index.add("earlier-run", _text(3))
+    assert index.check("now", _text(3)) == "earlier-run"
+    assert index.stats()["checked"] == 1
+    with pytest.raises(ValueError):
+        NearDupIndex(threshold=0)
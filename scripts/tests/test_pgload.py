@@ -0,0 +1,111 @@
+from __future__ import annotations
+import struct
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Tuple
+
+import pgload
+from pgload import ENCODERS, chunk_metadata, encode_bit, encode_halfvec, encode_vector, load_document, peek_column
+
+
+class FakeCursor:
+    def __init__(self, log: List[Tuple[str, Any]]) -> None:
+        self.log = log
+
+    def __enter__(self) -> FakeCursor:
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+    def execute(self, sql: str, params: Any = None) -> None:
+        self.log.append((sql, params))
+
+    @contextmanager
+    def copy(self, sql: str) -> Iterator[Any]:
+        rows: List[Any] = []
+        yield type("Copy", (), {"set_types": lambda _self, types: None,
+                                "write_row": lambda _self, row: rows.append(row)})()
+        self.log.append(("COPY", rows))
+
+
+class FakeConn:
+    """Records statements in order; enough of psycopg's API for load_document."""
+
+    def __init__(self) -> None:
+        self.log: List[Tuple[str, Any]] = []
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        yield
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self.log)
+
+
+def _rec(i: int, embedding: List[float]) -> dict:
+    return {"file": "/out/report/report.md", "index": i, "heading_path": ["A", "B"], "page": 2,
+            "token_count": 5, "text": f"chunk {i}", "embedding": embedding}
+
+
+def test_encode_vector() -> None:
+    data = encode_vector([1.0, -2.5, 0.0])
+    assert struct.unpack(">HH", data[:4]) == (3, 0)
+    assert struct.unpack(">3f", data[4:]) == (1.0, -2.5, 0.0)
+
+
+def test_encode_halfvec() -> None:
+    data = encode_halfvec([1.0, -2.5])
+    assert len(data) == 4 + 2 * 2
+    assert struct.unpack(">HH2e", data) == (2, 0, 1.0, -2.5)
+
+
+def test_encode_bit() -> None:
+    data = encode_bit([1.0, -1.0, 0.0, 0.5, -0.1, 2.0, 3.0, -3.0, 1.0, -1.0])
+    assert struct.unpack(">i", data[:4]) == (10,)
+    assert data[4:] == bytes([0b10010110, 0b10000000])  # x > 0, MSB first, padded
+
+
+def test_encoders_cover_vector_types() -> None:
+    assert set(ENCODERS) == {"vector", "halfvec", "bit"}
+
+
+def test_peek_column() -> None:
+    recs = [{"type": "delta"}, {"embedding": [], "dims": 0},
+            {"embedding": [0.1] * 8, "quant": "float16"}, {"embedding": [0.2] * 8}]
+    column, it = peek_column(recs)
+    assert column == "halfvec(8)"
+    assert list(it) == recs
+    assert peek_column([{"embedding": [1.0] * 16, "quant": "binary"}])[0] == "bit(16)"
+    assert peek_column([{"embedding": [1.0] * 4, "quant": "int8"}])[0] == "vector(4)"
+    assert peek_column([])[0] == "vector(1536)"
+
+
+def test_chunk_metadata() -> None:
+    meta = chunk_metadata(_rec(3, [0.1, 0.2]), "report", "ACME")
+    assert meta["file_name"] == "report.md" and meta["chunk_index"] == 3
+    assert (meta["heading"], meta["heading_path"], meta["level"]) == ("B", "A > B", 2)
+    assert meta["embedding_dims"] == 2
+
+
+def test_full_load_deletes_rows_not_written() -> None:
+    conn = FakeConn()
+    # chunk 2's embedding failed, so chunker left it out of the loadable records
+    assert load_document(conn, "report", "ACME", [_rec(1, [0.1]), _rec(3, [0.3])]) == 2
+    copied = next(rows for sql, rows in conn.log if sql == "COPY")
+    assert [row[0] for row in copied] == [1, 3]
+    sql, params = conn.log[-1]
+    assert sql == pgload.DELETE_STALE_SQL and params == ("report", [1, 3])
+
+
+def test_full_load_without_vectors_clears_document() -> None:
+    conn = FakeConn()
+    assert load_document(conn, "report", "ACME", []) == 0
+    assert conn.log == [(pgload.DELETE_STALE_SQL, ("report", []))]
+
+
+def test_delta_load_deletes_and_moves_only() -> None:
+    conn = FakeConn()
+    delta = {"removed": [4], "moved": [[2, 3]], "added": [], "changed": [], "unchanged": [1]}
+    assert load_document(conn, "report", "ACME", [], delta) == 0
+    assert [sql for sql, _ in conn.log] == [pgload.DELETE_CHUNKS_SQL, pgload.MOVE_CHUNKS_SQL, pgload.MOVE_CHUNKS_SQL]
+    assert [params for _, params in conn.log[1:]] == [([2], [-3], "report"), ([-3], [3], "report")]
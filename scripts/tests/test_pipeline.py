@@ -0,0 +1,46 @@
+from __future__ import annotations
+import asyncio
+from pathlib import Path
+from typing import Any, List, Tuple
+
+import pytest
+
+pipeline = pytest.importorskip("pipeline")  # needs openai / python-dotenv installed
+
+
+def test_stage_args_forward_options() -> None:
+    args = pipeline.parse_args(["--in", "data", "--out", "out", "--describe-images", "--incremental",
+                                "--embed-concurrency", "8", "--priority", "backfill"])
+    ex, ch = pipeline.stage_args(args)
+    assert (ex.in_dir, ex.out_dir, ex.describe_images, ex.incremental, ex.priority) == ("data", "out", True, True, "backfill")
+    assert (ch.root, ch.concurrency, ch.incremental, ch.priority) == ("out", 8, True, "backfill")
+    assert ch.output_format == args.output_format and ch.dimensions == args.dimensions
+
+
+def test_stage_drops_only_failed_documents() -> None:
+    async def scenario() -> Tuple[List[Any], List[str], int]:
+        inbox: asyncio.Queue = asyncio.Queue()
+        outbox: asyncio.Queue = asyncio.Queue()
+        running = peak = 0
+
+        async def fn(item: Tuple[Path, int]) -> int:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            if item[1] == 2:
+                raise ValueError("bad table")
+            return item[1] * 10
+
+        for i in range(5):
+            inbox.put_nowait((Path(f"doc{i}.pdf"), i))
+        for _ in range(2):
+            inbox.put_nowait(pipeline._DONE)
+        failed: List[str] = []
+        await pipeline._stage("tables", 2, inbox, outbox, fn, failed)
+        return [outbox.get_nowait() for _ in range(outbox.qsize())], failed, peak
+
+    results, failed, peak = asyncio.run(scenario())
+    assert sorted(results) == [0, 10, 30, 40]
+    assert failed == ["doc2.pdf"] and peak == 2
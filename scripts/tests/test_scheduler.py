@@ -0,0 +1,197 @@
+from __future__ import annotations
+import asyncio
+from typing import Any, Dict, List
+
+import pytest
+
+import scheduler
+from scheduler import BACKFILL, INTERACTIVE, RetryableError, Scheduler, TokenBucket
+
+
+class Throttled(Exception):
+    status_code = 429
+
+    def __init__(self, headers: Dict[str, str]) -> None:
+        super().__init__("429")
+        self.response = type("Response", (), {"headers": headers})()
+
+
+def test_additive_increase_up_to_max() -> None:
+    s = Scheduler("t", max_concurrency=4)
+    s.limit = 1.0
+    for _ in range(3):
+        s._on_success(None, 0)
+    assert s.limit == pytest.approx(2.9)  # +1/1, +1/2, +1/2.5
+    for _ in range(50):
+        s._on_success(None, 0)
+    assert s.limit == 4.0
+
+
+def test_throttle_halves_once_per_second() -> None:
+    s = Scheduler("t", max_concurrency=16)
+    s._on_throttle({"retry-after-ms": "0"}, 0, 1.0)
+    assert s.limit == 8.0
+    s._on_throttle(None, 0, 1.0)  # same burst of 429s
+    assert s.limit == 8.0
+    s._last_decrease -= 1.0
+    s._on_throttle(None, 0, 1.0)
+    assert s.limit == 4.0
+    assert s.counters["throttled"] == 3
+
+
+def test_throttle_floor_and_pause() -> None:
+    s = Scheduler("t", max_concurrency=2, min_concurrency=1)
+    for _ in range(5):
+        s._last_decrease = 0.0
+        assert s._on_throttle({"retry-after": "2"}, 0, 0.1) == 2.0
+    assert s.limit == 1.0
+    assert s.stats()["paused_s"] > 1.0
+
+
+def test_low_quota_holds_increase() -> None:
+    s = Scheduler("t", max_concurrency=8)
+    s.limit = 2.0
+    s._on_success({"x-ratelimit-remaining-tokens": "10"}, 100)
+    assert s.limit == 2.0
+    s._on_success({"x-ratelimit-remaining-tokens": "10000"}, 100)
+    assert s.limit == 2.5
+
+
+def test_configure_lowers_limit_only() -> None:
+    s = Scheduler("t", max_concurrency=8)
+    s.configure(3, 0, 0)
+    assert (s.limit, s.max_concurrency) == (3.0, 3)
+    s.configure(10, 0, 0)
+    assert (s.limit, s.max_concurrency) == (3.0, 10)  # grows back through successes
+
+
+def test_token_bucket() -> None:
+    b = TokenBucket(600)  # 10/s, capacity 100
+    assert b.wait(50, b.stamp) == 0.0
+    b.take(100)
+    assert b.wait(20, b.stamp) == pytest.approx(2.0)
+    assert b.wait(500, b.stamp) == pytest.approx(10.0)  # capped at capacity
+    assert TokenBucket(0).wait(10**6, 0.0) == 0.0
+
+
+def test_call_limits_in_flight() -> None:
+    s = Scheduler("t", max_concurrency=3)
+    peak = running = 0
+
+    async def job() -> int:
+        nonlocal peak, running
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return 1
+
+    async def main() -> List[int]:
+        return await asyncio.gather(*(s.call(job) for _ in range(12)))
+
+    assert asyncio.run(main()) == [1] * 12
+    assert peak == 3
+    assert s.counters["succeeded"] == 12 and s.stats()["in_flight"] == 0
+
+
+def test_call_retries_429_then_succeeds() -> None:
+    s = Scheduler("t", max_concurrency=4)
+    attempts: List[int] = []
+
+    async def job() -> str:
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Throttled({"retry-after-ms": "1"})
+        return "ok"
+
+    assert asyncio.run(s.call(job, retries=3)) == "ok"
+    assert len(attempts) == 3
+    assert s.counters["retries"] == 2 and s.counters["throttled"] == 2
+    assert s.limit == 2.0 + 1.0 / 2.0  # halved once, then one success
+
+
+def test_call_does_not_retry_client_errors() -> None:
+    s = Scheduler("t")
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    async def job() -> Any:
+        raise BadRequest()
+
+    with pytest.raises(BadRequest):
+        asyncio.run(s.call(job, retries=5))
+    assert s.counters["requests"] == 1 and s.counters["failed"] == 1
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    sleep = asyncio.sleep
+    monkeypatch.setattr(scheduler.asyncio, "sleep", lambda _s: sleep(0))
+
+
+def _attempts(s: Scheduler, error: BaseException, retries: int = 3) -> int:
+    calls: List[int] = []
+
+    async def job() -> str:
+        calls.append(1)
+        if len(calls) == 1:
+            raise error
+        return "ok"
+
+    try:
+        asyncio.run(s.call(job, retries=retries))
+    except type(error):
+        pass
+    return len(calls)
+
+
+def test_transient_errors_retried(no_backoff) -> None:
+    s = Scheduler("t")
+    assert _attempts(s, RetryableError("empty")) == 2
+    assert _attempts(s, ConnectionResetError()) == 2
+    assert _attempts(s, TimeoutError()) == 2
+    openai = pytest.importorskip("openai")
+    assert _attempts(s, openai.APITimeoutError.__new__(openai.APITimeoutError)) == 2
+    assert s.counters["retries"] == 4 and s.counters["throttled"] == 0
+
+
+def test_other_errors_raised_at_once(no_backoff) -> None:
+    s = Scheduler("t")
+    assert _attempts(s, KeyError("choices")) == 1
+    assert _attempts(s, ValueError("bad parse")) == 1
+
+    async def job() -> Any:
+        return "raw"
+
+    def parse(raw: Any) -> str:
+        raise TypeError("bug in parse")
+
+    with pytest.raises(TypeError):
+        asyncio.run(s.call(job, parse=parse, retries=5))
+    assert s.counters["requests"] == 3 and s.counters["retries"] == 0 and s.counters["failed"] == 3
+    assert s.limit == s.max_concurrency  # nothing fed the throttle logic
+
+
+def test_interactive_served_before_backfill() -> None:
+    s = Scheduler("t", max_concurrency=1)
+    order: List[str] = []
+
+    async def job(tag: str, gate: Any = None) -> None:
+        order.append(tag)
+        if gate is not None:
+            await gate.wait()
+
+    async def main() -> None:
+        gate = asyncio.Event()
+        first = asyncio.create_task(s.call(lambda: job("first", gate)))  # holds the only slot
+        await asyncio.sleep(0.01)
+        waiting = [asyncio.create_task(s.call(lambda: job("backfill"), priority=BACKFILL)),
+                   asyncio.create_task(s.call(lambda: job("interactive"), priority=INTERACTIVE))]
+        await asyncio.sleep(0.01)
+        assert s.stats()["queued"] == {"interactive": 1, "backfill": 1}
+        gate.set()
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(main())
+    assert order == ["first", "interactive", "backfill"]
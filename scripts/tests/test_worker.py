@@ -0,0 +1,116 @@
+from __future__ import annotations
+import argparse
+import http.client
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pytest
+
+worker = pytest.importorskip("worker")  # needs the Python dependencies of scripts/
+from metrics import begin_run, count, current, span  # noqa: E402
+
+
+@pytest.fixture
+def serve() -> Iterator[Any]:
+    """Start a Worker with the given fake jobs; yields a request(method, path, body) helper."""
+    servers: List[ThreadingHTTPServer] = []
+
+    def _start(w: Any) -> Any:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), worker.make_handler(w))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+
+        def request(method: str, path: str, body: Any = None) -> Tuple[int, str]:
+            conn = http.client.HTTPConnection("127.0.0.1", server.server_port, timeout=10)
+            conn.request(method, path, body=json.dumps(body) if body is not None else None)
+            resp = conn.getresponse()
+            text = resp.read().decode("utf-8")
+            conn.close()
+            return resp.status, text
+        return request
+
+    yield _start
+    for server in servers:
+        server.shutdown()
+
+
+def test_streams_job_output_and_trailer(serve) -> None:
+    w = worker.Worker(workers=1, max_queue=0)
+    w.extract_job = lambda argv, out: out.write(f"[ok] {' '.join(argv)}\n")
+
+    def _fail(argv: List[str], out: Any) -> None:
+        out.write("partial\n")
+        raise ValueError("broken")
+    w.chunk_job = _fail
+    w.pipeline_job = lambda argv, out: (_ for _ in ()).throw(SystemExit("2 file(s) failed"))
+    request = serve(w)
+
+    assert request("POST", "/extract", {"args": ["--in", "x"]}) == (200, "[ok] --in x\n\n[worker] done\n")
+    status, body = request("POST", "/chunk", {"args": []})
+    assert status == 200 and body.endswith("partial\n\n[worker] error: ValueError: broken\n")
+    assert request("POST", "/pipeline", {})[1].endswith("[worker] error: 2 file(s) failed\n")
+    assert request("POST", "/nope", {})[0] == 404
+    assert request("GET", "/nope")[0] == 404
+
+    status, body = request("GET", "/health")
+    health = json.loads(body)
+    assert status == 200 and health["completed"] == 1 and health["failed"] == 2
+    assert health["running"] == 0 and health["queued"] == 0
+
+
+def test_bad_request(serve) -> None:
+    request = serve(worker.Worker(workers=1, max_queue=0))
+    assert request("POST", "/extract", "not an object")[0] == 400
+
+
+def test_rejects_when_queue_full(serve) -> None:
+    w = worker.Worker(workers=1, max_queue=0)
+    release = threading.Event()
+    w.extract_job = lambda argv, out: release.wait(5)
+    request = serve(w)
+
+    first = threading.Thread(target=request, args=("POST", "/extract", {}))
+    first.start()
+    for _ in range(100):
+        if json.loads(request("GET", "/health")[1])["running"]:
+            break
+        time.sleep(0.02)
+    assert request("POST", "/extract", {})[0] == 503
+    release.set()
+    first.join()
+    health = json.loads(request("GET", "/health")[1])
+    assert (health["accepted"], health["rejected"], health["completed"]) == (1, 1, 1)
+
+
+def test_jobs_keep_their_own_metrics() -> None:
+    w = worker.Worker(workers=2, max_queue=0)
+    both = threading.Barrier(2)
+    summaries: Dict[str, Dict[str, Any]] = {}
+
+    async def _stage(name: str) -> None:
+        with span(name):
+            count(name)
+
+    def job(name: str, level: str) -> None:
+        begin_run(level)
+        both.wait(5)  # the second job starts after the first has begun its run
+        w.run_async(_stage(name))
+        both.wait(5)
+        summaries[name] = current().summary()
+
+    threads = [threading.Thread(target=w.run_reserved, args=(lambda n=n, lv=lv: job(n, lv),))
+               for n, lv in (("embed", "info"), ("caption", "debug")) if w.reserve()]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert summaries["embed"]["counters"] == {"embed": 1} and list(summaries["embed"]["spans"]) == ["embed"]
+    assert summaries["caption"]["counters"] == {"caption": 1}
+
+
+def test_job_workers_clamped_to_warm_converter() -> None:
+    args = worker._in_process(argparse.Namespace(workers=4))
+    assert args.workers == 1
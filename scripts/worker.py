@@ -0,0 +1,254 @@
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Coroutine, Dict, List
+
+import chunker
+import extract
+import pipeline
+from scheduler import all_stats
+
+# ─────────────────────────── Resident extraction/chunking worker ───────────────────────────
+# Keeps one warm docling converter and the Azure clients alive between jobs, so
+# C3Embedder does not pay interpreter + model start-up for every item.
+#
+#   GET  /health   → JSON status (workers, queue, counters, Azure schedulers)
+#   POST /extract  {"args": [...extract.py CLI args...]}  → streams extract.py stdout
+#   POST /chunk    {"args": [...chunker.py CLI args...]}  → streams chunker.py stdout
+#   POST /pipeline {"args": [...pipeline.py CLI args...]} → streams pipeline.py stdout
+#
+# Streamed bodies are exactly what the scripts print, followed by one trailer
+# line: "[worker] done" or "[worker] error: <message>".
+#
+# Jobs convert on the warm converter: a job's --workers N is reset to 1 rather
+# than spawning a pool of cold converters per request (run more jobs at once
+# with the worker's own --workers). Each job has its own metrics and log level.
+
+
+def parse_args() -> argparse.Namespace:
+    p = argparse.ArgumentParser(
+        description="Resident HTTP worker for extract.py / chunker.py / pipeline.py jobs.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--workers", type=int, default=2,
+                   help="Max jobs running at once.")
+    p.add_argument("--max-queue", type=int, default=16,
+                   help="Max jobs waiting for a worker; more are rejected with 503.")
+    return p.parse_args()
+
+
+class _SerialConverter:
+    """Shares one warm DocumentConverter between jobs; conversions run one at a time."""
+
+    def __init__(self, converter: Any) -> None:
+        self._converter = converter
+        self._lock = threading.Lock()
+
+    def convert(self, *a: Any, **kw: Any) -> Any:
+        with self._lock:
+            return self._converter.convert(*a, **kw)
+
+
+class _ChunkedWriter:
+    """Text sink that forwards each write as one HTTP/1.1 chunk."""
+
+    def __init__(self, wfile: Any) -> None:
+        self._wfile = wfile
+        self._lock = threading.Lock()
+
+    def write(self, s: str) -> int:
+        data = s.encode("utf-8")
+        if data:
+            with self._lock:
+                self._wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        return len(s)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._wfile.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._wfile.write(b"0\r\n\r\n")
+            self._wfile.flush()
+
+
+class Worker:
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = max(1, workers)
+        self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(self.workers + max(0, max_queue))
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters: Dict[str, int] = {
+            "accepted": 0, "rejected": 0, "running": 0, "completed": 0, "failed": 0}
+
+        # One long-lived event loop so the async Azure clients keep their connection pools
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever,
+                         name="worker-loop", daemon=True).start()
+
+        # docling converters are built per profile/format on first use, then kept warm
+        self.converter = _SerialConverter(extract.build_converter())
+
+    def run_async(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def _bump(self, **delta: int) -> None:
+        with self._lock:
+            for k, v in delta.items():
+                self.counters[k] += v
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            c = dict(self.counters)
+        queued = c["accepted"] - c["completed"] - c["failed"] - c["running"]
+        return {
+            "status": "ok",
+            "workers": self.workers,
+            "running": c["running"],
+            "queued": queued,
+            "uptime_s": round(time.time() - self.started, 1),
+            **{k: c[k] for k in ("accepted", "rejected", "completed", "failed")},
+            # per deployment: AIMD concurrency, in-flight, queue depth by priority, throttles
+            "schedulers": all_stats(),
+        }
+
+    def reserve(self) -> bool:
+        """Claim a running-or-queued slot; False (→ 503) if the queue is full."""
+        if not self._slots.acquire(blocking=False):
+            self._bump(rejected=1)
+            return False
+        self._bump(accepted=1)
+        return True
+
+    def run_reserved(self, job: Callable[[], None]) -> None:
+        """Run job on the pool and wait for it; releases the slot from reserve()."""
+
+        def _wrapped() -> None:
+            self._bump(running=1)
+            try:
+                job()
+                self._bump(completed=1)
+            except BaseException:
+                self._bump(failed=1)
+                raise
+            finally:
+                self._bump(running=-1)
+
+        try:
+            self.pool.submit(_wrapped).result()
+        finally:
+            self._slots.release()
+
+    # ---- jobs ----
+
+    def extract_job(self, argv: List[str], out: _ChunkedWriter) -> None:
+        extract.run(_in_process(extract.parse_args(argv)), self.converter, out, self.run_async)
+
+    def chunk_job(self, argv: List[str], out: _ChunkedWriter) -> None:
+        chunker.run(chunker.parse_args(argv), out, self.run_async)
+
+    def pipeline_job(self, argv: List[str], out: _ChunkedWriter) -> None:
+        pipeline.run(_in_process(pipeline.parse_args(argv)), self.converter, out, self.run_async)
+
+
+def _in_process(args: argparse.Namespace) -> argparse.Namespace:
+    if args.workers > 1:
+        sys.stderr.write(f"[worker] --workers {args.workers} ignored: jobs use the warm in-process converter\n")
+        args.workers = 1
+    return args
+
+
+def make_handler(worker: Worker) -> type:
+    jobs = {"/extract": worker.extract_job, "/chunk": worker.chunk_job, "/pipeline": worker.pipeline_job}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _json(self, status: int, payload: Dict[str, Any]) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self._json(200, worker.health())
+            else:
+                self._json(404, {"error": "not found"})
+
+        def do_POST(self) -> None:
+            job = jobs.get(self.path)
+            if job is None:
+                self._json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                argv = [str(a) for a in payload.get("args", [])]
+            except (ValueError, AttributeError) as e:
+                self._json(400, {"error": f"bad request: {e}"})
+                return
+            if not worker.reserve():
+                self._json(503, {"error": "queue full"})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            out = _ChunkedWriter(self.wfile)
+
+            def _run() -> None:
+                try:
+                    job(argv, out)
+                    out.write("\n[worker] done\n")
+                except SystemExit as e:
+                    # argparse / sys.exit() inside the scripts
+                    out.write(f"\n[worker] error: {e.code}\n")
+                    raise
+                except Exception as e:
+                    sys.stderr.write(traceback.format_exc())
+                    out.write(f"\n[worker] error: {type(e).__name__}: {e}\n")
+                    raise
+
+            try:
+                worker.run_reserved(_run)
+            except BaseException:
+                pass  # already reported in the stream
+            out.close()
+
+        def log_message(self, format: str, *args: Any) -> None:
+            sys.stderr.write(f"[worker] {self.address_string()} {format % args}\n")
+
+    return Handler
+
+
+def main() -> None:
+    args = parse_args()
+    worker = Worker(args.workers, args.max_queue)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(worker))
+    server.daemon_threads = True
+    sys.stderr.write(f"[worker] listening on http://{args.host}:{args.port}\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        worker.pool.shutdown(wait=False)
+        worker.loop.call_soon_threadsafe(worker.loop.stop)
+
+
+if __name__ == "__main__":
+    main()